@@ -1,14 +1,11 @@
-from datetime import datetime
+from calculo_ponto import calcular_ponto, minutos_para_hm
 
-# Horários do registro
-entrada = datetime.strptime('2025-09-22 08:00', '%Y-%m-%d %H:%M')
-saida_almoco = datetime.strptime('2025-09-22 12:00', '%Y-%m-%d %H:%M')
-volta_almoco = datetime.strptime('2025-09-22 13:00', '%Y-%m-%d %H:%M')
-saida = datetime.strptime('2025-09-22 18:25', '%Y-%m-%d %H:%M')
+# Horários do registro (mesmo cálculo do portal, em minutos inteiros)
+ponto = calcular_ponto('08:00', '12:00', '13:00', '18:25')
 
 # Cálculo correto
-periodo_manha = saida_almoco - entrada
-periodo_tarde = saida - volta_almoco
+periodo_manha = ponto['saida_almoco_min'] - ponto['entrada_min']
+periodo_tarde = ponto['saida_min'] - ponto['volta_almoco_min']
 
 print('ANÁLISE DO REGISTRO:')
 print('=' * 30)
@@ -18,11 +15,11 @@ print(f'Volta almoço: 13:00')
 print(f'Saída: 18:25')
 print()
 print('CÁLCULOS:')
-print(f'Período manhã: {periodo_manha} = {periodo_manha.total_seconds()/3600:.2f}h')
-print(f'Período tarde: {periodo_tarde} = {periodo_tarde.total_seconds()/3600:.2f}h')
+print(f'Período manhã: {minutos_para_hm(periodo_manha)} = {periodo_manha/60:.2f}h')
+print(f'Período tarde: {minutos_para_hm(periodo_tarde)} = {periodo_tarde/60:.2f}h')
 
-horas_trabalhadas = periodo_manha.total_seconds()/3600 + periodo_tarde.total_seconds()/3600
-horas_extras = max(0, horas_trabalhadas - 8)
+horas_trabalhadas = ponto['minutos_trabalhados'] / 60
+horas_extras = ponto['minutos_extras'] / 60
 
 print(f'Total trabalhado: {horas_trabalhadas:.2f}h')
 print(f'Jornada normal: 8.00h')
@@ -30,9 +27,7 @@ print(f'Horas extras: {horas_extras:.2f}h')
 print()
 
 # Converter para horas e minutos
-horas = int(horas_extras)
-minutos = int((horas_extras - horas) * 60)
-print(f'Horas extras: {horas}h {minutos}min')
+print(f'Horas extras: {minutos_para_hm(ponto["minutos_extras"])}')
 
 # Verificar o que está no arquivo
 import json
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Banco de horas: saldo acumulado de horas extras por funcionário
+
+A tabela banco_horas guarda, para cada dia com registro de ponto, os
+minutos extras do dia e o saldo acumulado (soma de prefixo) até ele. Os
+triggers de registros_ponto mantêm a tabela: um lançamento no fim do
+histórico (o caso comum) grava só a linha do dia; editar ou excluir um dia
+antigo desloca o saldo dos dias seguintes daquele funcionário. Assim o
+saldo em uma data é uma busca na chave primária (funcionario_id, data) e o
+saldo entre duas datas são duas buscas, não importa o tamanho do
+histórico. A estrutura é criada pela migração 12 (migracoes.py); este
+script verifica ou reconstrói a tabela a partir dos registros brutos.
+
+Uso:
+    python banco_horas.py              # verifica e mostra o saldo de cada funcionário
+    python banco_horas.py --reconstruir
+"""
+
+import sqlite3
+import sys
+from datetime import date
+
+from calculo_ponto import minutos_para_hm
+from migracoes import aplicar_migracoes
+
+DB_FILE = 'horas_trabalho.db'
+
+def _sql_somar(linha):
+    """Inclui o dia NEW/OLD com o saldo do dia anterior e soma os extras aos dias seguintes"""
+    return f"""
+        INSERT INTO banco_horas (funcionario_id, data, minutos_extras, saldo_minutos)
+        VALUES ({linha}.funcionario_id, {linha}.data, {linha}.minutos_extras,
+                {linha}.minutos_extras + COALESCE((
+                    SELECT saldo_minutos FROM banco_horas
+                    WHERE funcionario_id = {linha}.funcionario_id AND data < {linha}.data
+                    ORDER BY data DESC LIMIT 1), 0));
+        UPDATE banco_horas SET saldo_minutos = saldo_minutos + {linha}.minutos_extras
+        WHERE funcionario_id = {linha}.funcionario_id AND data > {linha}.data
+          AND {linha}.minutos_extras <> 0;
+    """
+
+def _sql_subtrair(linha):
+    """Remove o dia OLD e desconta os extras dele dos dias seguintes"""
+    return f"""
+        DELETE FROM banco_horas WHERE funcionario_id = {linha}.funcionario_id AND data = {linha}.data;
+        UPDATE banco_horas SET saldo_minutos = saldo_minutos - {linha}.minutos_extras
+        WHERE funcionario_id = {linha}.funcionario_id AND data > {linha}.data
+          AND {linha}.minutos_extras <> 0;
+    """
+
+ESTRUTURA = [
+    """
+    CREATE TABLE IF NOT EXISTS banco_horas (
+        funcionario_id INTEGER NOT NULL,
+        data DATE NOT NULL,
+        minutos_extras INTEGER NOT NULL DEFAULT 0,
+        saldo_minutos INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (funcionario_id, data),
+        FOREIGN KEY (funcionario_id) REFERENCES funcionarios (id)
+    ) WITHOUT ROWID
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS banco_horas_insert
+    AFTER INSERT ON registros_ponto
+    BEGIN
+        {_sql_somar('NEW')}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS banco_horas_delete
+    AFTER DELETE ON registros_ponto
+    BEGIN
+        {_sql_subtrair('OLD')}
+    END
+    """,
+    # Mesmo dia: um único deslocamento pela diferença (recálculos e edições de horário)
+    """
+    CREATE TRIGGER IF NOT EXISTS banco_horas_update
+    AFTER UPDATE OF minutos_extras ON registros_ponto
+    WHEN NEW.funcionario_id = OLD.funcionario_id AND NEW.data = OLD.data
+         AND NEW.minutos_extras <> OLD.minutos_extras
+    BEGIN
+        UPDATE banco_horas SET
+            minutos_extras = CASE WHEN data = NEW.data THEN NEW.minutos_extras ELSE minutos_extras END,
+            saldo_minutos = saldo_minutos + (NEW.minutos_extras - OLD.minutos_extras)
+        WHERE funcionario_id = NEW.funcionario_id AND data >= NEW.data;
+    END
+    """,
+    # Registro movido para outra data ou outro funcionário
+    f"""
+    CREATE TRIGGER IF NOT EXISTS banco_horas_mover
+    AFTER UPDATE OF funcionario_id, data ON registros_ponto
+    WHEN NEW.funcionario_id <> OLD.funcionario_id OR NEW.data <> OLD.data
+    BEGIN
+        {_sql_subtrair('OLD')}
+        {_sql_somar('NEW')}
+    END
+    """,
+]
+
+def _sql_saldo(operador, funcionario='?'):
+    """Subconsulta com o saldo do último dia {operador} a data informada (0 se não houver)"""
+    return f"""COALESCE((
+        SELECT saldo_minutos FROM banco_horas
+        WHERE funcionario_id = {funcionario} AND data {operador} ?
+        ORDER BY data DESC LIMIT 1), 0)"""
+
+# Saldo antes de uma data e até outra: parâmetros (funcionario_id, inicio, funcionario_id, fim)
+SQL_SALDO_ENTRE = f"""
+    SELECT {_sql_saldo('<')} AS saldo_anterior_minutos,
+           {_sql_saldo('<=')} AS saldo_minutos
+"""
+
+# Soma de prefixo completa a partir dos registros brutos (usada para reconstruir/verificar)
+SQL_ACUMULAR = """
+    SELECT funcionario_id, data, minutos_extras,
+           SUM(minutos_extras) OVER (PARTITION BY funcionario_id ORDER BY data) AS saldo_minutos
+    FROM registros_ponto
+"""
+
+COLUNAS_VALORES = ('minutos_extras', 'saldo_minutos')
+
+def criar_banco_horas(conn):
+    """Cria a tabela e os triggers; preenche o banco de horas se ele estiver vazio
+
+    Idempotente e sem commit (roda dentro da transação de quem chama).
+    Retorna o número de linhas do banco de horas.
+    """
+    for comando in ESTRUTURA:
+        conn.execute(comando)
+    total = conn.execute("SELECT COUNT(*) FROM banco_horas").fetchone()[0]
+    if total == 0:
+        total = reconstruir_banco_horas(conn)
+    return total
+
+def reconstruir_banco_horas(conn):
+    """Recalcula todos os saldos a partir de registros_ponto; retorna as linhas gravadas (sem commit)"""
+    conn.execute("DELETE FROM banco_horas")
+    cursor = conn.execute(f"""
+        INSERT INTO banco_horas (funcionario_id, data, {', '.join(COLUNAS_VALORES)})
+        {SQL_ACUMULAR}
+    """)
+    return cursor.rowcount
+
+def verificar_banco_horas(conn):
+    """Compara o banco de horas com os registros brutos e retorna a lista de divergências"""
+    esperado = {(row[0], row[1]): row[2:] for row in conn.execute(SQL_ACUMULAR)}
+    atual = {
+        (row[0], row[1]): row[2:]
+        for row in conn.execute(f"SELECT funcionario_id, data, {', '.join(COLUNAS_VALORES)} FROM banco_horas")
+    }
+
+    divergencias = []
+    for chave in sorted(set(esperado) | set(atual)):
+        linha_esperada = esperado.get(chave)
+        linha_atual = atual.get(chave)
+        if linha_esperada is None or linha_atual is None:
+            divergencias.append({'chave': chave, 'coluna': '(linha)',
+                                 'esperado': linha_esperada is not None,
+                                 'atual': linha_atual is not None})
+            continue
+        for coluna, valor_esperado, valor_atual in zip(COLUNAS_VALORES, linha_esperada, linha_atual):
+            if valor_esperado != valor_atual:
+                divergencias.append({'chave': chave, 'coluna': coluna,
+                                     'esperado': valor_esperado, 'atual': valor_atual})
+    return divergencias
+
+def main():
+    """Função principal"""
+    print("🏦 BANCO DE HORAS")
+    print("=" * 50)
+
+    aplicar_migracoes(DB_FILE)
+
+    conn = sqlite3.connect(DB_FILE)
+    try:
+        if '--reconstruir' in sys.argv:
+            linhas = reconstruir_banco_horas(conn)
+            conn.commit()
+            print(f"✅ Banco de horas reconstruído: {linhas} dias")
+            print("ℹ️  Se o portal usa PORTAL_REPLICA_MEMORIA=1: execute python replica_memoria.py --ressincronizar")
+
+        divergencias = verificar_banco_horas(conn)
+        saldos = conn.execute(f"""
+            SELECT f.nome, {_sql_saldo('<=', 'f.id')}
+            FROM funcionarios f
+            WHERE f.ativo = 1
+            ORDER BY f.nome
+        """, (date.today().isoformat(),)).fetchall()
+    finally:
+        conn.close()
+
+    if divergencias:
+        print(f"⚠️  {len(divergencias)} divergências encontradas:")
+        for d in divergencias:
+            funcionario_id, data = d['chave']
+            print(f"   • Funcionário {funcionario_id} - {data} - {d['coluna']}: "
+                  f"esperado {d['esperado']} | atual {d['atual']}")
+        print("   Execute: python banco_horas.py --reconstruir")
+        sys.exit(1)
+
+    print("✅ Banco de horas consistente com os registros de ponto")
+    for nome, saldo in saldos:
+        print(f"👤 {nome}: saldo {minutos_para_hm(saldo)}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cache dos dados calculados para as páginas de relatório
+
+Cada entrada guarda o contexto do template e as tags dos dados de que ele
+depende (por exemplo 'funcionario:3' ou 'gastos'). As rotas de escrita
+invalidam apenas as tags afetadas: a invalidação sobe a versão da tag e
+toda entrada calculada antes dela deixa de valer, inclusive as que ainda
+estavam sendo calculadas enquanto a escrita acontecia. Além disso as
+entradas expiram pelo TTL (escritas feitas fora do portal) e as menos
+usadas saem quando o limite de entradas é atingido (LRU).
+
+Há dois backends com a mesma interface: ReportCache, na memória do
+processo, e SQLiteReportCache, um arquivo SQLite compartilhado pelos
+processos do portal na mesma máquina (PORTAL_CACHE_BACKEND=sqlite). No
+compartilhado, a invalidação feita por um processo vale para todos.
+
+Numa falta, requisições simultâneas pela mesma chave (e mesma marca, ou
+seja, sem escrita no meio) esperam um único cálculo e recebem o mesmo
+resultado (SingleFlight), em vez de repetirem as mesmas agregações.
+"""
+
+import json
+import logging
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+_AUSENTE = object()
+
+class _Voo:
+    """Cálculo em andamento e o resultado que os seguidores vão receber"""
+
+    def __init__(self):
+        self.pronto = threading.Event()
+        self.resultado = None
+        self.erro = None
+
+class SingleFlight:
+    """Junta chamadas simultâneas com a mesma chave numa única execução
+
+    A primeira chamada (líder) executa a função; as que chegam enquanto ela
+    roda esperam e recebem o mesmo resultado, ou a mesma exceção. Um
+    seguidor que espera mais de espera_maxima segundos desiste e executa
+    por conta própria.
+    """
+
+    def __init__(self, espera_maxima=30):
+        self.espera_maxima = espera_maxima
+        self._voos = {}
+        self._lock = threading.Lock()
+        self.execucoes = 0
+        self.coalescidas = 0
+        self.desistencias = 0
+
+    def executar(self, chave, funcao):
+        """Resultado de funcao(), calculado uma vez por chave em andamento"""
+        with self._lock:
+            voo = self._voos.get(chave)
+            lider = voo is None
+            if lider:
+                voo = self._voos[chave] = _Voo()
+                self.execucoes += 1
+            else:
+                self.coalescidas += 1
+
+        if not lider:
+            if voo.pronto.wait(self.espera_maxima):
+                if voo.erro is not None:
+                    raise voo.erro
+                return voo.resultado
+            with self._lock:
+                self.desistencias += 1
+            return funcao()
+
+        try:
+            voo.resultado = funcao()
+        except Exception as e:
+            voo.erro = e
+            raise
+        finally:
+            with self._lock:
+                del self._voos[chave]
+            voo.pronto.set()
+        return voo.resultado
+
+    def estatisticas(self):
+        """Execuções, chamadas que aproveitaram uma execução em andamento e desistências"""
+        with self._lock:
+            return {
+                'em_andamento': len(self._voos),
+                'execucoes': self.execucoes,
+                'coalescidas': self.coalescidas,
+                'desistencias': self.desistencias
+            }
+
+class ReportCache:
+    """Cache LRU + TTL com invalidação por versão de tag"""
+
+    def __init__(self, maximo=256, ttl=300):
+        self.maximo = maximo
+        self.ttl = ttl
+        self._entradas = OrderedDict()  # chave -> (valor, tags, marca, expira)
+        self._versoes = {}              # tag -> marca da última invalidação
+        self._marca = 0
+        self._lock = threading.Lock()
+        self._acertos = 0
+        self._faltas = 0
+        self._despejos = 0
+        self._expiradas = 0
+        self._invalidadas = 0
+        self._voos = SingleFlight()
+
+    def marcar(self):
+        """Marca atual; passe-a para guardar() se o cálculo começou agora"""
+        with self._lock:
+            return self._marca
+
+    def obter(self, chave, padrao=None):
+        """Valor em cache, ou padrao se ausente, expirado ou invalidado"""
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada is None:
+                self._faltas += 1
+                return padrao
+            valor, tags, marca, expira = entrada
+            if time.monotonic() >= expira:
+                del self._entradas[chave]
+                self._expiradas += 1
+                self._faltas += 1
+                return padrao
+            if any(self._versoes.get(tag, 0) > marca for tag in tags):
+                del self._entradas[chave]
+                self._invalidadas += 1
+                self._faltas += 1
+                return padrao
+            self._entradas.move_to_end(chave)
+            self._acertos += 1
+            return valor
+
+    def guardar(self, chave, valor, tags, marca):
+        """Guarda o valor calculado a partir da marca informada"""
+        tags = tuple(tags)
+        with self._lock:
+            if any(self._versoes.get(tag, 0) > marca for tag in tags):
+                return  # dados mudaram durante o cálculo
+            self._entradas[chave] = (valor, tags, marca, time.monotonic() + self.ttl)
+            self._entradas.move_to_end(chave)
+            while len(self._entradas) > self.maximo:
+                self._entradas.popitem(last=False)
+                self._despejos += 1
+
+    def obter_ou_calcular(self, chave, calcular, marca=None):
+        """Valor em cache ou calcular(), que retorna (valor, tags); valor None não é guardado
+
+        'marca' deve ser tirada antes de abrir o snapshot de onde calcular()
+        lê: uma escrita invalidada depois dela descarta o resultado. Sem
+        ela, vale a marca atual. Faltas simultâneas pela mesma chave e
+        marca compartilham um só cálculo.
+        """
+        valor = self.obter(chave, _AUSENTE)
+        if valor is not _AUSENTE:
+            return valor
+        if marca is None:
+            marca = self.marcar()
+
+        def calcular_e_guardar():
+            valor, tags = calcular()
+            if valor is not None:
+                self.guardar(chave, valor, tags, marca)
+            return valor
+
+        return self._voos.executar((chave, marca), calcular_e_guardar)
+
+    def invalidar(self, *tags):
+        """Invalida as entradas que dependem de qualquer uma das tags"""
+        with self._lock:
+            self._marca += 1
+            for tag in tags:
+                self._versoes[tag] = self._marca
+
+    def limpar(self):
+        """Descarta todas as entradas"""
+        with self._lock:
+            self._entradas.clear()
+
+    def _contadores(self):
+        consultas = self._acertos + self._faltas
+        return {
+            'acertos': self._acertos,
+            'faltas': self._faltas,
+            'taxa_acerto': round(self._acertos / consultas, 4) if consultas else 0,
+            'despejos': self._despejos,
+            'expiradas': self._expiradas,
+            'invalidadas': self._invalidadas,
+            'calculos': self._voos.estatisticas()
+        }
+
+    def estatisticas(self):
+        """Contadores de acertos, faltas e remoções"""
+        with self._lock:
+            return {
+                'backend': 'memoria',
+                'entradas': len(self._entradas),
+                'maximo': self.maximo,
+                'ttl': self.ttl,
+                **self._contadores()
+            }
+
+class SQLiteReportCache(ReportCache):
+    """Cache compartilhado entre processos num arquivo SQLite próprio
+
+    Mesma semântica do ReportCache: a marca global e as versões das tags
+    ficam no arquivo, então a invalidação de um processo descarta as
+    entradas calculadas pelos outros. O LRU é aproximado (o último uso só
+    é regravado depois de TOQUE_MINIMO segundos). Os contadores de
+    acertos/faltas são do processo. Falhas no arquivo viram faltas: o
+    cache nunca derruba uma página.
+
+    'versao' separa entradas de versões diferentes do código (um deploy
+    não reaproveita contextos montados pelo código antigo).
+    """
+
+    TOQUE_MINIMO = 1.0  # segundos entre regravações do último uso de uma entrada
+
+    ESTRUTURA = [
+        """
+        CREATE TABLE IF NOT EXISTS cache_entradas (
+            chave TEXT PRIMARY KEY,
+            valor BLOB NOT NULL,
+            tags TEXT NOT NULL,
+            marca INTEGER NOT NULL,
+            expira REAL NOT NULL,
+            usado_em REAL NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_cache_entradas_usado_em ON cache_entradas(usado_em)",
+        "CREATE TABLE IF NOT EXISTS cache_versoes (tag TEXT PRIMARY KEY, marca INTEGER NOT NULL)",
+        """
+        CREATE TABLE IF NOT EXISTS cache_marca (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            marca INTEGER NOT NULL
+        )
+        """,
+        "INSERT OR IGNORE INTO cache_marca (id, marca) VALUES (1, 0)",
+    ]
+
+    def __init__(self, arquivo, maximo=256, ttl=300, versao='', busy_timeout=5):
+        super().__init__(maximo, ttl)
+        self.arquivo = arquivo
+        self.versao = versao
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        conn = self._conexao()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for comando in self.ESTRUTURA:
+                conn.execute(comando)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _conexao(self):
+        """Conexão da thread atual com o arquivo do cache"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.arquivo, timeout=self.busy_timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _chave(self, chave):
+        return json.dumps([self.versao, chave], ensure_ascii=False, default=str)
+
+    def _contar(self, contador):
+        with self._lock:
+            setattr(self, contador, getattr(self, contador) + 1)
+
+    def marcar(self):
+        """Marca global atual (compartilhada entre os processos)"""
+        try:
+            return self._conexao().execute("SELECT marca FROM cache_marca WHERE id = 1").fetchone()[0]
+        except sqlite3.Error as e:
+            logger.warning("Cache de relatórios indisponível: %s", e)
+            return -1  # nada calculado a partir daqui é guardado
+
+    def obter(self, chave, padrao=None):
+        """Valor em cache, ou padrao se ausente, expirado ou invalidado"""
+        chave = self._chave(chave)
+        agora = time.time()
+        try:
+            conn = self._conexao()
+            entrada = conn.execute("""
+                SELECT e.valor, e.expira, e.usado_em, e.marca,
+                       (SELECT MAX(v.marca) FROM cache_versoes v, json_each(e.tags) t
+                        WHERE v.tag = t.value) AS invalidada_em
+                FROM cache_entradas e WHERE e.chave = ?
+            """, (chave,)).fetchone()
+            if entrada is None:
+                self._contar('_faltas')
+                return padrao
+            valor, expira, usado_em, marca, invalidada_em = entrada
+            if agora >= expira or (invalidada_em or 0) > marca:
+                conn.execute("DELETE FROM cache_entradas WHERE chave = ?", (chave,))
+                self._contar('_expiradas' if agora >= expira else '_invalidadas')
+                self._contar('_faltas')
+                return padrao
+            if agora - usado_em >= self.TOQUE_MINIMO:
+                conn.execute("UPDATE cache_entradas SET usado_em = ? WHERE chave = ?", (agora, chave))
+            valor = pickle.loads(valor)
+        except (sqlite3.Error, pickle.UnpicklingError) as e:
+            logger.warning("Falha ao ler o cache de relatórios: %s", e)
+            self._contar('_faltas')
+            return padrao
+        self._contar('_acertos')
+        return valor
+
+    def guardar(self, chave, valor, tags, marca):
+        """Guarda o valor calculado a partir da marca informada"""
+        if marca < 0:
+            return
+        tags = json.dumps(list(tags))
+        agora = time.time()
+        try:
+            conn = self._conexao()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                invalidada_em = conn.execute(
+                    "SELECT MAX(v.marca) FROM cache_versoes v, json_each(?) t WHERE v.tag = t.value",
+                    (tags,)).fetchone()[0]
+                if (invalidada_em or 0) > marca:
+                    conn.execute("ROLLBACK")
+                    return  # dados mudaram durante o cálculo
+                conn.execute("""
+                    INSERT OR REPLACE INTO cache_entradas (chave, valor, tags, marca, expira, usado_em)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, (self._chave(chave), pickle.dumps(valor, pickle.HIGHEST_PROTOCOL), tags, marca,
+                      agora + self.ttl, agora))
+                conn.execute("DELETE FROM cache_entradas WHERE expira <= ?", (agora,))
+                excedentes = conn.execute("SELECT COUNT(*) FROM cache_entradas").fetchone()[0] - self.maximo
+                if excedentes > 0:
+                    conn.execute("""
+                        DELETE FROM cache_entradas WHERE chave IN (
+                            SELECT chave FROM cache_entradas ORDER BY usado_em LIMIT ?)
+                    """, (excedentes,))
+                    with self._lock:
+                        self._despejos += excedentes
+                conn.execute("COMMIT")
+            except Exception:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+        except sqlite3.Error as e:
+            logger.warning("Falha ao gravar no cache de relatórios: %s", e)
+
+    def invalidar(self, *tags):
+        """Invalida, em todos os processos, as entradas que dependem das tags"""
+        try:
+            conn = self._conexao()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                marca = conn.execute(
+                    "UPDATE cache_marca SET marca = marca + 1 WHERE id = 1 RETURNING marca").fetchone()[0]
+                conn.executemany("""
+                    INSERT INTO cache_versoes (tag, marca) VALUES (?, ?)
+                    ON CONFLICT (tag) DO UPDATE SET marca = excluded.marca
+                """, [(tag, marca) for tag in tags])
+                conn.execute("COMMIT")
+            except Exception:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+        except sqlite3.Error as e:
+            # Sem a invalidação, as entradas afetadas só saem pelo TTL
+            logger.error("Falha ao invalidar o cache de relatórios (%s): %s", ', '.join(tags), e)
+
+    def limpar(self):
+        """Descarta todas as entradas (de todos os processos)"""
+        self._conexao().execute("DELETE FROM cache_entradas")
+
+    def estatisticas(self):
+        """Contadores do processo e tamanho do cache compartilhado"""
+        try:
+            entradas = self._conexao().execute("SELECT COUNT(*) FROM cache_entradas").fetchone()[0]
+        except sqlite3.Error:
+            entradas = None
+        with self._lock:
+            return {
+                'backend': 'sqlite',
+                'arquivo': self.arquivo,
+                'entradas': entradas,
+                'maximo': self.maximo,
+                'ttl': self.ttl,
+                **self._contadores()
+            }
+
+def criar_cache(backend='memoria', maximo=256, ttl=300, arquivo=None, versao=''):
+    """Cria o cache de relatórios do backend escolhido ('memoria' ou 'sqlite')"""
+    if backend == 'sqlite':
+        return SQLiteReportCache(arquivo, maximo, ttl, versao)
+    if backend != 'memoria':
+        raise ValueError(f"Backend de cache desconhecido: {backend}")
+    return ReportCache(maximo, ttl)
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cálculo das batidas de ponto em minutos inteiros
+
+Um só lugar para transformar as quatro batidas do dia (entrada, saída e
+volta do almoço, saída) nas colunas gravadas em registros_ponto: horários
+em minutos desde a meia-noite, tempo de almoço, minutos trabalhados e
+extras acima da jornada. Rotas do portal, importação e scripts de
+recálculo usam estas funções, então o resultado é o mesmo em toda parte.
+
+Os horários 'HH:MM' são lidos direto dos dígitos (sem strptime). Para vários
+registros de uma vez, calcular_pontos devolve colunas inteiras; com NumPy
+instalado a aritmética é vetorizada, sem ele um laço produz o mesmo
+resultado.
+"""
+
+try:
+    import numpy as np
+except ImportError:  # NumPy é opcional
+    np = None
+
+JORNADA_DIARIA_MINUTOS = 8 * 60   # minutos normais por dia
+
+# Colunas de registros_ponto produzidas pelo cálculo, na ordem do INSERT
+COLUNAS_PONTO = ('entrada_min', 'saida_almoco_min', 'volta_almoco_min', 'saida_min',
+                 'minutos_almoco', 'minutos_trabalhados', 'minutos_extras')
+
+def hora_para_minutos(hora):
+    """Horário 'HH:MM' em minutos desde a meia-noite (ValueError se inválido)"""
+    horas, _, minutos = hora.partition(':')
+    if len(minutos) != 2 or not horas.isdigit() or not minutos.isdigit():
+        raise ValueError(f"Horário inválido: {hora!r}")
+    horas, minutos = int(horas), int(minutos)
+    if horas > 23 or minutos > 59:
+        raise ValueError(f"Horário inválido: {hora!r}")
+    return horas * 60 + minutos
+
+def minutos_para_hora(minutos_do_dia):
+    """Minutos desde a meia-noite no formato 'HH:MM' (campos type="time")"""
+    horas, minutos = divmod(int(minutos_do_dia), 60)
+    return f"{horas:02d}:{minutos:02d}"
+
+def minutos_para_hm(minutos):
+    """Converte minutos inteiros para o formato 'Xh Ymin'"""
+    if not minutos:
+        return "0h 0min"
+
+    horas, minutos = divmod(int(minutos), 60)
+    if horas > 0 and minutos > 0:
+        return f"{horas}h {minutos}min"
+    elif horas > 0:
+        return f"{horas}h"
+    else:
+        return f"{minutos}min"
+
+def _minutos(horario):
+    """Aceita 'HH:MM' ou minutos desde a meia-noite já convertidos"""
+    return hora_para_minutos(horario) if isinstance(horario, str) else int(horario)
+
+def calcular_minutos_extras(minutos_trabalhados, jornada=JORNADA_DIARIA_MINUTOS):
+    """Minutos extras acima da jornada diária"""
+    if minutos_trabalhados > jornada:
+        return minutos_trabalhados - jornada
+    return 0
+
+def calcular_ponto(entrada, saida_almoco, volta_almoco, saida):
+    """Colunas de um registro a partir das quatro batidas ('HH:MM' ou minutos)
+
+    Returns:
+        dict: uma chave por coluna de COLUNAS_PONTO
+    """
+    entrada, saida_almoco = _minutos(entrada), _minutos(saida_almoco)
+    volta_almoco, saida = _minutos(volta_almoco), _minutos(saida)
+    minutos_trabalhados = (saida_almoco - entrada) + (saida - volta_almoco)
+    return {
+        'entrada_min': entrada,
+        'saida_almoco_min': saida_almoco,
+        'volta_almoco_min': volta_almoco,
+        'saida_min': saida,
+        'minutos_almoco': volta_almoco - saida_almoco,
+        'minutos_trabalhados': minutos_trabalhados,
+        'minutos_extras': calcular_minutos_extras(minutos_trabalhados)
+    }
+
+def _calcular_numpy(batidas):
+    """Colunas de calcular_pontos com aritmética vetorizada"""
+    entrada, saida_almoco, volta_almoco, saida = np.asarray(batidas, dtype=np.int64).reshape(-1, 4).T
+    minutos_trabalhados = (saida_almoco - entrada) + (saida - volta_almoco)
+    colunas = (entrada, saida_almoco, volta_almoco, saida, volta_almoco - saida_almoco,
+               minutos_trabalhados, np.maximum(minutos_trabalhados - JORNADA_DIARIA_MINUTOS, 0))
+    # Listas de int do Python: o sqlite3 não aceita np.int64 como parâmetro
+    return {coluna: valores.tolist() for coluna, valores in zip(COLUNAS_PONTO, colunas)}
+
+def _calcular_python(batidas):
+    """Mesmas colunas de _calcular_numpy, sem NumPy"""
+    colunas = {coluna: [] for coluna in COLUNAS_PONTO}
+    for linha in batidas:
+        for coluna, valor in calcular_ponto(*linha).items():
+            colunas[coluna].append(valor)
+    return colunas
+
+def calcular_pontos(batidas, usar_numpy=True):
+    """Calcula vários registros de uma vez
+
+    Args:
+        batidas: sequência de (entrada, saida_almoco, volta_almoco, saida), em
+                 'HH:MM' ou minutos, ou um array NumPy (n, 4) de minutos
+
+    Returns:
+        dict: uma lista por coluna de COLUNAS_PONTO, na ordem das batidas
+    """
+    vetorizado = usar_numpy and np is not None and len(batidas) > 0
+    if np is not None and isinstance(batidas, np.ndarray):
+        minutos = batidas if vetorizado else batidas.reshape(-1, 4).tolist()
+    else:
+        minutos = [[_minutos(horario) for horario in linha] for linha in batidas]
+    return (_calcular_numpy if vetorizado else _calcular_python)(minutos)
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Consultor de índices do portal
+
+Cada formato de query executado pelo portal passa uma única vez por
+EXPLAIN QUERY PLAN; o consultor guarda o plano e aponta varreduras completas
+de tabelas, índices automáticos e ordenações em B-tree temporária. O
+relatório fica disponível em /debug/indices e pela linha de comando, que
+percorre as páginas de leitura do portal e imprime o que encontrou.
+
+Uso:
+    python consultor_indices.py
+"""
+
+import re
+import sqlite3
+import threading
+
+_RE_TABELAS = re.compile(r'\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?', re.IGNORECASE)
+_RE_INDICE_USADO = re.compile(r'USING (?:COVERING )?INDEX (\w+)')
+_PALAVRAS_RESERVADAS = {'WHERE', 'JOIN', 'LEFT', 'INNER', 'CROSS', 'ON', 'GROUP', 'ORDER',
+                        'LIMIT', 'USING', 'SET', 'UNION', 'WINDOW', 'NATURAL'}
+
+def _apelidos(query, tabelas):
+    """Mapeia nomes e apelidos usados na query para as tabelas reais do esquema"""
+    mapa = {}
+    for tabela, apelido in _RE_TABELAS.findall(query):
+        if tabela.lower() not in tabelas:
+            continue  # CTEs e subqueries não são tabelas do esquema
+        mapa[tabela.lower()] = tabela.lower()
+        if apelido and apelido.upper() not in _PALAVRAS_RESERVADAS:
+            mapa[apelido.lower()] = tabela.lower()
+    return mapa
+
+def problemas_do_plano(plano, apelidos):
+    """Lista os problemas de um plano (linhas de detalhe do EXPLAIN QUERY PLAN)"""
+    problemas = []
+    for detalhe in plano:
+        if detalhe.startswith('SCAN ') and ' USING ' not in detalhe:
+            nome = detalhe.split()[1].lower()
+            if nome in apelidos:
+                problemas.append({'tipo': 'varredura_completa', 'tabela': apelidos[nome],
+                                  'detalhe': detalhe})
+        elif 'AUTOMATIC' in detalhe:
+            nome = detalhe.split()[1].lower()
+            problemas.append({'tipo': 'indice_automatico', 'tabela': apelidos.get(nome, nome),
+                              'detalhe': detalhe})
+        elif detalhe.startswith('USE TEMP B-TREE'):
+            problemas.append({'tipo': 'btree_temporaria', 'tabela': None, 'detalhe': detalhe})
+    return problemas
+
+def indices_redundantes(conn, em_uso=()):
+    """Índices cujas colunas são prefixo de outro índice da mesma tabela
+
+    Índices que aparecem em algum plano observado (em_uso) ficam de fora:
+    um índice curto também ordena pelo rowid, o que o mais longo não faz.
+    """
+    indices = {}
+    for tabela, in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'"):
+        for _, nome, _, _, parcial in conn.execute(f"PRAGMA index_list({tabela})"):
+            if parcial:
+                continue
+            colunas = tuple(row[2] for row in conn.execute(f"PRAGMA index_info({nome})"))
+            indices.setdefault(tabela, []).append((nome, colunas))
+
+    redundantes = []
+    for tabela, lista in indices.items():
+        for nome, colunas in lista:
+            if not nome.startswith('idx_') or nome in em_uso:
+                continue  # índices de PRIMARY KEY/UNIQUE não podem ser removidos
+            for outro, colunas_outro in lista:
+                if outro != nome and len(colunas_outro) >= len(colunas) \
+                        and colunas_outro[:len(colunas)] == colunas:
+                    redundantes.append({'tabela': tabela, 'indice': nome, 'coberto_por': outro})
+                    break
+    return redundantes
+
+class ConsultorIndices:
+    """Registro dos planos de cada formato de query visto pelo portal"""
+
+    def __init__(self):
+        self._consultas = {}
+        self._tabelas = None
+        self._lock = threading.Lock()
+
+    def _tabelas_do_esquema(self, conn):
+        if self._tabelas is None:
+            self._tabelas = {row[0].lower() for row in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table'")}
+        return self._tabelas
+
+    def observar(self, conn, query, params, sql, rota=None):
+        """Conta a execução; na primeira vez do formato, analisa o plano"""
+        with self._lock:
+            consulta = self._consultas.get(sql)
+            if consulta is not None:
+                consulta['execucoes'] += 1
+                if rota and rota not in consulta['rotas']:
+                    consulta['rotas'].append(rota)
+                return consulta
+
+        try:
+            plano = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {query}", params or ())]
+            problemas = problemas_do_plano(plano, _apelidos(query, self._tabelas_do_esquema(conn)))
+        except sqlite3.Error as e:
+            plano = [f"(plano indisponível: {e})"]
+            problemas = []
+
+        with self._lock:
+            consulta = self._consultas.setdefault(sql, {
+                'sql': sql,
+                'plano': plano,
+                'problemas': problemas,
+                'execucoes': 0,
+                'rotas': []
+            })
+            consulta['execucoes'] += 1
+            if rota and rota not in consulta['rotas']:
+                consulta['rotas'].append(rota)
+        return consulta
+
+    def relatorio(self, apenas_problemas=False):
+        """Consultas analisadas, as com problemas primeiro"""
+        with self._lock:
+            consultas = [dict(c, rotas=list(c['rotas'])) for c in self._consultas.values()]
+        if apenas_problemas:
+            consultas = [c for c in consultas if c['problemas']]
+        consultas.sort(key=lambda c: (-len(c['problemas']), -c['execucoes']))
+        return {
+            'consultas_analisadas': len(self._consultas),
+            'com_problemas': sum(1 for c in consultas if c['problemas']),
+            'consultas': consultas
+        }
+
+    def indices_em_uso(self):
+        """Nomes dos índices escolhidos pelo planejador nas consultas analisadas"""
+        with self._lock:
+            planos = [detalhe for c in self._consultas.values() for detalhe in c['plano']]
+        return {m.group(1) for m in map(_RE_INDICE_USADO.search, planos) if m}
+
+    def limpar(self):
+        """Esquece os planos (após migrações que mudam índices)"""
+        with self._lock:
+            self._consultas.clear()
+            self._tabelas = None
+
+def _paginas_de_leitura(conn):
+    """Páginas GET que exercitam as queries do portal"""
+    paginas = ['/', '/relatorios', '/controle_financeiro', '/gastos/listar',
+               '/gastos/listar?categoria=Lazer', '/gastos/listar?data_inicio=2025-01-01&data_fim=2025-12-31',
+               '/gastos/relatorio', '/registrar_horas', '/calculo_avulso']
+    funcionario = conn.execute(
+        "SELECT nome FROM funcionarios WHERE ativo = 1 ORDER BY nome LIMIT 1").fetchone()
+    if funcionario:
+        nome = funcionario[0]
+        paginas.append(f'/funcionario/{nome}')
+        paginas.append(f'/editar_funcionario/{nome}')
+        periodo = conn.execute("""
+            SELECT r.periodo_mes, r.periodo_ano, r.id FROM registros_ponto r
+            JOIN funcionarios f ON f.id = r.funcionario_id
+            WHERE f.nome = ? ORDER BY r.data DESC LIMIT 1
+        """, (nome,)).fetchone()
+        if periodo:
+            paginas.append(f'/relatorio_mensal/{nome}/{periodo[0]}/{periodo[1]}')
+            paginas.append(f'/editar_registro/{periodo[2]}')
+    return paginas
+
+def main():
+    """Função principal"""
+    print("🔎 CONSULTOR DE ÍNDICES")
+    print("=" * 50)
+
+    import index
+    index.inicializar_banco()
+    index.consultor_indices.limpar()
+
+    conn = sqlite3.connect(index.DB_FILE)
+    try:
+        paginas = _paginas_de_leitura(conn)
+    finally:
+        conn.close()
+
+    cliente = index.app.test_client()
+    for pagina in paginas:
+        resposta = cliente.get(pagina)
+        print(f"   {'✅' if resposta.status_code < 400 else '❌'} {resposta.status_code} {pagina}")
+
+    relatorio = index.consultor_indices.relatorio()
+    print(f"\n📋 {relatorio['consultas_analisadas']} formatos de query analisados, "
+          f"{relatorio['com_problemas']} com problemas")
+    for consulta in relatorio['consultas']:
+        if not consulta['problemas']:
+            continue
+        print(f"\n⚠️  {consulta['sql'][:160]}")
+        print(f"   Rotas: {', '.join(consulta['rotas']) or '-'}")
+        for problema in consulta['problemas']:
+            print(f"   • {problema['tipo']}: {problema['detalhe']}")
+
+    conn = sqlite3.connect(index.DB_FILE)
+    try:
+        redundantes = indices_redundantes(conn, index.consultor_indices.indices_em_uso())
+    finally:
+        conn.close()
+    for r in redundantes:
+        print(f"\n🗑️  Índice redundante {r['indice']} ({r['tabela']}): coberto por {r['coberto_por']}")
+
+    if not relatorio['com_problemas'] and not redundantes:
+        print("\n✅ Nenhuma varredura completa, B-tree temporária ou índice redundante encontrado")
+
+if __name__ == '__main__':
+    main()
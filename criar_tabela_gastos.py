@@ -1,26 +1,14 @@
 import sqlite3
 from datetime import datetime
 
+from migracoes import aplicar_migracoes
+
 def criar_tabela_gastos():
-    """Cria a tabela de gastos domésticos no banco SQLite"""
+    """Cria a tabela de gastos domésticos no banco SQLite (via migrações versionadas)"""
+    aplicar_migracoes('horas_trabalho.db')
+    
     conn = sqlite3.connect('horas_trabalho.db')
     cursor = conn.cursor()
-    
-    # Criar tabela de gastos
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS gastos_domesticos (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            descricao TEXT NOT NULL,
-            categoria TEXT NOT NULL,
-            valor REAL NOT NULL,
-            data_gasto DATE NOT NULL,
-            forma_pagamento TEXT NOT NULL,
-            observacoes TEXT,
-            data_criacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    conn.commit()
     print("✅ Tabela 'gastos_domesticos' criada com sucesso!")
     
     # Verificar se a tabela foi criada
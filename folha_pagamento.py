@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Folha de pagamento de um período de fechamento (26 a 25) inteiro
+
+Os registros do período são lidos numa única query e agregados por
+funcionário em colunas de minutos inteiros: trabalhados, normais (até 8h
+por dia) e extras; os valores em reais (extras com adicional de 50%) saem
+das somas, menos o desconto mensal do cadastro. Com NumPy instalado a
+agregação é vetorizada (bincount sobre as colunas); sem ele, um laço
+simples produz o mesmo resultado.
+
+Uso:
+    python folha_pagamento.py                 # período atual
+    python folha_pagamento.py 9 2025          # período de fechamento 09/2025
+    python folha_pagamento.py 9 2025 --json
+"""
+
+import json
+import sqlite3
+import sys
+from datetime import date
+
+from calculo_ponto import JORNADA_DIARIA_MINUTOS
+from migracoes import aplicar_migracoes
+from resumo_fechamento import ADICIONAL_EXTRAS
+
+try:
+    import numpy as np
+except ImportError:  # NumPy é opcional
+    np = None
+
+DB_FILE = 'horas_trabalho.db'
+
+# Colunas lidas em uma única query por período
+QUERY_REGISTROS = """
+    SELECT funcionario_id, minutos_trabalhados, minutos_extras
+    FROM registros_ponto
+    WHERE periodo_ano = ? AND periodo_mes = ?
+"""
+
+QUERY_FUNCIONARIOS = """
+    SELECT id, nome, cargo, salario_hora, COALESCE(desconto, 0) AS desconto
+    FROM funcionarios
+    WHERE id IN (SELECT funcionario_id FROM registros_ponto WHERE periodo_ano = ? AND periodo_mes = ?)
+"""
+
+def _somar_por_posicao(posicao, valores):
+    """bincount de minutos inteiros (a soma em float64 é exata até 2**53)"""
+    return np.bincount(posicao, weights=valores).astype(np.int64)
+
+def _agregar_numpy(ids, minutos, extras):
+    """Somas por funcionário com NumPy: {id: (dias, total_minutos, minutos_normais, minutos_extras)}"""
+    ids = np.asarray(ids, dtype=np.int64)
+    minutos = np.asarray(minutos, dtype=np.int64)
+    extras = np.asarray(extras, dtype=np.int64)
+    chaves, posicao = np.unique(ids, return_inverse=True)
+    dias = np.bincount(posicao)
+    total_minutos = _somar_por_posicao(posicao, minutos)
+    minutos_normais = _somar_por_posicao(posicao, np.minimum(minutos, JORNADA_DIARIA_MINUTOS))
+    minutos_extras = _somar_por_posicao(posicao, extras)
+    return {
+        int(chave): (int(d), int(m), int(n), int(e))
+        for chave, d, m, n, e in zip(chaves, dias, total_minutos, minutos_normais, minutos_extras)
+    }
+
+def _agregar_python(ids, minutos, extras):
+    """Mesmas somas de _agregar_numpy, sem NumPy"""
+    somas = {}
+    for funcionario_id, m, e in zip(ids, minutos, extras):
+        d, total, normais, total_extras = somas.get(funcionario_id, (0, 0, 0, 0))
+        somas[funcionario_id] = (d + 1, total + m, normais + min(m, JORNADA_DIARIA_MINUTOS), total_extras + e)
+    return somas
+
+def calcular_folha(registros, funcionarios, usar_numpy=True):
+    """Folha do período a partir dos registros e do cadastro dos funcionários
+
+    Args:
+        registros: linhas com funcionario_id, minutos_trabalhados e minutos_extras
+        funcionarios: linhas com id, nome, cargo, salario_hora e desconto
+
+    Returns:
+        dict: 'funcionarios' (um por funcionário com registros, por nome),
+              'totais' e 'motor' ('numpy' ou 'python')
+    """
+    ids = [r['funcionario_id'] for r in registros]
+    minutos = [r['minutos_trabalhados'] for r in registros]
+    extras = [r['minutos_extras'] for r in registros]
+
+    vetorizado = usar_numpy and np is not None and bool(ids)
+    somas = (_agregar_numpy if vetorizado else _agregar_python)(ids, minutos, extras)
+
+    cadastro = {f['id']: f for f in funcionarios}
+    linhas = []
+    for funcionario_id, (dias, total_minutos, minutos_normais, minutos_extras) in somas.items():
+        funcionario = cadastro[funcionario_id]
+        salario_hora = funcionario['salario_hora']
+        valor_horas_normais = minutos_normais * salario_hora / 60
+        valor_horas_extras = minutos_extras * salario_hora * ADICIONAL_EXTRAS / 60
+        valor_bruto = valor_horas_normais + valor_horas_extras
+        linhas.append({
+            'funcionario_id': funcionario_id,
+            'nome': funcionario['nome'],
+            'cargo': funcionario['cargo'],
+            'salario_hora': salario_hora,
+            'dias_trabalhados': dias,
+            'total_minutos': total_minutos,
+            'minutos_normais': minutos_normais,
+            'minutos_extras': minutos_extras,
+            'valor_horas_normais': valor_horas_normais,
+            'valor_horas_extras': valor_horas_extras,
+            'valor_bruto': valor_bruto,
+            'desconto': funcionario['desconto'],
+            'valor_liquido': valor_bruto - funcionario['desconto']
+        })
+    linhas.sort(key=lambda linha: linha['nome'])
+
+    colunas_totais = ('dias_trabalhados', 'total_minutos', 'minutos_normais', 'minutos_extras',
+                      'valor_horas_normais', 'valor_horas_extras', 'valor_bruto', 'desconto',
+                      'valor_liquido')
+    totais = {coluna: sum(linha[coluna] for linha in linhas) for coluna in colunas_totais}
+    totais['funcionarios'] = len(linhas)
+    return {'funcionarios': linhas, 'totais': totais, 'motor': 'numpy' if vetorizado else 'python'}
+
+def folha_do_periodo(conn, mes, ano):
+    """Lê o período numa conexão sqlite3 e calcula a folha"""
+    conn.row_factory = sqlite3.Row
+    registros = conn.execute(QUERY_REGISTROS, (ano, mes)).fetchall()
+    funcionarios = conn.execute(QUERY_FUNCIONARIOS, (ano, mes)).fetchall()
+    return calcular_folha(registros, funcionarios)
+
+def main():
+    """Função principal"""
+    argumentos = [a for a in sys.argv[1:] if not a.startswith('--')]
+    if argumentos:
+        mes, ano = int(argumentos[0]), int(argumentos[1])
+    else:
+        hoje = date.today()
+        mes, ano = (hoje.month, hoje.year) if hoje.day <= 25 else \
+            ((hoje.month % 12) + 1, hoje.year + (hoje.month == 12))
+
+    aplicar_migracoes(DB_FILE)
+    conn = sqlite3.connect(DB_FILE)
+    try:
+        folha = folha_do_periodo(conn, mes, ano)
+    finally:
+        conn.close()
+
+    if '--json' in sys.argv:
+        print(json.dumps(dict(folha, mes=mes, ano=ano), ensure_ascii=False, indent=2))
+        return
+
+    print(f"💰 FOLHA DO PERÍODO {mes:02d}/{ano}")
+    print("=" * 50)
+    if not folha['funcionarios']:
+        print("ℹ️  Nenhum registro de ponto no período")
+        return
+    for linha in folha['funcionarios']:
+        print(f"👤 {linha['nome']}: {linha['dias_trabalhados']} dias | {linha['total_minutos'] / 60:.2f}h "
+              f"({linha['minutos_extras'] / 60:.2f}h extras) | bruto R$ {linha['valor_bruto']:.2f} | "
+              f"desconto R$ {linha['desconto']:.2f} | líquido R$ {linha['valor_liquido']:.2f}")
+    totais = folha['totais']
+    print("-" * 50)
+    print(f"📊 {totais['funcionarios']} funcionário(s) | bruto R$ {totais['valor_bruto']:.2f} | "
+          f"líquido R$ {totais['valor_liquido']:.2f} (motor: {folha['motor']})")
+
+if __name__ == '__main__':
+    main()
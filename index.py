@@ -1,7 +1,31 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
-from datetime import datetime, timedelta
+from flask import (Flask, render_template, stream_template, request, redirect, url_for, flash, jsonify,
+                   g, has_request_context, session)
+from werkzeug.http import is_resource_modified
+from datetime import datetime, timedelta, timezone
+from contextlib import contextmanager
+from functools import wraps
+from collections import Counter, deque
+import logging
 import sqlite3
+import threading
+import queue
+import time
+import random
+import re
 import os
+import base64
+import hashlib
+import pathlib
+import json
+from urllib.parse import quote
+
+from migracoes import aplicar_migracoes
+from consultor_indices import ConsultorIndices
+from replica_memoria import ReplicaMemoria, comparar
+from cache_relatorios import criar_cache
+from folha_pagamento import QUERY_REGISTROS, QUERY_FUNCIONARIOS, calcular_folha
+from calculo_ponto import COLUNAS_PONTO, calcular_ponto, minutos_para_hm, minutos_para_hora
+from banco_horas import SQL_SALDO_ENTRE
 
 app = Flask(__name__)
 app.secret_key = 'sua_chave_secreta_aqui'
@@ -9,62 +33,977 @@ app.secret_key = 'sua_chave_secreta_aqui'
 # Arquivo do banco SQLite
 DB_FILE = 'horas_trabalho.db'
 
+# Configuração do pool de conexões
+DB_POOL_SIZE = int(os.environ.get('PORTAL_DB_POOL_SIZE', 8))
+DB_POOL_TIMEOUT = float(os.environ.get('PORTAL_DB_POOL_TIMEOUT', 10))
+DB_POOL_LEITURA_SIZE = int(os.environ.get('PORTAL_DB_POOL_LEITURA_SIZE', DB_POOL_SIZE))  # pista de leitura
+
+# Contenção de locks: espera do SQLite (busy timeout) e retentativas com backoff para operações idempotentes
+DB_BUSY_TIMEOUT_MS = int(os.environ.get('PORTAL_DB_BUSY_TIMEOUT_MS', 5000))
+DB_RETENTATIVAS = int(os.environ.get('PORTAL_DB_RETENTATIVAS', 3))
+DB_BACKOFF_BASE_MS = float(os.environ.get('PORTAL_DB_BACKOFF_BASE_MS', 25))
+DB_BACKOFF_MAXIMO_MS = float(os.environ.get('PORTAL_DB_BACKOFF_MAXIMO_MS', 500))
+BALDES_ESPERA_MS = (1, 5, 10, 50, 100, 500, 1000, 5000)  # limites do histograma de esperas
+
+# PRAGMAs aplicados uma única vez em cada conexão do pool
+SQLITE_PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('mmap_size', 268435456),  # 256 MB
+    ('cache_size', -20000),    # ~20 MB (valor negativo = KiB)
+    ('temp_store', 'MEMORY'),
+    ('foreign_keys', 'ON'),
+)
+
+# Pista de leitura: conexões somente leitura (mode=ro) com cache e mmap maiores para relatórios
+SQLITE_PRAGMAS_LEITURA = (
+    ('query_only', 'ON'),
+    ('mmap_size', 1073741824),  # 1 GB
+    ('cache_size', -65536),     # ~64 MB
+    ('temp_store', 'MEMORY'),
+)
+
+# Réplica em memória para a pista de leitura (desativada por padrão). Só vê as escritas
+# deste processo: exige um único processo do portal (ver replica_memoria.py)
+REPLICA_MEMORIA = os.environ.get('PORTAL_REPLICA_MEMORIA', '0') == '1'
+
+# Escritor único: escritas que chegam dentro da janela são confirmadas num único COMMIT
+GROUP_COMMIT_JANELA_MS = float(os.environ.get('PORTAL_GROUP_COMMIT_MS', 2))
+GROUP_COMMIT_MAXIMO = int(os.environ.get('PORTAL_GROUP_COMMIT_MAXIMO', 64))  # escritas por transação
+
+# Instrumentação de queries
+SLOW_QUERY_MS = float(os.environ.get('PORTAL_SLOW_QUERY_MS', 100))
+SLOW_QUERY_LOG = os.environ.get('PORTAL_SLOW_QUERY_LOG', 'slow_queries.log')
+N_MAIS_UM_LIMITE = int(os.environ.get('PORTAL_N_MAIS_UM_LIMITE', 3))  # repetições do mesmo formato de query
+PERFIS_MAXIMOS = 50  # perfis de requisições mantidos em memória
+CONSULTOR_INDICES = os.environ.get('PORTAL_CONSULTOR_INDICES', '1') != '0'  # EXPLAIN de cada formato novo
+
+logger = logging.getLogger('portal')
+slow_query_logger = logging.getLogger('portal.slow_queries')
+
+def _configurar_slow_query_log():
+    """Direciona o log de queries lentas para o arquivo configurado"""
+    if SLOW_QUERY_LOG and not slow_query_logger.handlers:
+        handler = logging.FileHandler(SLOW_QUERY_LOG, encoding='utf-8', delay=True)
+        handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+        slow_query_logger.addHandler(handler)
+        slow_query_logger.setLevel(logging.INFO)
+
+_configurar_slow_query_log()
+
+# Planos de execução de cada formato de query (consultados em /debug/indices)
+consultor_indices = ConsultorIndices()
+
+_RE_ESPACOS = re.compile(r'\s+')
+_RE_LITERAIS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+_RE_ESCRITA = re.compile(r'^\s*(?:INSERT|UPDATE|DELETE|REPLACE)\b', re.IGNORECASE)
+
+def normalizar_sql(query):
+    """Normaliza o SQL (espaços e literais) para agrupar queries de mesmo formato"""
+    return _RE_LITERAIS.sub('?', _RE_ESPACOS.sub(' ', query).strip())
+
+def abrir_conexao(db_file, busy_timeout_ms=DB_BUSY_TIMEOUT_MS, somente_leitura=False):
+    """Abre uma conexão com transações explícitas e aplica os PRAGMAs de desempenho
+    
+    somente_leitura=True abre o arquivo pela URI file:...?mode=ro; o SQLite
+    recusa qualquer escrita nessa conexão. db_file também pode ser uma URI
+    (a réplica em memória), usada como está.
+    """
+    destino, uri = db_file, db_file.startswith('file:')
+    if somente_leitura and not uri:
+        destino, uri = pathlib.Path(db_file).resolve().as_uri() + '?mode=ro', True
+    conn = sqlite3.connect(destino, uri=uri, timeout=busy_timeout_ms / 1000, check_same_thread=False,
+                           isolation_level=None)  # Transações controladas explicitamente
+    pragmas = SQLITE_PRAGMAS_LEITURA if somente_leitura else SQLITE_PRAGMAS
+    conn.row_factory = sqlite3.Row  # Permite acesso por nome de coluna
+    for pragma, valor in pragmas:
+        conn.execute(f"PRAGMA {pragma} = {valor}")
+    return conn
+
+class DatabaseBusyError(sqlite3.OperationalError):
+    """Banco continuou bloqueado depois de todas as retentativas"""
+
+def banco_bloqueado(erro):
+    """Indica se o erro é de lock (database is locked / busy), que pode passar sozinho"""
+    mensagem = str(erro).lower()
+    return isinstance(erro, sqlite3.OperationalError) and ('locked' in mensagem or 'busy' in mensagem)
+
+class LockWaitMetrics:
+    """Contadores e histograma de esperas por lock, separados por rota"""
+    
+    def __init__(self, baldes=BALDES_ESPERA_MS):
+        self.baldes = baldes
+        self._rotas = {}
+        self._lock = threading.Lock()
+    
+    def _rota(self, rota):
+        return self._rotas.setdefault(rota or '-', {
+            'esperas': 0,
+            'espera_total_ms': 0.0,
+            'espera_maxima_ms': 0.0,
+            'histograma': [0] * (len(self.baldes) + 1),
+            'bloqueios': 0,
+            'retentativas': 0,
+            'desistencias': 0
+        })
+    
+    def registrar_espera(self, rota, espera_ms):
+        """Tempo gasto aguardando um lock (com ou sem sucesso)"""
+        balde = next((i for i, limite in enumerate(self.baldes) if espera_ms <= limite), len(self.baldes))
+        with self._lock:
+            metricas = self._rota(rota)
+            metricas['esperas'] += 1
+            metricas['espera_total_ms'] += espera_ms
+            metricas['espera_maxima_ms'] = max(metricas['espera_maxima_ms'], espera_ms)
+            metricas['histograma'][balde] += 1
+    
+    def registrar_bloqueio(self, rota, retentou):
+        """Operação que recebeu 'database is locked' (retentada ou abandonada)"""
+        with self._lock:
+            metricas = self._rota(rota)
+            metricas['bloqueios'] += 1
+            metricas['retentativas' if retentou else 'desistencias'] += 1
+    
+    def estatisticas(self):
+        """Métricas por rota, com o histograma rotulado pelos limites em ms"""
+        limites = list(self.baldes) + [None]  # None = acima do último limite
+        with self._lock:
+            return {
+                rota: dict(metricas,
+                           espera_total_ms=round(metricas['espera_total_ms'], 3),
+                           espera_maxima_ms=round(metricas['espera_maxima_ms'], 3),
+                           espera_media_ms=round(metricas['espera_total_ms'] / metricas['esperas'], 3)
+                           if metricas['esperas'] else 0,
+                           histograma=[{'ate_ms': limite, 'quantidade': quantidade}
+                                       for limite, quantidade in zip(limites, metricas['histograma'])])
+                for rota, metricas in self._rotas.items()
+            }
+
+# Esperas por lock do SQLite (consultadas em /api/estatisticas/bloqueios)
+metricas_bloqueio = LockWaitMetrics()
+
+def com_retentativas(funcao, rota=None, registrar_esperas=True):
+    """Executa funcao() repetindo, com backoff exponencial e jitter, enquanto o banco estiver bloqueado
+    
+    Use apenas com operações idempotentes (leituras, BEGIN): a função pode rodar mais de uma vez.
+    Com registrar_esperas=False quem chama mede a espera total por conta própria.
+    """
+    for tentativa in range(DB_RETENTATIVAS + 1):
+        inicio = time.perf_counter()
+        try:
+            return funcao()
+        except sqlite3.OperationalError as e:
+            if not banco_bloqueado(e):
+                raise
+            if registrar_esperas:
+                metricas_bloqueio.registrar_espera(rota, (time.perf_counter() - inicio) * 1000)
+            if tentativa == DB_RETENTATIVAS:
+                metricas_bloqueio.registrar_bloqueio(rota, retentou=False)
+                raise DatabaseBusyError(
+                    'Banco de dados ocupado; tente novamente em instantes') from e
+            metricas_bloqueio.registrar_bloqueio(rota, retentou=True)
+            # Full jitter: espalha as retentativas de quem bloqueou junto
+            limite = min(DB_BACKOFF_MAXIMO_MS, DB_BACKOFF_BASE_MS * 2 ** tentativa)
+            time.sleep(random.uniform(0, limite) / 1000)
+
+class ConnectionPool:
+    """Pool limitado de conexões SQLite de longa duração, já configuradas"""
+    
+    def __init__(self, db_file, max_conexoes=DB_POOL_SIZE, timeout=DB_POOL_TIMEOUT, somente_leitura=False):
+        self.db_file = db_file
+        self.max_conexoes = max_conexoes
+        self.timeout = timeout
+        self.somente_leitura = somente_leitura
+        self._livres = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._abertas = 0
+        self._checkouts = 0
+        self._esperas = 0
+        self._em_uso = 0
+        self._encerrado = False  # close_all(): conexões devolvidas depois disso são fechadas
+    
+    def _abrir_conexao(self):
+        """Abre uma nova conexão e aplica os PRAGMAs de desempenho"""
+        return abrir_conexao(self.db_file, somente_leitura=self.somente_leitura)
+    
+    def acquire(self):
+        """Retira uma conexão do pool (abre uma nova se ainda houver vaga)"""
+        try:
+            conn = self._livres.get_nowait()
+        except queue.Empty:
+            conn = None
+            with self._lock:
+                if self._abertas < self.max_conexoes:
+                    self._abertas += 1
+                    abrir = True
+                else:
+                    self._esperas += 1
+                    abrir = False
+            if abrir:
+                try:
+                    conn = self._abrir_conexao()
+                except Exception:
+                    with self._lock:
+                        self._abertas -= 1
+                    raise
+            else:
+                try:
+                    conn = self._livres.get(timeout=self.timeout)
+                except queue.Empty:
+                    raise RuntimeError('Tempo esgotado aguardando conexão livre no pool') from None
+        
+        with self._lock:
+            self._checkouts += 1
+            self._em_uso += 1
+        return conn
+    
+    def release(self, conn):
+        """Devolve a conexão ao pool, descartando transações pendentes
+        
+        Conexões inutilizáveis, ou devolvidas depois de close_all(), são
+        fechadas (um pool encerrado não mantém a réplica antiga viva).
+        """
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            inutilizavel = False
+        except sqlite3.Error:
+            inutilizavel = True
+        
+        with self._lock:
+            self._em_uso -= 1
+            if not (inutilizavel or self._encerrado):
+                self._livres.put(conn)
+                return
+            self._abertas -= 1
+        conn.close()
+    
+    @contextmanager
+    def connection(self):
+        """Context manager que garante a devolução da conexão ao pool"""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+    
+    def close_all(self):
+        """Encerra o pool: fecha as conexões livres e, ao serem devolvidas, as em uso"""
+        with self._lock:
+            self._encerrado = True
+        while True:
+            try:
+                conn = self._livres.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._abertas -= 1
+    
+    def estatisticas(self):
+        """Retorna as estatísticas de uso do pool"""
+        with self._lock:
+            return {
+                'db_file': self.db_file,
+                'somente_leitura': self.somente_leitura,
+                'max_conexoes': self.max_conexoes,
+                'conexoes_abertas': self._abertas,
+                'conexoes_em_uso': self._em_uso,
+                'conexoes_livres': self._livres.qsize(),
+                'checkouts': self._checkouts,
+                'esperas': self._esperas
+            }
+
+class _Escrita:
+    """Escrita enfileirada aguardando o COMMIT do lote em que foi incluída"""
+    
+    __slots__ = ('funcao', 'rota', 'replicar', 'resultado', 'erro', 'concluida')
+    
+    def __init__(self, funcao, rota=None, replicar=None):
+        self.funcao = funcao
+        self.rota = rota
+        self.replicar = replicar  # repetição sem instrumentação, aplicada na réplica
+        self.resultado = None
+        self.erro = None
+        self.concluida = threading.Event()
+
+class WriterQueue:
+    """Thread única que executa todas as escritas, com group commit
+    
+    Cada escrita roda em um SAVEPOINT próprio (a falha de uma não desfaz as
+    outras) e o lote inteiro é confirmado com um único COMMIT. Quem enviou a
+    escrita só recebe o resultado depois que o COMMIT do lote terminou e,
+    com a réplica em memória ativa, depois que o lote foi repetido nela.
+    """
+    
+    def __init__(self, db_file, janela_ms=GROUP_COMMIT_JANELA_MS, maximo=GROUP_COMMIT_MAXIMO, replica=None):
+        self.db_file = db_file
+        self.replica = replica
+        self._lock_lote = threading.Lock()  # pausar() impede lotes enquanto a réplica é comparada/recarregada
+        self.janela = janela_ms / 1000
+        self.maximo = maximo
+        self._fila = queue.Queue()
+        self._lock = threading.Lock()
+        self._lotes = 0
+        self._escritas = 0
+        self._falhas = 0
+        self._maior_lote = 0
+        self._thread = threading.Thread(target=self._executar, name='portal-escritor', daemon=True)
+        self._thread.start()
+    
+    def submeter(self, funcao, rota=None, replicar=None):
+        """Executa funcao(conn) na thread do escritor e aguarda o COMMIT"""
+        escrita = _Escrita(funcao, rota, replicar)
+        self._fila.put(escrita)
+        escrita.concluida.wait()
+        if escrita.erro is not None:
+            raise escrita.erro
+        return escrita.resultado
+    
+    @contextmanager
+    def pausado(self):
+        """Bloco em que nenhum lote é confirmado (arquivo e réplica ficam parados)"""
+        with self._lock_lote:
+            yield
+    
+    def encerrar(self):
+        """Termina a thread depois das escritas já enfileiradas"""
+        self._fila.put(None)
+        self._thread.join()
+    
+    def _proximo_lote(self, primeira):
+        """Junta à primeira escrita as que já estão na fila ou chegam dentro da janela"""
+        lote = [primeira]
+        prazo = time.perf_counter() + self.janela
+        while len(lote) < self.maximo:
+            restante = prazo - time.perf_counter()
+            try:
+                escrita = self._fila.get(timeout=restante) if restante > 0 else self._fila.get_nowait()
+            except queue.Empty:
+                break
+            if escrita is None:
+                self._fila.put(None)  # encerrar depois deste lote
+                break
+            lote.append(escrita)
+        return lote
+    
+    def _executar(self):
+        conn = abrir_conexao(self.db_file)
+        try:
+            while True:
+                primeira = self._fila.get()
+                if primeira is None:
+                    break
+                lote = self._proximo_lote(primeira)
+                with self._lock_lote:
+                    self._confirmar_lote(conn, lote)
+        finally:
+            conn.close()
+    
+    def _iniciar_lote(self, conn, lote):
+        """BEGIN IMMEDIATE com retentativas; a espera pelo lock conta para a rota de cada escrita"""
+        inicio = time.perf_counter()
+        try:
+            com_retentativas(lambda: conn.execute('BEGIN IMMEDIATE'), lote[0].rota, registrar_esperas=False)
+        finally:
+            espera_ms = (time.perf_counter() - inicio) * 1000
+            for escrita in lote:
+                metricas_bloqueio.registrar_espera(escrita.rota, espera_ms)
+    
+    def _confirmar_lote(self, conn, lote):
+        try:
+            self._iniciar_lote(conn, lote)
+            for escrita in lote:
+                conn.execute('SAVEPOINT escrita')
+                try:
+                    escrita.resultado = escrita.funcao(conn)
+                except Exception as e:
+                    conn.execute('ROLLBACK TO escrita')
+                    escrita.erro = e
+                conn.execute('RELEASE escrita')
+            conn.execute('COMMIT')
+        except Exception as e:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            for escrita in lote:
+                if escrita.erro is None:
+                    escrita.erro = e
+        else:
+            self._replicar(lote)
+        finally:
+            with self._lock:
+                self._lotes += 1
+                self._escritas += len(lote)
+                self._falhas += sum(1 for escrita in lote if escrita.erro is not None)
+                self._maior_lote = max(self._maior_lote, len(lote))
+            for escrita in lote:
+                escrita.concluida.set()
+    
+    def _replicar(self, lote):
+        """Repete na réplica em memória as escritas do lote já confirmadas no arquivo"""
+        self.replicar([escrita.replicar for escrita in lote if escrita.erro is None])
+    
+    def replicar(self, repeticoes):
+        """Repete na réplica em memória escritas já confirmadas no arquivo
+        
+        None na lista indica escrita sem repetição conhecida: a réplica é
+        copiada do arquivo. Fora da thread do escritor, chame com o escritor
+        pausado desde antes do COMMIT, para a réplica receber as escritas na
+        mesma ordem do arquivo.
+        """
+        if self.replica is None or not repeticoes:
+            return
+        try:
+            if any(repeticao is None for repeticao in repeticoes):
+                self.replica.carregar()
+            else:
+                self.replica.aplicar(repeticoes)
+        except Exception:
+            logger.exception("Falha ao replicar lote na réplica em memória")
+    
+    def estatisticas(self):
+        """Retorna as estatísticas do escritor"""
+        with self._lock:
+            return {
+                'janela_ms': self.janela * 1000,
+                'maximo_por_lote': self.maximo,
+                'pendentes': self._fila.qsize(),
+                'lotes': self._lotes,
+                'escritas': self._escritas,
+                'falhas': self._falhas,
+                'maior_lote': self._maior_lote,
+                'media_por_lote': round(self._escritas / self._lotes, 2) if self._lotes else 0
+            }
+
+class DatabaseSession:
+    """Unidade de trabalho: uma conexão e uma transação compartilhadas
+    
+    escrita=True reserva o lock de escrita já no BEGIN (transaction() fora de
+    requisições); snapshot=False dispensa a transação de leitura, para que
+    a requisição enxergue o que o escritor acabou de confirmar.
+    
+    Sem snapshot (requisições de escrita) a sessão não agrupa as escritas:
+    cada uma é confirmada pelo escritor único quando execute_query retorna, e
+    um erro depois dela na mesma requisição não a desfaz. Escritas que só
+    valem juntas vão num bloco DatabaseManager.transaction().
+    """
+    
+    def __init__(self, pool, escrita=False, snapshot=True):
+        self.pool = pool
+        self.conn = pool.acquire()
+        self.escrita = escrita
+        self._savepoints = 0
+        # Escritas locais (transaction()) e a repetição de cada uma, para a réplica em memória
+        self.repeticoes = []
+        self._alteracoes_base = self.conn.total_changes
+        self._alteracoes_registradas = 0
+        try:
+            # Leituras usam um snapshot único; escritas reservam o lock logo no início
+            if escrita:
+                com_retentativas(lambda: self.conn.execute('BEGIN IMMEDIATE'))
+            elif snapshot:
+                self.conn.execute('BEGIN')
+        except Exception:
+            pool.release(self.conn)
+            raise
+    
+    @property
+    def escrita_local(self):
+        """Escritas devem rodar na própria conexão (transação explícita em andamento)"""
+        return self.escrita or self._savepoints > 0
+    
+    def commit(self):
+        """Confirma a transação da sessão"""
+        if self.conn.in_transaction:
+            self.conn.execute('COMMIT')
+    
+    def rollback(self):
+        """Desfaz a transação da sessão"""
+        if self.conn.in_transaction:
+            self.conn.execute('ROLLBACK')
+    
+    def registrar_escrita(self, executar, repeticao):
+        """Executa uma escrita na conexão da sessão e guarda a repetição dela"""
+        antes = self.conn.total_changes
+        try:
+            resultado = executar()
+            self.repeticoes.append(repeticao)
+        finally:
+            self._alteracoes_registradas += self.conn.total_changes - antes
+        return resultado
+    
+    def retirar_repeticoes(self):
+        """Repetições das escritas locais registradas até aqui (para WriterQueue.replicar)
+        
+        Termina com None se a conexão foi alterada fora de execute_query.
+        """
+        repeticoes = self.repeticoes
+        if self.conn.total_changes - self._alteracoes_base != self._alteracoes_registradas:
+            repeticoes.append(None)
+        self.repeticoes = []
+        self._alteracoes_base = self.conn.total_changes
+        self._alteracoes_registradas = 0
+        return repeticoes
+    
+    @contextmanager
+    def transaction(self):
+        """Bloco atômico dentro da sessão (implementado com SAVEPOINT)
+        
+        Numa sessão sem transação aberta (requisições de escrita) o bloco
+        externo reserva o lock de escrita (BEGIN IMMEDIATE) e confirma no fim.
+        """
+        propria = not self.conn.in_transaction
+        if propria:
+            com_retentativas(lambda: self.conn.execute('BEGIN IMMEDIATE'))
+        self._savepoints += 1
+        nome = f"sp_{self._savepoints}"
+        registradas = (len(self.repeticoes), self._alteracoes_registradas, self.conn.total_changes)
+        confirmar = False
+        try:
+            self.conn.execute(f"SAVEPOINT {nome}")
+            try:
+                yield self.conn
+            except Exception:
+                self.conn.execute(f"ROLLBACK TO {nome}")
+                self.conn.execute(f"RELEASE {nome}")
+                # O que o bloco alterou foi desfeito: nada a repetir na réplica
+                quantidade, alteracoes, total = registradas
+                del self.repeticoes[quantidade:]
+                self._alteracoes_registradas = alteracoes + self.conn.total_changes - total
+                raise
+            else:
+                self.conn.execute(f"RELEASE {nome}")
+            confirmar = True
+        finally:
+            self._savepoints -= 1
+            if propria and self.conn.in_transaction:
+                self.conn.execute('COMMIT' if confirmar else 'ROLLBACK')
+    
+    def close(self, erro=None):
+        """Encerra a sessão (commit se não houve erro) e devolve a conexão ao pool"""
+        try:
+            if erro is None:
+                self.commit()
+            else:
+                self.rollback()
+        finally:
+            self.pool.release(self.conn)
+
+# Sessões abertas fora de uma requisição Flask (scripts, threads auxiliares)
+_sessao_local = threading.local()
+
 class DatabaseManager:
     """Gerenciador de conexões com o banco SQLite"""
     
+    _pool = None
+    _pool_leitura = None
+    _pool_lock = threading.Lock()
+    _writer = None
+    _replica = None
+    _origens = {}  # id(conexão) -> pool de onde saiu (get_connection/release_connection)
+    
+    @staticmethod
+    def get_pool(leitura=False):
+        """Obtém o pool de conexões (recriado se DB_FILE mudar)
+        
+        leitura=True devolve a pista de leitura: conexões somente leitura,
+        separadas das usadas pelas requisições de escrita.
+        """
+        atributo = '_pool_leitura' if leitura else '_pool'
+        destino = DB_FILE
+        if leitura:
+            replica = DatabaseManager.get_replica()
+            if replica is not None:
+                destino = replica.uri  # muda a cada recarga da réplica
+        pool = getattr(DatabaseManager, atributo)
+        if pool is None or pool.db_file != destino:
+            with DatabaseManager._pool_lock:
+                pool = getattr(DatabaseManager, atributo)
+                if pool is None or pool.db_file != destino:
+                    if pool is not None:
+                        pool.close_all()
+                    if leitura:
+                        pool = ConnectionPool(destino, DB_POOL_LEITURA_SIZE, somente_leitura=True)
+                    else:
+                        pool = ConnectionPool(destino)
+                    setattr(DatabaseManager, atributo, pool)
+        return pool
+    
+    @staticmethod
+    def get_writer():
+        """Obtém o escritor único (recriado se DB_FILE mudar)"""
+        writer = DatabaseManager._writer
+        if writer is None or writer.db_file != DB_FILE:
+            replica = DatabaseManager.get_replica()
+            with DatabaseManager._pool_lock:
+                writer = DatabaseManager._writer
+                if writer is None or writer.db_file != DB_FILE:
+                    if writer is not None:
+                        writer.encerrar()
+                    writer = WriterQueue(DB_FILE, replica=replica)
+                    DatabaseManager._writer = writer
+        return writer
+    
+    @staticmethod
+    def get_replica():
+        """Réplica em memória do arquivo (None com PORTAL_REPLICA_MEMORIA desligado)"""
+        if not REPLICA_MEMORIA:
+            return None
+        replica = DatabaseManager._replica
+        if replica is None or replica.db_file != DB_FILE:
+            with DatabaseManager._pool_lock:
+                replica = DatabaseManager._replica
+                if replica is None or replica.db_file != DB_FILE:
+                    replica = ReplicaMemoria(DB_FILE, busy_timeout=DB_BUSY_TIMEOUT_MS / 1000)
+                    DatabaseManager._replica = replica
+        return replica
+    
+    @staticmethod
+    def ressincronizar_replica():
+        """Recarrega a réplica do arquivo com o escritor parado"""
+        replica = DatabaseManager.get_replica()
+        if replica is not None:
+            with DatabaseManager.get_writer().pausado():
+                replica.carregar()
+        return replica
+    
+    @staticmethod
+    def verificar_replica():
+        """Compara arquivo e réplica com o escritor parado; retorna (consistente, tabelas)"""
+        replica = DatabaseManager.get_replica()
+        with DatabaseManager.get_writer().pausado():
+            conn_arquivo = abrir_conexao(DB_FILE, somente_leitura=True)
+            conn_replica = replica.conectar()
+            try:
+                return comparar(conn_arquivo, conn_replica)
+            finally:
+                conn_arquivo.close()
+                conn_replica.close()
+    
     @staticmethod
     def get_connection():
-        """Obtém conexão com o banco"""
-        conn = sqlite3.connect(DB_FILE)
-        conn.row_factory = sqlite3.Row  # Permite acesso por nome de coluna
+        """Obtém conexão do pool (devolver com release_connection)"""
+        pool = DatabaseManager.get_pool()
+        conn = pool.acquire()
+        DatabaseManager._origens[id(conn)] = pool
         return conn
     
+    @staticmethod
+    def release_connection(conn):
+        """Devolve uma conexão obtida com get_connection ao pool de onde ela saiu"""
+        pool = DatabaseManager._origens.pop(id(conn), None) or DatabaseManager.get_pool()
+        pool.release(conn)
+    
+    @staticmethod
+    def pool_stats(leitura=False):
+        """Estatísticas do pool de conexões (ou da pista de leitura)"""
+        return DatabaseManager.get_pool(leitura).estatisticas()
+    
+    @staticmethod
+    def writer_stats():
+        """Estatísticas do escritor único (group commit)"""
+        return DatabaseManager.get_writer().estatisticas()
+    
+    @staticmethod
+    def current_session():
+        """Sessão ativa: a da requisição Flask ou a aberta por transaction()"""
+        if has_request_context() and 'db_session' in g:
+            return g.db_session
+        return getattr(_sessao_local, 'sessao', None)
+    
+    @staticmethod
+    def begin_request_session(leitura=True):
+        """Abre a sessão da requisição atual e a guarda em flask.g
+        
+        Requisições de leitura usam a pista somente leitura com um snapshot
+        único; as de escrita leem sem snapshot para enxergar o que o escritor
+        acabou de confirmar, e cada escrita delas é confirmada ao executar
+        (atomicidade entre várias escritas: transaction()).
+        """
+        pool = DatabaseManager.get_pool(leitura=leitura)
+        g.db_session = DatabaseSession(pool, snapshot=leitura)
+        return g.db_session
+    
+    @staticmethod
+    def end_request_session(erro=None):
+        """Encerra a sessão da requisição atual (se houver)"""
+        sessao = g.pop('db_session', None)
+        if sessao is not None:
+            sessao.close(erro)
+    
+    @staticmethod
+    @contextmanager
+    def transaction():
+        """Transação explícita para escritas com vários comandos
+        
+        Dentro de uma sessão vira um SAVEPOINT; fora dela abre uma
+        transação própria (BEGIN IMMEDIATE) usada por todas as queries do bloco.
+        O bloco externo pausa o escritor único até o COMMIT e então repete na
+        réplica em memória as escritas do bloco, antes do próximo lote.
+        """
+        sessao = DatabaseManager.current_session()
+        if sessao is not None and sessao.conn.in_transaction:
+            # Bloco aninhado: confirma (e é replicado) junto com a transação externa
+            with sessao.transaction() as conn:
+                yield conn
+            return
+        
+        writer = DatabaseManager.get_writer()
+        with writer.pausado():
+            if sessao is not None:
+                with sessao.transaction() as conn:
+                    yield conn
+                repeticoes = sessao.retirar_repeticoes()  # o SAVEPOINT externo já confirmou
+            else:
+                sessao = DatabaseSession(DatabaseManager.get_pool(), escrita=True)
+                _sessao_local.sessao = sessao
+                erro = None
+                try:
+                    yield sessao.conn
+                    repeticoes = sessao.retirar_repeticoes()
+                except BaseException as e:
+                    erro = e
+                    raise
+                finally:
+                    _sessao_local.sessao = None
+                    sessao.close(erro)
+            writer.replicar(repeticoes)
+    
+    @staticmethod
+    def _contexto_query():
+        """Rota, caminho e perfil da requisição atual (capturados antes de trocar de thread)"""
+        if has_request_context():
+            return request.endpoint, request.path, g.get('db_queries')
+        return None, '-', None
+    
+    @staticmethod
+    def _executar(conn, query, params, fetch_one, fetch_all, contexto=None):
+        """Executa a query na conexão informada, registra o tempo e formata o resultado"""
+        inicio = time.perf_counter()
+        cursor = conn.cursor()
+        if params:
+            cursor.execute(query, params)
+        else:
+            cursor.execute(query)
+        
+        if fetch_one:
+            result = cursor.fetchone()
+            resultado = dict(result) if result else None
+            linhas = 1 if result else 0
+        elif fetch_all:
+            results = cursor.fetchall()
+            resultado = [dict(row) for row in results] if results else []
+            linhas = len(resultado)
+        else:
+            resultado = cursor.lastrowid
+            linhas = max(cursor.rowcount, 0)
+        
+        duracao_ms = (time.perf_counter() - inicio) * 1000
+        DatabaseManager._registrar_query(conn, query, params, linhas, duracao_ms, contexto)
+        return resultado
+    
+    @staticmethod
+    def _registrar_query(conn, query, params, linhas, duracao_ms, contexto=None):
+        """Guarda a query no perfil da requisição e no log de queries lentas"""
+        rota, caminho, db_queries = contexto or DatabaseManager._contexto_query()
+        sql = normalizar_sql(query)
+        if CONSULTOR_INDICES:
+            consultor_indices.observar(conn, query, params, sql, rota)
+        if db_queries is not None:
+            db_queries.append({
+                'sql': sql,
+                'params': len(params) if params else 0,
+                'linhas': linhas,
+                'ms': round(duracao_ms, 3)
+            })
+        
+        if duracao_ms >= SLOW_QUERY_MS:
+            try:
+                plano = conn.execute(f"EXPLAIN QUERY PLAN {query}", params or ()).fetchall()
+                plano_texto = ' | '.join(row[3] for row in plano)
+            except sqlite3.Error as e:
+                plano_texto = f"(plano indisponível: {e})"
+            slow_query_logger.info("%.1fms rota=%s linhas=%d sql=%s plano=%s",
+                                   duracao_ms, caminho, linhas, sql, plano_texto)
+    
     @staticmethod
     def execute_query(query, params=None, fetch_one=False, fetch_all=False):
-        """Executa uma query no banco"""
-        conn = DatabaseManager.get_connection()
+        """Executa uma query no banco
+        
+        Escritas (INSERT/UPDATE/DELETE) vão para o escritor único e retornam
+        depois do COMMIT do lote (cada uma é sua própria unidade de trabalho),
+        exceto dentro de transaction(), onde rodam na conexão da transação e
+        são confirmadas ou desfeitas juntas. Leituras com uma sessão ativa usam a conexão
+        da sessão; sem sessão usam uma conexão do pool em modo autocommit.
+        Leituras que encontram o banco bloqueado são repetidas com backoff.
+        """
+        sessao = DatabaseManager.current_session()
+        contexto = DatabaseManager._contexto_query()
+        escrita = _RE_ESCRITA.match(query)
+        if escrita and (sessao is None or not sessao.escrita_local):
+            return DatabaseManager.get_writer().submeter(
+                lambda conn: DatabaseManager._executar(conn, query, params, fetch_one, fetch_all, contexto),
+                contexto[0],
+                replicar=lambda conn: conn.execute(query, params or ()))
+        
+        def executar():
+            if sessao is not None:
+                return DatabaseManager._executar(sessao.conn, query, params, fetch_one, fetch_all, contexto)
+            with DatabaseManager.get_pool().connection() as conn:
+                return DatabaseManager._executar(conn, query, params, fetch_one, fetch_all, contexto)
+        
+        if escrita:
+            # Dentro de transaction(): sem retentativas (o lock já é da transação); a
+            # repetição vai para a réplica em memória quando o bloco externo confirmar
+            return sessao.registrar_escrita(executar, lambda conn: conn.execute(query, params or ()))
+        return com_retentativas(executar, contexto[0])
+
+    @staticmethod
+    def iter_query(query, params=None, tamanho_lote=500):
+        """Itera o resultado de uma query em lotes (fetchmany), sem carregar tudo em memória"""
+        sessao = DatabaseManager.current_session()
+        if sessao is not None:
+            yield from DatabaseManager._iterar(sessao.conn, query, params, tamanho_lote)
+            return
+        
+        with DatabaseManager.get_pool().connection() as conn:
+            yield from DatabaseManager._iterar(conn, query, params, tamanho_lote)
+    
+    @staticmethod
+    def _iterar(conn, query, params, tamanho_lote):
+        inicio = time.perf_counter()
+        cursor = conn.execute(query, params or ())
+        linhas = 0
         try:
-            cursor = conn.cursor()
-            if params:
-                cursor.execute(query, params)
-            else:
-                cursor.execute(query)
-            
-            if fetch_one:
-                result = cursor.fetchone()
-                return dict(result) if result else None
-            elif fetch_all:
-                results = cursor.fetchall()
-                return [dict(row) for row in results] if results else []
-            else:
-                conn.commit()
-                return cursor.lastrowid
+            while True:
+                lote = cursor.fetchmany(tamanho_lote)
+                if not lote:
+                    break
+                linhas += len(lote)
+                for row in lote:
+                    yield dict(row)
         finally:
-            conn.close()
+            cursor.close()
+            DatabaseManager._registrar_query(conn, query, params, linhas,
+                                             (time.perf_counter() - inicio) * 1000)
 
-def horas_para_hm(horas_decimais):
-    """Converte horas decimais para formato HH:MM"""
-    if horas_decimais == 0:
-        return "0h 0min"
-    
-    horas = int(horas_decimais)
-    # Usar round() em vez de int() para arredondar corretamente os minutos
-    minutos = round((horas_decimais - horas) * 60)
-    
-    # Ajustar quando minutos chegam a 60 devido ao arredondamento
-    if minutos >= 60:
-        horas += 1
-        minutos = 0
+# Perfis das últimas requisições (consultados em /debug/queries)
+_perfis_requisicoes = deque(maxlen=PERFIS_MAXIMOS)
+_perfis_lock = threading.Lock()
+
+def montar_perfil_queries(queries, duracao_total_ms):
+    """Resume as queries de uma requisição e aponta padrões N+1"""
+    contagem = Counter(q['sql'] for q in queries)
+    repetidas = [
+        {'sql': sql, 'vezes': vezes}
+        for sql, vezes in contagem.most_common()
+        if vezes >= N_MAIS_UM_LIMITE
+    ]
+    return {
+        'rota': request.endpoint,
+        'metodo': request.method,
+        'caminho': request.full_path.rstrip('?'),
+        'momento': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'total_queries': len(queries),
+        'tempo_db_ms': round(sum(q['ms'] for q in queries), 3),
+        'tempo_total_ms': round(duracao_total_ms, 3),
+        'suspeitas_n_mais_um': repetidas,
+        'queries': queries
+    }
+
+# Métodos HTTP que só leem dados
+METODOS_LEITURA = ('GET', 'HEAD', 'OPTIONS')
+
+@app.before_request
+def abrir_sessao_banco():
+    """Abre uma conexão única para toda a requisição (e o snapshot das leituras)"""
+    if request.endpoint in (None, 'static'):
+        return
+    g.db_queries = []
+    g.inicio_requisicao = time.perf_counter()
+    if request.method in METODOS_LEITURA:
+        # Antes do snapshot: escrita invalidada depois disso não deixa o cálculo no cache
+        g.marca_cache = cache_relatorios.marcar()
+    DatabaseManager.begin_request_session(leitura=request.method in METODOS_LEITURA)
+
+@app.after_request
+def confirmar_sessao_banco(response):
+    """Confirma a transação antes de enviar a resposta (erros de commit viram 500)
+    
+    Respostas transmitidas (stream_template) ainda leem do banco enquanto o
+    corpo é enviado: a sessão continua aberta, no mesmo snapshot, e o
+    teardown a encerra e registra o perfil completo no fim da transmissão
+    (sem Server-Timing, que sai antes dessas queries).
+    """
+    transmitida = response.is_streamed
+    sessao = g.get('db_session')
+    if sessao is not None and not transmitida:
+        if response.status_code >= 500:
+            sessao.rollback()
+        else:
+            sessao.commit()
     
-    if horas > 0 and minutos > 0:
-        return f"{horas}h {minutos}min"
-    elif horas > 0:
-        return f"{horas}h"
+    if 'db_queries' in g and request.endpoint != 'debug_queries':
+        if transmitida:
+            g.perfil_pendente = True
+        else:
+            perfil = registrar_perfil_requisicao()
+            response.headers['Server-Timing'] = (
+                f'db;dur={perfil["tempo_db_ms"]:.2f};desc="{perfil["total_queries"]} queries", '
+                f'app;dur={perfil["tempo_total_ms"]:.2f}'
+            )
+    return response
+
+def registrar_perfil_requisicao():
+    """Fecha o perfil de queries da requisição atual (aviso de N+1 e /debug/queries)"""
+    perfil = montar_perfil_queries(g.db_queries, (time.perf_counter() - g.inicio_requisicao) * 1000)
+    for repetida in perfil['suspeitas_n_mais_um']:
+        logger.warning("Possível N+1 em %s: %dx %s", perfil['rota'], repetida['vezes'], repetida['sql'])
+    with _perfis_lock:
+        _perfis_requisicoes.append(perfil)
+    return perfil
+
+@app.teardown_request
+def encerrar_sessao_banco(erro=None):
+    """Desfaz o que não foi confirmado e devolve a conexão ao pool"""
+    DatabaseManager.end_request_session(erro)
+    if g.pop('perfil_pendente', False):
+        registrar_perfil_requisicao()  # resposta transmitida: inclui as queries do corpo
+
+@app.errorhandler(DatabaseBusyError)
+def banco_ocupado(erro):
+    """Banco bloqueado mesmo após as retentativas: 503 com Retry-After em vez de erro genérico"""
+    logger.warning("Banco ocupado em %s: %s", request.endpoint, erro)
+    if request.path.startswith('/api/'):
+        resposta = jsonify({'erro': str(erro)})
     else:
-        return f"{minutos}min"
+        resposta = app.response_class(str(erro), mimetype='text/plain')
+    resposta.status_code = 503
+    resposta.headers['Retry-After'] = '1'
+    return resposta
+
+def inicializar_banco():
+    """Aplica as migrações pendentes antes de atender requisições"""
+    aplicadas = aplicar_migracoes(DB_FILE)
+    if aplicadas:
+        logger.info("Migrações aplicadas: %s", ', '.join(str(v) for v in aplicadas))
+        consultor_indices.limpar()
+    if REPLICA_MEMORIA:
+        if CACHE_RELATORIOS_BACKEND == 'sqlite':
+            # Cache compartilhado = vários processos; cada um teria uma réplica que não vê os outros
+            raise RuntimeError('PORTAL_REPLICA_MEMORIA=1 exige um único processo do portal '
+                               '(incompatível com PORTAL_CACHE_BACKEND=sqlite)')
+        # Carrega a réplica antes da primeira requisição (já com o esquema migrado)
+        if aplicadas:
+            DatabaseManager.ressincronizar_replica()
+        else:
+            DatabaseManager.get_replica()
+    return aplicadas
 
-# Registrar filtro personalizado
-app.jinja_env.filters['horas_hm'] = horas_para_hm
+# Registrar filtros personalizados
+app.jinja_env.filters['minutos_hm'] = minutos_para_hm
+app.jinja_env.filters['hora_min'] = minutos_para_hora
 
 def calcular_periodo_fechamento(data_referencia=None):
     """
@@ -133,53 +1072,101 @@ def obter_mes_fechamento_de_data(data):
     _, _, mes_fechamento, ano_fechamento = calcular_periodo_fechamento(data_obj)
     return mes_fechamento, ano_fechamento
 
-def calcular_horas_extras(horas_trabalhadas, horas_normais=8):
-    """Calcula horas extras baseado nas horas trabalhadas no dia"""
-    if horas_trabalhadas > horas_normais:
-        return horas_trabalhadas - horas_normais
-    return 0
-
 def calcular_total_mensal_fechamento(funcionario_id, mes_fechamento, ano_fechamento):
     """
     Calcula o total de horas trabalhadas e extras no período de fechamento
     (do dia 26 do mês anterior até o dia 25 do mês de fechamento)
-    """
-    # Calcular as datas do período de fechamento
-    if mes_fechamento == 1:
-        data_inicio = f"{ano_fechamento - 1}-12-26"
-        data_fim = f"{ano_fechamento}-01-25"
-    else:
-        data_inicio = f"{ano_fechamento}-{mes_fechamento-1:02d}-26"
-        data_fim = f"{ano_fechamento}-{mes_fechamento:02d}-25"
     
+    Lê a linha já agregada de resumo_fechamento, mantida pelos triggers de registros_ponto.
+    """
     query = """
-        SELECT 
-            SUM(horas_trabalhadas) as total_horas,
-            SUM(horas_extras) as total_extras,
-            COUNT(*) as dias_trabalhados
-        FROM registros_ponto 
-        WHERE funcionario_id = ? AND data >= ? AND data <= ?
+        SELECT total_minutos, minutos_extras, minutos_normais, dias_trabalhados,
+               valor_horas_normais, valor_horas_extras
+        FROM resumo_fechamento 
+        WHERE funcionario_id = ? AND periodo_ano = ? AND periodo_mes = ?
     """
-    result = DatabaseManager.execute_query(query, (funcionario_id, data_inicio, data_fim), fetch_one=True)
+    result = DatabaseManager.execute_query(query, (funcionario_id, ano_fechamento, mes_fechamento), fetch_one=True)
     
     if result:
-        return {
-            'total_horas': result['total_horas'] or 0,
-            'total_extras': result['total_extras'] or 0,
-            'dias_trabalhados': result['dias_trabalhados'] or 0
-        }
+        return result
     return {
-        'total_horas': 0,
-        'total_extras': 0,
-        'dias_trabalhados': 0
+        'total_minutos': 0,
+        'minutos_extras': 0,
+        'minutos_normais': 0,
+        'dias_trabalhados': 0,
+        'valor_horas_normais': 0,
+        'valor_horas_extras': 0
     }
 
+def calcular_totais_periodos(funcionario_id, periodos):
+    """
+    Totais de vários períodos de fechamento de um funcionário em uma única query
+    
+    Args:
+        periodos: iterável de tuplas (ano_fechamento, mes_fechamento)
+    
+    Returns:
+        list: dicts com mes, ano, total_minutos, minutos_extras e dias_trabalhados,
+              do período mais recente para o mais antigo
+    """
+    periodos = sorted(set(periodos), reverse=True)
+    if not periodos:
+        return []
+    
+    valores = ', '.join(['(?, ?)'] * len(periodos))
+    query = f"""
+        SELECT periodo_mes as mes, periodo_ano as ano,
+               total_minutos, minutos_extras, dias_trabalhados
+        FROM resumo_fechamento 
+        WHERE funcionario_id = ? AND (periodo_ano, periodo_mes) IN (VALUES {valores})
+        ORDER BY periodo_ano DESC, periodo_mes DESC
+    """
+    params = [funcionario_id]
+    for ano, mes in periodos:
+        params.extend((ano, mes))
+    return DatabaseManager.execute_query(query, params, fetch_all=True)
+
+def consultar_banco_horas(funcionario_id, inicio, fim):
+    """
+    Banco de horas do funcionário entre duas datas ('AAAA-MM-DD', inclusive)
+    
+    Duas buscas na soma de prefixo de banco_horas, mantida pelos triggers de
+    registros_ponto: o custo não cresce com o histórico.
+    
+    Returns:
+        dict: inicio, fim, saldo_anterior_minutos (antes de inicio),
+              minutos_extras (no intervalo) e saldo_minutos (até fim)
+    """
+    result = DatabaseManager.execute_query(SQL_SALDO_ENTRE, (funcionario_id, inicio, funcionario_id, fim),
+                                           fetch_one=True)
+    return {
+        'inicio': inicio,
+        'fim': fim,
+        'saldo_anterior_minutos': result['saldo_anterior_minutos'],
+        'minutos_extras': result['saldo_minutos'] - result['saldo_anterior_minutos'],
+        'saldo_minutos': result['saldo_minutos']
+    }
+
+def saldos_banco_horas(funcionario_id, datas):
+    """Saldo acumulado do banco de horas em cada data com registro, em uma única query"""
+    datas = sorted(set(datas))
+    if not datas:
+        return {}
+    
+    marcadores = ', '.join(['?'] * len(datas))
+    query = f"""
+        SELECT data, saldo_minutos FROM banco_horas
+        WHERE funcionario_id = ? AND data IN ({marcadores})
+    """
+    linhas = DatabaseManager.execute_query(query, [funcionario_id] + datas, fetch_all=True)
+    return {linha['data']: linha['saldo_minutos'] for linha in linhas}
+
 def calcular_total_mensal(funcionario_id, mes, ano):
     """Calcula o total de horas trabalhadas e extras no mês (função original mantida para compatibilidade)"""
     query = """
         SELECT 
-            SUM(horas_trabalhadas) as total_horas,
-            SUM(horas_extras) as total_extras,
+            SUM(minutos_trabalhados) as total_minutos,
+            SUM(minutos_extras) as minutos_extras,
             COUNT(*) as dias_trabalhados
         FROM registros_ponto 
         WHERE funcionario_id = ? AND mes = ? AND ano = ?
@@ -188,103 +1175,297 @@ def calcular_total_mensal(funcionario_id, mes, ano):
     
     if result:
         return {
-            'total_horas': result['total_horas'] or 0,
-            'total_extras': result['total_extras'] or 0,
+            'total_minutos': result['total_minutos'] or 0,
+            'minutos_extras': result['minutos_extras'] or 0,
             'dias_trabalhados': result['dias_trabalhados'] or 0
         }
     return {
-        'total_horas': 0,
-        'total_extras': 0,
+        'total_minutos': 0,
+        'minutos_extras': 0,
         'dias_trabalhados': 0
     }
 
+# Cache dos dados das páginas de relatório, invalidado pelas rotas de escrita
+CACHE_RELATORIOS_TTL = float(os.environ.get('PORTAL_CACHE_TTL', 300))  # segundos
+CACHE_RELATORIOS_MAXIMO = int(os.environ.get('PORTAL_CACHE_MAXIMO', 256))  # entradas
+# 'memoria' (por processo) ou 'sqlite' (arquivo compartilhado entre os processos do portal)
+CACHE_RELATORIOS_BACKEND = os.environ.get('PORTAL_CACHE_BACKEND', 'memoria')
+CACHE_RELATORIOS_ARQUIVO = os.environ.get('PORTAL_CACHE_ARQUIVO', 'cache_relatorios.db')
+
+# Versão do código e dos templates: um deploy muda o HTML mesmo sem mudar os dados
+_VERSAO_PAGINAS = str(max(
+    int(caminho.stat().st_mtime)
+    for caminho in [pathlib.Path(__file__)] + list(pathlib.Path(app.root_path, 'templates').glob('*.html'))
+))
+
+cache_relatorios = criar_cache(CACHE_RELATORIOS_BACKEND, CACHE_RELATORIOS_MAXIMO, CACHE_RELATORIOS_TTL,
+                               arquivo=CACHE_RELATORIOS_ARQUIVO, versao=_VERSAO_PAGINAS)
+
+# Tags de invalidação do cache de relatórios
+TAG_FUNCIONARIOS = 'funcionarios'  # cadastro/lista de funcionários
+TAG_GASTOS = 'gastos'
+
+def obter_relatorio(chave, calcular):
+    """Contexto em cache ou calculado, validado pela marca tirada antes do snapshot da requisição"""
+    return cache_relatorios.obter_ou_calcular(chave, calcular, marca=g.get('marca_cache'))
+
+def tag_funcionario(funcionario_id):
+    """Tag dos registros e do cadastro de um funcionário"""
+    return f'funcionario:{funcionario_id}'
+
+# Tempo de vida da contagem de funcionários ativos usada na paginação
+CONTAGEM_TTL = 60  # segundos
+_contagem_funcionarios = {'valor': None, 'expira': 0.0}
+
+def contar_funcionarios_ativos():
+    """Total de funcionários ativos, mantido em cache por CONTAGEM_TTL segundos"""
+    agora = time.monotonic()
+    if _contagem_funcionarios['valor'] is None or agora >= _contagem_funcionarios['expira']:
+        result = DatabaseManager.execute_query(
+            "SELECT COUNT(*) as total FROM funcionarios WHERE ativo = 1", fetch_one=True)
+        _contagem_funcionarios['valor'] = result['total'] if result else 0
+        _contagem_funcionarios['expira'] = agora + CONTAGEM_TTL
+    return _contagem_funcionarios['valor']
+
+def invalidar_contagem_funcionarios():
+    """Descarta a contagem em cache (chamar ao incluir/remover funcionários)"""
+    _contagem_funcionarios['valor'] = None
+
+def contar_registros_funcionario(funcionario_id):
+    """Total de registros de ponto do funcionário, somado do resumo por período"""
+    query = "SELECT COALESCE(SUM(dias_trabalhados), 0) as total FROM resumo_fechamento WHERE funcionario_id = ?"
+    result = DatabaseManager.execute_query(query, (funcionario_id,), fetch_one=True)
+    return result['total'] if result else 0
+
+def codificar_cursor(direcao, chave, pagina):
+    """Gera o cursor opaco usado nas URLs de paginação"""
+    dados = json.dumps([direcao, chave, pagina], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(dados).decode('ascii').rstrip('=')
+
+def decodificar_cursor(cursor):
+    """Lê um cursor de paginação; retorna None se estiver ausente ou inválido"""
+    if not cursor:
+        return None
+    try:
+        dados = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        direcao, chave, pagina = json.loads(dados)
+    except (ValueError, TypeError):
+        return None
+    if direcao not in ('n', 'p', 'u') or not isinstance(chave, list) or not isinstance(pagina, int):
+        return None
+    return direcao, chave, pagina
+
+class KeysetPaginator:
+    """Paginação por chave (seek): a página N custa o mesmo que a página 1
+    
+    As linhas são ordenadas pelas colunas de `colunas` (todas na mesma direção,
+    a última deve ser única) e cada página continua a partir da chave da última
+    linha da página anterior, em vez de usar OFFSET. O cursor 'n' avança, 'p'
+    volta e 'u' vai para a última página.
+    """
+    
+    def __init__(self, colunas, per_page, total, cursor=None, descendente=False, pagina_offset=None):
+        self.colunas = colunas
+        self.per_page = per_page
+        self.total = total
+        self.descendente = descendente
+        self.total_pages = (total + per_page - 1) // per_page  # Ceiling division
+        self.pagina_offset = None
+        
+        decodificado = decodificar_cursor(cursor)
+        if decodificado:
+            self.direcao, self.chave, self.page = decodificado
+        else:
+            # Sem cursor: primeira página ou URL antiga /page/<n> (via OFFSET)
+            self.direcao, self.chave, self.page = None, None, 1
+            if pagina_offset and pagina_offset > 1:
+                self.pagina_offset = pagina_offset
+                self.page = pagina_offset
+    
+    def _ordem(self, invertida=False):
+        desc = self.descendente != invertida
+        return ', '.join(f"{c} {'DESC' if desc else 'ASC'}" for c in self.colunas)
+    
+    def sql(self, query_base, params=()):
+        """Completa a query base (que já tem WHERE) com o filtro da chave, ORDER BY e LIMIT"""
+        params = list(params)
+        colunas = ', '.join(self.colunas)
+        marcadores = ', '.join(['?'] * len(self.colunas))
+        
+        if self.direcao == 'u':
+            resto = self.total - (self.total_pages - 1) * self.per_page
+            return f"{query_base} ORDER BY {self._ordem(invertida=True)} LIMIT ?", params + [max(resto, 1)]
+        
+        if self.direcao in ('n', 'p') and len(self.chave) == len(self.colunas):
+            avancar = self.direcao == 'n'
+            operador = '<' if self.descendente == avancar else '>'
+            query = f"{query_base} AND ({colunas}) {operador} ({marcadores}) ORDER BY {self._ordem(invertida=not avancar)} LIMIT ?"
+            return query, params + list(self.chave) + [self.per_page + 1]
+        
+        query = f"{query_base} ORDER BY {self._ordem()} LIMIT ?"
+        params.append(self.per_page + 1)
+        if self.pagina_offset:
+            query += " OFFSET ?"
+            params.append((self.pagina_offset - 1) * self.per_page)
+        return query, params
+    
+    def _chave(self, linha):
+        return [linha[c.split('.')[-1]] for c in self.colunas]
+    
+    def paginar(self, linhas):
+        """Recebe o resultado de sql() e retorna (linhas da página, informações de paginação)"""
+        if self.direcao == 'u':
+            linhas = list(reversed(linhas))
+            has_prev, has_next = self.total > len(linhas), False
+        elif self.direcao == 'p':
+            has_prev = len(linhas) > self.per_page
+            linhas = list(reversed(linhas[:self.per_page]))
+            has_next = True
+        else:
+            has_next = len(linhas) > self.per_page
+            linhas = linhas[:self.per_page]
+            has_prev = self.page > 1
+        
+        page = self.total_pages if self.direcao == 'u' else self.page
+        has_prev = has_prev and bool(linhas)
+        has_next = has_next and bool(linhas)
+        
+        pagination_info = {
+            'page': page,
+            'per_page': self.per_page,
+            'total': self.total,
+            'total_pages': self.total_pages,
+            'has_prev': has_prev,
+            'has_next': has_next,
+            'prev_cursor': codificar_cursor('p', self._chave(linhas[0]), page - 1) if has_prev else None,
+            'next_cursor': codificar_cursor('n', self._chave(linhas[-1]), page + 1) if has_next else None,
+            'last_cursor': codificar_cursor('u', [], self.total_pages) if page < self.total_pages else None
+        }
+        return linhas, pagination_info
+
+def versoes_dados(tabelas):
+    """Versão e momento da última alteração de cada tabela (versoes_dados, mantida por triggers)"""
+    marcadores = ', '.join(['?'] * len(tabelas))
+    query = f"SELECT tabela, versao, alterado_em FROM versoes_dados WHERE tabela IN ({marcadores}) ORDER BY tabela"
+    return DatabaseManager.execute_query(query, tabelas, fetch_all=True)
+
+def resposta_condicional(*tabelas, chave_extra=None):
+    """ETag/Last-Modified da rota a partir das versões das tabelas que ela lê
+
+    Se o If-None-Match (ou If-Modified-Since) do navegador ainda vale, a rota
+    nem é executada: a resposta é um 304 sem corpo. Com mensagens flash
+    pendentes a página é sempre renderizada, senão a mensagem se perderia.
+    
+    chave_extra: função sem argumentos cujo valor também entra no ETag, para
+    rotas que dependem de mais que as tabelas (ex.: o período de fechamento
+    de hoje). Essas rotas não enviam Last-Modified, que não muda quando só a
+    chave muda.
+    """
+    def decorador(view):
+        @wraps(view)
+        def responder(*args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or session.get('_flashes'):
+                return view(*args, **kwargs)
+            
+            versoes = versoes_dados(tabelas)
+            partes = [_VERSAO_PAGINAS, request.full_path] + [f"{v['tabela']}={v['versao']}" for v in versoes]
+            if chave_extra is not None:
+                partes.append(str(chave_extra()))
+            etag = hashlib.sha1('|'.join(partes).encode('utf-8')).hexdigest()
+            alterado_em = max((v['alterado_em'] for v in versoes), default=None)
+            if alterado_em and chave_extra is None:
+                alterado_em = datetime.strptime(alterado_em, '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+            else:
+                alterado_em = None
+            
+            if not is_resource_modified(request.environ, etag=etag, last_modified=alterado_em):
+                resposta = app.response_class(status=304)
+            else:
+                resposta = app.make_response(view(*args, **kwargs))
+                if resposta.status_code != 200:
+                    return resposta
+            resposta.set_etag(etag)
+            if alterado_em is not None:
+                resposta.last_modified = alterado_em  # None viraria "agora" no werkzeug
+            resposta.headers['Cache-Control'] = 'no-cache'  # sempre revalidar
+            return resposta
+        return responder
+    return decorador
+
+def chave_periodo_atual():
+    """Período de fechamento de hoje, para o ETag de páginas que mostram o período atual"""
+    _, _, mes, ano = calcular_periodo_fechamento()
+    return f"periodo={ano}-{mes:02d}"
+
 @app.route('/')
 @app.route('/page/<int:page>')
+@resposta_condicional('funcionarios')
 def index(page=1):
-    """Página inicial com paginação"""
+    """Página inicial com paginação por cursor"""
     per_page = 6  # 6 funcionários por página
-    offset = (page - 1) * per_page
     
-    # Contar total de funcionários ativos
-    count_query = "SELECT COUNT(*) as total FROM funcionarios WHERE ativo = 1"
-    total_result = DatabaseManager.execute_query(count_query, fetch_one=True)
-    total_funcionarios = total_result['total'] if total_result else 0
-    
-    # Buscar funcionários com limit e offset
-    query = "SELECT * FROM funcionarios WHERE ativo = 1 ORDER BY nome LIMIT ? OFFSET ?"
-    funcionarios_list = DatabaseManager.execute_query(query, (per_page, offset), fetch_all=True)
+    paginator = KeysetPaginator(['nome'], per_page, contar_funcionarios_ativos(),
+                                cursor=request.args.get('cursor'), pagina_offset=page)
+    query, params = paginator.sql("SELECT * FROM funcionarios WHERE ativo = 1")
+    funcionarios_list, pagination_info = paginator.paginar(
+        DatabaseManager.execute_query(query, params, fetch_all=True))
     
     # Converter lista para dicionário no formato esperado pelo template
     funcionarios = {f['nome']: f for f in funcionarios_list}
     
-    # Calcular informações de paginação
-    total_pages = (total_funcionarios + per_page - 1) // per_page  # Ceiling division
-    has_prev = page > 1
-    has_next = page < total_pages
-    prev_page = page - 1 if has_prev else None
-    next_page = page + 1 if has_next else None
-    
-    pagination_info = {
-        'page': page,
-        'per_page': per_page,
-        'total': total_funcionarios,
-        'total_pages': total_pages,
-        'has_prev': has_prev,
-        'has_next': has_next,
-        'prev_page': prev_page,
-        'next_page': next_page
-    }
-    
     return render_template('index.html', funcionarios=funcionarios, pagination=pagination_info)
 
 @app.route('/relatorios')
 @app.route('/relatorios/page/<int:page>')
+@resposta_condicional('funcionarios', 'registros_ponto')
 def relatorios(page=1):
-    """Página de relatórios gerais com paginação"""
+    """Página de relatórios gerais com paginação por cursor"""
+    cursor = request.args.get('cursor')
+    contexto = obter_relatorio(
+        ('relatorios', page, cursor), lambda: calcular_relatorios(page, cursor))
+    return render_template('relatorios.html', **contexto)
+
+def calcular_relatorios(page, cursor):
+    """Contexto da página de relatórios e as tags de cache de que ele depende"""
     per_page = 6  # 6 funcionários por página
-    offset = (page - 1) * per_page
     
-    # Contar total de funcionários ativos
-    count_query = "SELECT COUNT(*) as total FROM funcionarios WHERE ativo = 1"
-    total_result = DatabaseManager.execute_query(count_query, fetch_one=True)
-    total_funcionarios = total_result['total'] if total_result else 0
+    paginator = KeysetPaginator(['nome'], per_page, contar_funcionarios_ativos(),
+                                cursor=cursor, pagina_offset=page)
+    query, params = paginator.sql("SELECT * FROM funcionarios WHERE ativo = 1")
+    funcionarios_list, pagination_info = paginator.paginar(
+        DatabaseManager.execute_query(query, params, fetch_all=True))
+    
+    # Total de registros + 6 últimos períodos de fechamento (26 a 25) de todos os
+    # funcionários da página, em uma única query sobre o resumo por período
+    periodos_por_funcionario = {f['id']: [] for f in funcionarios_list}
+    totais_por_funcionario = {}
+    if funcionarios_list:
+        marcadores = ', '.join(['?'] * len(funcionarios_list))
+        query = f"""
+            SELECT funcionario_id, periodo_ano, periodo_mes, total_registros
+            FROM (
+                SELECT funcionario_id, periodo_ano, periodo_mes,
+                       SUM(dias_trabalhados) OVER (PARTITION BY funcionario_id) AS total_registros,
+                       ROW_NUMBER() OVER (PARTITION BY funcionario_id
+                                          ORDER BY periodo_ano DESC, periodo_mes DESC) AS ordem
+                FROM resumo_fechamento
+                WHERE funcionario_id IN ({marcadores})
+            )
+            WHERE ordem <= 6
+            ORDER BY funcionario_id, periodo_ano DESC, periodo_mes DESC
+        """
+        linhas = DatabaseManager.execute_query(query, [f['id'] for f in funcionarios_list], fetch_all=True)
+        for linha in linhas:
+            periodos_por_funcionario[linha['funcionario_id']].append((linha['periodo_ano'], linha['periodo_mes']))
+            totais_por_funcionario[linha['funcionario_id']] = linha['total_registros']
     
-    # Buscar funcionários com limit e offset
-    query = "SELECT * FROM funcionarios WHERE ativo = 1 ORDER BY nome LIMIT ? OFFSET ?"
-    funcionarios_list = DatabaseManager.execute_query(query, (per_page, offset), fetch_all=True)
+    meses_nomes = ['Janeiro', 'Fevereiro', 'Março', 'Abril', 'Maio', 'Junho',
+                   'Julho', 'Agosto', 'Setembro', 'Outubro', 'Novembro', 'Dezembro']
     
-    # Buscar dados resumidos para cada funcionário
     relatorios_data = []
     for funcionario in funcionarios_list:
-        # Total de registros
-        query_total = "SELECT COUNT(*) as total FROM registros_ponto WHERE funcionario_id = ?"
-        total_registros = DatabaseManager.execute_query(query_total, (funcionario['id'],), fetch_one=True)
-        
-        # Últimos períodos de fechamento (26 a 25)
-        query_meses = """
-            SELECT DISTINCT data
-            FROM registros_ponto 
-            WHERE funcionario_id = ? 
-            ORDER BY data DESC 
-            LIMIT 50
-        """
-        registros_recentes = DatabaseManager.execute_query(query_meses, (funcionario['id'],), fetch_all=True)
-        
-        # Calcular períodos únicos de fechamento
-        periodos_fechamento = set()
-        for registro in registros_recentes:
-            data_registro = datetime.strptime(registro['data'], '%Y-%m-%d').date()
-            mes_fechamento, ano_fechamento = obter_mes_fechamento_de_data(data_registro)
-            periodos_fechamento.add((ano_fechamento, mes_fechamento))
-        
-        # Converter para lista ordenada e pegar os 6 mais recentes
-        periodos_ordenados = sorted(list(periodos_fechamento), reverse=True)[:6]
-        
-        # Formatar períodos para exibição
-        meses_nomes = ['Janeiro', 'Fevereiro', 'Março', 'Abril', 'Maio', 'Junho',
-                       'Julho', 'Agosto', 'Setembro', 'Outubro', 'Novembro', 'Dezembro']
         meses_trabalhados = []
-        for ano, mes in periodos_ordenados:
+        for ano, mes in periodos_por_funcionario[funcionario['id']]:
             meses_trabalhados.append({
                 'mes_ano': f"{ano}-{mes:02d}",
                 'ano': str(ano),
@@ -294,32 +1475,16 @@ def relatorios(page=1):
         
         relatorios_data.append({
             'funcionario': funcionario,
-            'total_registros': total_registros['total'] if total_registros else 0,
+            'total_registros': totais_por_funcionario.get(funcionario['id'], 0),
             'meses_trabalhados': meses_trabalhados
         })
     
-    # Calcular informações de paginação
-    total_pages = (total_funcionarios + per_page - 1) // per_page  # Ceiling division
-    has_prev = page > 1
-    has_next = page < total_pages
-    prev_page = page - 1 if has_prev else None
-    next_page = page + 1 if has_next else None
-    
-    pagination_info = {
-        'page': page,
-        'per_page': per_page,
-        'total': total_funcionarios,
-        'total_pages': total_pages,
-        'has_prev': has_prev,
-        'has_next': has_next,
-        'prev_page': prev_page,
-        'next_page': next_page
-    }
-    
-    return render_template('relatorios.html', relatorios_data=relatorios_data, pagination=pagination_info)
+    tags = [TAG_FUNCIONARIOS] + [tag_funcionario(f['id']) for f in funcionarios_list]
+    return {'relatorios_data': relatorios_data, 'pagination': pagination_info}, tags
 
 @app.route('/funcionario/<nome>')
 @app.route('/funcionario/<nome>/page/<int:page>')
+@resposta_condicional('funcionarios', 'registros_ponto', chave_extra=chave_periodo_atual)
 def visualizar_funcionario(nome, page=1):
     """Visualiza os dados de um funcionário específico com paginação"""
     # Buscar funcionário
@@ -330,65 +1495,58 @@ def visualizar_funcionario(nome, page=1):
         flash('Funcionário não encontrado!', 'error')
         return redirect(url_for('index'))
     
-    # Paginação para registros
+    # Paginação por cursor (data, id) para registros
     per_page = 10  # 10 registros por página
-    offset = (page - 1) * per_page
     
-    # Contar total de registros
-    count_query = "SELECT COUNT(*) as total FROM registros_ponto WHERE funcionario_id = ?"
-    total_result = DatabaseManager.execute_query(count_query, (funcionario_data['id'],), fetch_one=True)
-    total_registros = total_result['total'] if total_result else 0
+    paginator = KeysetPaginator(['data', 'id'], per_page, contar_registros_funcionario(funcionario_data['id']),
+                                cursor=request.args.get('cursor'), descendente=True, pagina_offset=page)
+    query, params = paginator.sql("SELECT * FROM registros_ponto WHERE funcionario_id = ?", (funcionario_data['id'],))
+    registros, pagination_info = paginator.paginar(
+        DatabaseManager.execute_query(query, params, fetch_all=True))
     
-    # Buscar registros com paginação
-    query = """
-        SELECT * FROM registros_ponto 
-        WHERE funcionario_id = ? 
-        ORDER BY ano DESC, mes DESC, dia DESC
-        LIMIT ? OFFSET ?
-    """
-    registros = DatabaseManager.execute_query(query, (funcionario_data['id'], per_page, offset), fetch_all=True)
-    
-    # Calcular totais por mês
-    meses_anos = set((r['mes'], r['ano']) for r in registros)
-    totais_mensais = []
-    
-    for mes, ano in meses_anos:
-        total_mensal = calcular_total_mensal(funcionario_data['id'], mes, ano)
-        totais_mensais.append({
-            'mes': mes,
-            'ano': ano,
-            'total_horas': total_mensal['total_horas'],
-            'total_extras': total_mensal['total_extras'],
-            'dias_trabalhados': total_mensal['dias_trabalhados']
-        })
+    # Totais dos períodos de fechamento (26 a 25) presentes na página, em uma única query
+    periodos = {(r['periodo_ano'], r['periodo_mes']) for r in registros}
+    totais_mensais = calcular_totais_periodos(funcionario_data['id'], periodos)
     
-    totais_mensais.sort(key=lambda x: (x['ano'], x['mes']), reverse=True)
-    
-    # Calcular informações de paginação
-    total_pages = (total_registros + per_page - 1) // per_page  # Ceiling division
-    has_prev = page > 1
-    has_next = page < total_pages
-    prev_page = page - 1 if has_prev else None
-    next_page = page + 1 if has_next else None
-    
-    pagination_info = {
-        'page': page,
-        'per_page': per_page,
-        'total': total_registros,
-        'total_pages': total_pages,
-        'has_prev': has_prev,
-        'has_next': has_next,
-        'prev_page': prev_page,
-        'next_page': next_page
-    }
+    # Banco de horas: saldo até o fim do período atual, extras do período e saldo em cada dia da página
+    data_inicio, data_fim, _, _ = calcular_periodo_fechamento()
+    banco_horas = consultar_banco_horas(funcionario_data['id'], data_inicio.isoformat(), data_fim.isoformat())
+    saldos = saldos_banco_horas(funcionario_data['id'], [r['data'] for r in registros])
     
     return render_template('funcionario.html', 
                          nome=nome, 
                          registros=registros, 
                          totais_mensais=totais_mensais,
                          funcionario_data=funcionario_data,
+                         banco_horas=banco_horas,
+                         saldos=saldos,
                          pagination=pagination_info)
 
+@app.route('/api/banco_horas/<funcionario_nome>')
+@resposta_condicional('funcionarios', 'registros_ponto', chave_extra=chave_periodo_atual)
+def api_banco_horas(funcionario_nome):
+    """API com o banco de horas do funcionário
+    
+    Parâmetros opcionais ?inicio=AAAA-MM-DD&fim=AAAA-MM-DD; sem eles, o período
+    de fechamento atual. O saldo_minutos é o acumulado até fim.
+    """
+    query = "SELECT id FROM funcionarios WHERE nome = ?"
+    funcionario = DatabaseManager.execute_query(query, (funcionario_nome,), fetch_one=True)
+    if not funcionario:
+        return jsonify({'erro': 'Funcionário não encontrado'}), 404
+    
+    data_inicio, data_fim, _, _ = calcular_periodo_fechamento()
+    try:
+        inicio = datetime.strptime(request.args.get('inicio', data_inicio.isoformat()), '%Y-%m-%d').date()
+        fim = datetime.strptime(request.args.get('fim', data_fim.isoformat()), '%Y-%m-%d').date()
+    except ValueError:
+        return jsonify({'erro': 'Datas devem estar no formato AAAA-MM-DD'}), 400
+    if inicio > fim:
+        return jsonify({'erro': 'inicio deve ser anterior ou igual a fim'}), 400
+    
+    banco_horas = consultar_banco_horas(funcionario['id'], inicio.isoformat(), fim.isoformat())
+    return jsonify(dict(banco_horas, funcionario=funcionario_nome))
+
 @app.route('/adicionar_funcionario', methods=['GET', 'POST'])
 def adicionar_funcionario():
     """Adiciona um novo funcionário"""
@@ -413,6 +1571,8 @@ def adicionar_funcionario():
                 datetime.now().strftime('%Y-%m-%d')
             ))
             
+            invalidar_contagem_funcionarios()
+            cache_relatorios.invalidar(TAG_FUNCIONARIOS)
             flash(f'Funcionário {nome} adicionado com sucesso! Salário: R$ {salario_mensal:.2f}/mês - R$ {salario_hora:.2f}/hora', 'success')
             return redirect(url_for('index'))
             
@@ -440,30 +1600,18 @@ def registrar_horas():
             flash('Funcionário não encontrado!', 'error')
             return redirect(url_for('registrar_horas'))
         
-        # Converter para datetime para calcular horas
-        entrada = datetime.strptime(f"{data} {hora_entrada}", "%Y-%m-%d %H:%M")
-        saida_almoco = datetime.strptime(f"{data} {hora_saida_almoco}", "%Y-%m-%d %H:%M")
-        volta_almoco = datetime.strptime(f"{data} {hora_volta_almoco}", "%Y-%m-%d %H:%M")
-        saida = datetime.strptime(f"{data} {hora_saida}", "%Y-%m-%d %H:%M")
+        # Data do registro (dia/mês/ano e período de fechamento)
+        dia_registro = datetime.strptime(data, "%Y-%m-%d")
         
-        # Calcular horas trabalhadas (descontando o almoço)
-        periodo_manha = saida_almoco - entrada
-        periodo_tarde = saida - volta_almoco
+        # Horários e durações em minutos inteiros (calculo_ponto.py)
+        ponto = calcular_ponto(hora_entrada, hora_saida_almoco, hora_volta_almoco, hora_saida)
         
-        horas_manha = periodo_manha.total_seconds() / 3600
-        horas_tarde = periodo_tarde.total_seconds() / 3600
-        horas_trabalhadas = horas_manha + horas_tarde
-        
-        # Calcular tempo de almoço
-        tempo_almoco = volta_almoco - saida_almoco
-        tempo_almoco_horas = tempo_almoco.total_seconds() / 3600
-        
-        # Calcular horas extras (manter precisão máxima antes do arredondamento final)
-        horas_extras = calcular_horas_extras(horas_trabalhadas)
+        # Período de fechamento (26 a 25) gravado junto com o registro
+        periodo_mes, periodo_ano = obter_mes_fechamento_de_data(dia_registro)
         
         # VALIDAÇÃO: Verificar se já existe lançamento para esta data e funcionário
         query_verificacao = """
-            SELECT id, hora_entrada, hora_saida, horas_trabalhadas 
+            SELECT id, entrada_min, saida_min, minutos_trabalhados 
             FROM registros_ponto 
             WHERE funcionario_id = ? AND data = ?
         """
@@ -471,27 +1619,27 @@ def registrar_horas():
         
         if registro_existente:
             flash(f'❌ ERRO: Já existe lançamento de horas para {funcionario_nome} na data {data}!', 'error')
-            flash(f'📋 Registro existente: {registro_existente["hora_entrada"]} às {registro_existente["hora_saida"]} ({registro_existente["horas_trabalhadas"]:.2f}h)', 'warning')
+            flash(f'📋 Registro existente: {minutos_para_hora(registro_existente["entrada_min"])} às {minutos_para_hora(registro_existente["saida_min"])} ({minutos_para_hm(registro_existente["minutos_trabalhados"])})', 'warning')
             flash(f'💡 Para corrigir: Vá em "Funcionários" → "{funcionario_nome}" → Editar o registro da data {data}', 'info')
             return redirect(url_for('registrar_horas'))
         
         try:
-            # Inserir registro (arredondar apenas no final para manter precisão)
+            # Inserir registro (horários e durações em minutos inteiros)
             query = """
                 INSERT INTO registros_ponto 
-                (funcionario_id, data, dia, mes, ano, hora_entrada, hora_saida_almoco, 
-                 hora_volta_almoco, hora_saida, tempo_almoco, horas_trabalhadas, 
-                 horas_extras, data_registro)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                (funcionario_id, data, dia, mes, ano, entrada_min, saida_almoco_min, 
+                 volta_almoco_min, saida_min, minutos_almoco, minutos_trabalhados, 
+                 minutos_extras, data_registro, periodo_mes, periodo_ano)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             """
             DatabaseManager.execute_query(query, (
-                funcionario['id'], data, entrada.day, entrada.month, entrada.year,
-                hora_entrada, hora_saida_almoco, hora_volta_almoco, hora_saida,
-                round(tempo_almoco_horas, 4), round(horas_trabalhadas, 4), 
-                round(horas_extras, 4), datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                funcionario['id'], data, dia_registro.day, dia_registro.month, dia_registro.year,
+                *(ponto[coluna] for coluna in COLUNAS_PONTO),
+                datetime.now().strftime('%Y-%m-%d %H:%M:%S'), periodo_mes, periodo_ano
             ))
+            cache_relatorios.invalidar(tag_funcionario(funcionario['id']))
             
-            flash(f'✅ Horas registradas com sucesso para {funcionario_nome}! Total: {horas_trabalhadas:.2f}h, Extras: {horas_extras:.2f}h, Almoço: {tempo_almoco_horas:.2f}h', 'success')
+            flash(f'✅ Horas registradas com sucesso para {funcionario_nome}! Total: {minutos_para_hm(ponto["minutos_trabalhados"])}, Extras: {minutos_para_hm(ponto["minutos_extras"])}, Almoço: {minutos_para_hm(ponto["minutos_almoco"])}', 'success')
             return redirect(url_for('visualizar_funcionario', nome=funcionario_nome))
             
         except sqlite3.IntegrityError:
@@ -506,15 +1654,33 @@ def registrar_horas():
     return render_template('registrar_horas.html', funcionarios=funcionarios)
 
 @app.route('/relatorio_mensal/<funcionario_nome>/<int:mes>/<int:ano>')
+@resposta_condicional('funcionarios', 'registros_ponto')
 def relatorio_mensal(funcionario_nome, mes, ano):
     """Gera relatório mensal detalhado usando período de fechamento customizado (26 a 25)"""
+    # Períodos encerrados: HTML gerado no fechamento (relatorios_fechados.py), se não estiver sujo
+    if periodo_encerrado(mes, ano) and not session.get('_flashes'):
+        fechado = relatorio_fechado(funcionario_nome, mes, ano)
+        if fechado is not None:
+            return fechado['html']
+    
+    contexto = obter_relatorio(
+        ('relatorio_mensal', funcionario_nome, mes, ano),
+        lambda: calcular_relatorio_mensal(funcionario_nome, mes, ano))
+    
+    if contexto is None:
+        flash('Funcionário não encontrado!', 'error')
+        return redirect(url_for('index'))
+    
+    return render_template('relatorio_mensal.html', **contexto)
+
+def calcular_relatorio_mensal(funcionario_nome, mes, ano):
+    """Contexto do relatório mensal (None se o funcionário não existe) e suas tags de cache"""
     # Buscar funcionário
     query = "SELECT * FROM funcionarios WHERE nome = ?"
     funcionario_data = DatabaseManager.execute_query(query, (funcionario_nome,), fetch_one=True)
     
     if not funcionario_data:
-        flash('Funcionário não encontrado!', 'error')
-        return redirect(url_for('index'))
+        return None, ()
     
     # Calcular período de fechamento (26 do mês anterior até 25 do mês atual)
     from datetime import date
@@ -524,23 +1690,17 @@ def relatorio_mensal(funcionario_nome, mes, ano):
     # Buscar registros do período de fechamento
     query = """
         SELECT * FROM registros_ponto 
-        WHERE funcionario_id = ? AND data >= ? AND data <= ?
+        WHERE funcionario_id = ? AND periodo_ano = ? AND periodo_mes = ?
         ORDER BY data
     """
-    registros_mes = DatabaseManager.execute_query(query, (funcionario_data['id'], data_inicio.strftime('%Y-%m-%d'), data_fim.strftime('%Y-%m-%d')), fetch_all=True)
+    registros_mes = DatabaseManager.execute_query(query, (funcionario_data['id'], ano, mes), fetch_all=True)
     
     # Calcular totais usando a nova função de fechamento
     total_mensal = calcular_total_mensal_fechamento(funcionario_data['id'], mes, ano)
     
-    # Calcular valores monetários
-    valor_horas_normais = 0
-    valor_horas_extras = 0
-    
-    salario_hora = funcionario_data['salario_hora']
-    for registro in registros_mes:
-        horas_normais = min(registro['horas_trabalhadas'], 8)
-        valor_horas_normais += horas_normais * salario_hora
-        valor_horas_extras += registro['horas_extras'] * salario_hora * 1.5  # 50% adicional
+    # Valores monetários já calculados no resumo do período
+    valor_horas_normais = total_mensal['valor_horas_normais']
+    valor_horas_extras = total_mensal['valor_horas_extras']
     
     meses_nomes = ['Janeiro', 'Fevereiro', 'Março', 'Abril', 'Maio', 'Junho',
                    'Julho', 'Agosto', 'Setembro', 'Outubro', 'Novembro', 'Dezembro']
@@ -552,17 +1712,161 @@ def relatorio_mensal(funcionario_nome, mes, ano):
         'descricao': f"Período: {data_inicio.strftime('%d/%m/%Y')} a {data_fim.strftime('%d/%m/%Y')}"
     }
     
-    return render_template('relatorio_mensal.html',
-                         funcionario=funcionario_nome,
-                         mes=mes,
-                         ano=ano,
-                         mes_nome=meses_nomes[mes-1],
-                         registros=registros_mes,
-                         total=total_mensal,
-                         funcionario_data=funcionario_data,
-                         valor_horas_normais=valor_horas_normais,
-                         valor_horas_extras=valor_horas_extras,
-                         periodo=periodo_info)
+    contexto = {
+        'funcionario': funcionario_nome,
+        'mes': mes,
+        'ano': ano,
+        'mes_nome': meses_nomes[mes-1],
+        'registros': registros_mes,
+        'total': total_mensal,
+        'funcionario_data': funcionario_data,
+        'valor_horas_normais': valor_horas_normais,
+        'valor_horas_extras': valor_horas_extras,
+        'periodo': periodo_info
+    }
+    return contexto, [tag_funcionario(funcionario_data['id'])]
+
+@app.route('/api/relatorio_mensal/<funcionario_nome>/<int:mes>/<int:ano>')
+@resposta_condicional('funcionarios', 'registros_ponto')
+def api_relatorio_mensal(funcionario_nome, mes, ano):
+    """API com os dados do relatório mensal (do fechamento, em períodos encerrados)"""
+    if periodo_encerrado(mes, ano):
+        fechado = relatorio_fechado(funcionario_nome, mes, ano)
+        if fechado is not None:
+            return app.response_class(fechado['dados'], mimetype='application/json')
+    
+    contexto = obter_relatorio(
+        ('relatorio_mensal', funcionario_nome, mes, ano),
+        lambda: calcular_relatorio_mensal(funcionario_nome, mes, ano))
+    if contexto is None:
+        return jsonify({'erro': 'Funcionário não encontrado'}), 404
+    return jsonify(contexto)
+
+def periodo_encerrado(mes, ano):
+    """True se o período de fechamento (26 a 25) já terminou"""
+    _, _, mes_atual, ano_atual = calcular_periodo_fechamento()
+    return (ano, mes) < (ano_atual, mes_atual)
+
+def relatorio_fechado(funcionario_nome, mes, ano):
+    """HTML e JSON guardados no fechamento, ou None se ausentes, sujos ou de outra versão das páginas"""
+    query = """
+        SELECT rf.html, rf.dados FROM relatorios_fechados rf
+        JOIN funcionarios f ON f.id = rf.funcionario_id
+        WHERE f.nome = ? AND rf.periodo_ano = ? AND rf.periodo_mes = ?
+          AND rf.sujo = 0 AND rf.html IS NOT NULL AND rf.versao_paginas = ?
+    """
+    return DatabaseManager.execute_query(query, (funcionario_nome, ano, mes, _VERSAO_PAGINAS), fetch_one=True)
+
+# Relatórios gravados por transação no fechamento (o HTML do lote fica em memória até lá)
+RELATORIOS_FECHADOS_POR_TRANSACAO = 50
+
+def gravar_relatorios_fechados(gerados):
+    """Grava os relatórios gerados numa única transação (cada um só se a versão da linha não mudou)"""
+    if not gerados:
+        return
+    with DatabaseManager.transaction():
+        for relatorio in gerados:
+            DatabaseManager.execute_query("""
+                UPDATE relatorios_fechados
+                SET html = ?, dados = ?, sujo = 0, gerado_em = ?, versao_paginas = ?
+                WHERE funcionario_id = ? AND periodo_ano = ? AND periodo_mes = ? AND versao = ?
+            """, relatorio)
+
+def gerar_relatorios_fechados():
+    """Gera o HTML/JSON dos relatórios de períodos encerrados que faltam ou estão sujos
+    
+    Cada relatório é gravado só se a versão da linha não mudou durante a
+    geração; os alterados nesse meio tempo continuam sujos para a próxima.
+    Relatórios gerados por outra versão das páginas também são refeitos.
+    """
+    _, _, mes_atual, ano_atual = calcular_periodo_fechamento()
+    ano_ultimo, mes_ultimo = (ano_atual, mes_atual - 1) if mes_atual > 1 else (ano_atual - 1, 12)
+    
+    # Uma linha (ainda suja) para cada funcionário/período encerrado com registros
+    DatabaseManager.execute_query("""
+        INSERT OR IGNORE INTO relatorios_fechados (funcionario_id, periodo_ano, periodo_mes)
+        SELECT funcionario_id, periodo_ano, periodo_mes FROM resumo_fechamento
+        WHERE periodo_ano * 100 + periodo_mes <= ?
+    """, (ano_ultimo * 100 + mes_ultimo,))
+    
+    pendentes = DatabaseManager.execute_query("""
+        SELECT rf.funcionario_id, f.nome, rf.periodo_ano, rf.periodo_mes, rf.versao
+        FROM relatorios_fechados rf
+        JOIN funcionarios f ON f.id = rf.funcionario_id
+        WHERE rf.sujo = 1 OR rf.versao_paginas IS NOT ?
+        ORDER BY rf.periodo_ano, rf.periodo_mes, f.nome
+    """, (_VERSAO_PAGINAS,), fetch_all=True)
+    
+    gerados = []
+    for pendente in pendentes:
+        nome, mes, ano = pendente['nome'], pendente['periodo_mes'], pendente['periodo_ano']
+        # Contexto de requisição próprio: sem mensagens flash de quem disparou a geração
+        with app.test_request_context(f"/relatorio_mensal/{quote(nome)}/{mes}/{ano}"):
+            contexto, _ = calcular_relatorio_mensal(nome, mes, ano)
+            html = render_template('relatorio_mensal.html', **contexto)
+        gerados.append((html, json.dumps(contexto, ensure_ascii=False),
+                        datetime.now().strftime('%Y-%m-%d %H:%M:%S'), _VERSAO_PAGINAS,
+                        pendente['funcionario_id'], ano, mes, pendente['versao']))
+        if len(gerados) >= RELATORIOS_FECHADOS_POR_TRANSACAO:
+            gravar_relatorios_fechados(gerados)
+            gerados = []
+    gravar_relatorios_fechados(gerados)
+    
+    situacao = situacao_relatorios_fechados()
+    return {
+        'ultimo_periodo': f"{mes_ultimo:02d}/{ano_ultimo}",
+        'gerados': len(pendentes) - situacao['sujos'],
+        'ainda_sujos': situacao['sujos'],
+        **situacao
+    }
+
+def situacao_relatorios_fechados():
+    """Quantos relatórios de períodos encerrados estão prontos e quantos estão sujos (ou de outra versão)"""
+    result = DatabaseManager.execute_query("""
+        SELECT COALESCE(SUM(sujo = 0 AND versao_paginas IS ?), 0) AS prontos,
+               COALESCE(SUM(sujo = 1 OR versao_paginas IS NOT ?), 0) AS sujos
+        FROM relatorios_fechados
+    """, (_VERSAO_PAGINAS, _VERSAO_PAGINAS), fetch_one=True)
+    return {'prontos': result['prontos'], 'sujos': result['sujos']}
+
+@app.route('/folha')
+def folha_atual():
+    """Folha do período atual: redireciona para a URL do período (o ETag não depende da data de hoje)"""
+    _, _, mes, ano = calcular_periodo_fechamento()
+    return redirect(url_for('folha_periodo', mes=mes, ano=ano))
+
+@app.route('/folha/<int:mes>/<int:ano>')
+@resposta_condicional('funcionarios', 'registros_ponto')
+def folha_periodo(mes, ano):
+    """Folha de pagamento de todos os funcionários no período de fechamento"""
+    folha = calcular_folha_periodo(mes, ano)
+    
+    mes_anterior, ano_anterior = (mes - 1, ano) if mes > 1 else (12, ano - 1)
+    mes_seguinte, ano_seguinte = (mes + 1, ano) if mes < 12 else (1, ano + 1)
+    meses_nomes = ['Janeiro', 'Fevereiro', 'Março', 'Abril', 'Maio', 'Junho',
+                   'Julho', 'Agosto', 'Setembro', 'Outubro', 'Novembro', 'Dezembro']
+    data_inicio, data_fim, _, _ = calcular_periodo_fechamento(datetime(ano, mes, 25).date())
+    
+    return render_template('folha_periodo.html',
+                           folha=folha,
+                           mes=mes,
+                           ano=ano,
+                           mes_nome=meses_nomes[mes-1],
+                           periodo=f"{data_inicio.strftime('%d/%m/%Y')} a {data_fim.strftime('%d/%m/%Y')}",
+                           anterior={'mes': mes_anterior, 'ano': ano_anterior},
+                           seguinte={'mes': mes_seguinte, 'ano': ano_seguinte})
+
+@app.route('/api/folha/<int:mes>/<int:ano>')
+@resposta_condicional('funcionarios', 'registros_ponto')
+def api_folha_periodo(mes, ano):
+    """API com a folha de pagamento do período de fechamento"""
+    return jsonify(dict(calcular_folha_periodo(mes, ano), mes=mes, ano=ano))
+
+def calcular_folha_periodo(mes, ano):
+    """Folha do período: registros em uma query, agregados em colunas (folha_pagamento.py)"""
+    registros = DatabaseManager.execute_query(QUERY_REGISTROS, (ano, mes), fetch_all=True)
+    funcionarios = DatabaseManager.execute_query(QUERY_FUNCIONARIOS, (ano, mes), fetch_all=True)
+    return calcular_folha(registros, funcionarios)
 
 @app.route('/editar_funcionario/<nome>', methods=['GET', 'POST'])
 def editar_funcionario(nome):
@@ -593,6 +1897,7 @@ def editar_funcionario(nome):
             DatabaseManager.execute_query(query, (
                 novo_nome, cargo, salario_mensal, salario_hora, horas_mensais, desconto, funcionario_data['id']
             ))
+            cache_relatorios.invalidar(tag_funcionario(funcionario_data['id']), TAG_FUNCIONARIOS)
             
             flash(f'Funcionário {novo_nome} atualizado com sucesso!', 'success')
             return redirect(url_for('visualizar_funcionario', nome=novo_nome))
@@ -626,36 +1931,23 @@ def editar_registro(registro_id):
         
         data = registro['data']
         
-        # Recalcular horas
-        entrada = datetime.strptime(f"{data} {hora_entrada}", "%Y-%m-%d %H:%M")
-        saida_almoco = datetime.strptime(f"{data} {hora_saida_almoco}", "%Y-%m-%d %H:%M")
-        volta_almoco = datetime.strptime(f"{data} {hora_volta_almoco}", "%Y-%m-%d %H:%M")
-        saida = datetime.strptime(f"{data} {hora_saida}", "%Y-%m-%d %H:%M")
-        
-        periodo_manha = saida_almoco - entrada
-        periodo_tarde = saida - volta_almoco
-        
-        horas_manha = periodo_manha.total_seconds() / 3600
-        horas_tarde = periodo_tarde.total_seconds() / 3600
-        horas_trabalhadas = horas_manha + horas_tarde
-        
-        tempo_almoco = volta_almoco - saida_almoco
-        tempo_almoco_horas = tempo_almoco.total_seconds() / 3600
-        
-        horas_extras = calcular_horas_extras(horas_trabalhadas)
+        # Recalcular horários e durações em minutos
+        ponto = calcular_ponto(hora_entrada, hora_saida_almoco, hora_volta_almoco, hora_saida)
+        periodo_mes, periodo_ano = obter_mes_fechamento_de_data(data)
         
         # Atualizar registro
         query = """
             UPDATE registros_ponto 
-            SET hora_entrada = ?, hora_saida_almoco = ?, hora_volta_almoco = ?, hora_saida = ?,
-                tempo_almoco = ?, horas_trabalhadas = ?, horas_extras = ?, data_edicao = ?
+            SET entrada_min = ?, saida_almoco_min = ?, volta_almoco_min = ?, saida_min = ?,
+                minutos_almoco = ?, minutos_trabalhados = ?, minutos_extras = ?, data_edicao = ?,
+                periodo_mes = ?, periodo_ano = ?
             WHERE id = ?
         """
         DatabaseManager.execute_query(query, (
-            hora_entrada, hora_saida_almoco, hora_volta_almoco, hora_saida,
-            round(tempo_almoco_horas, 2), round(horas_trabalhadas, 2), round(horas_extras, 2),
-            datetime.now().strftime('%Y-%m-%d %H:%M:%S'), registro_id
+            *(ponto[coluna] for coluna in COLUNAS_PONTO),
+            datetime.now().strftime('%Y-%m-%d %H:%M:%S'), periodo_mes, periodo_ano, registro_id
         ))
+        cache_relatorios.invalidar(tag_funcionario(registro['funcionario_id']))
         
         flash('Registro atualizado com sucesso!', 'success')
         return redirect(url_for('visualizar_funcionario', nome=registro['funcionario_nome']))
@@ -672,7 +1964,7 @@ def excluir_registro(registro_id):
     """Exclui um registro de ponto"""
     # Buscar registro para obter nome do funcionário
     query = """
-        SELECT f.nome as funcionario_nome 
+        SELECT r.funcionario_id, f.nome as funcionario_nome 
         FROM registros_ponto r 
         JOIN funcionarios f ON r.funcionario_id = f.id 
         WHERE r.id = ?
@@ -683,6 +1975,7 @@ def excluir_registro(registro_id):
         # Excluir registro
         query = "DELETE FROM registros_ponto WHERE id = ?"
         DatabaseManager.execute_query(query, (registro_id,))
+        cache_relatorios.invalidar(tag_funcionario(registro['funcionario_id']))
         
         flash('Registro excluído com sucesso!', 'success')
         return redirect(url_for('visualizar_funcionario', nome=registro['funcionario_nome']))
@@ -690,6 +1983,17 @@ def excluir_registro(registro_id):
     flash('Registro não encontrado!', 'error')
     return redirect(url_for('index'))
 
+# Categorias e formas de pagamento dos gastos domésticos
+CATEGORIAS_GASTOS = ['Alimentação', 'Moradia', 'Transporte', 'Saúde', 'Lazer', 'Outros']
+FORMAS_PAGAMENTO = {
+    'dinheiro': 'Dinheiro',
+    'cartao_debito': 'Cartão de Débito',
+    'cartao_credito': 'Cartão de Crédito',
+    'pix': 'PIX',
+    'transferencia': 'Transferência',
+    'outros': 'Outros'
+}
+
 @app.route('/controle_financeiro')
 def controle_financeiro():
     """Página de controle financeiro - versão com dados reais"""
@@ -698,63 +2002,8 @@ def controle_financeiro():
         data_atual = datetime.now()
         inicio_mes = data_atual.replace(day=1).strftime('%Y-%m-%d')
         
-        # Query para gastos do mês
-        query_resumo = """
-            SELECT SUM(valor) as gastos_mes, COUNT(*) as num_transacoes
-            FROM gastos_domesticos 
-            WHERE data_gasto >= ?
-        """
-        resultado = DatabaseManager.execute_query(query_resumo, (inicio_mes,), fetch_one=True)
-        
-        gastos_mes = resultado['gastos_mes'] if resultado and resultado['gastos_mes'] else 0
-        num_transacoes = resultado['num_transacoes'] if resultado else 0
-        
-        # Orçamento fictício para demonstração (pode ser configurável no futuro)
-        orcamento_mensal = 5000.00
-        orcamento_restante = orcamento_mensal - gastos_mes
-        
-        # Query para categorias do mês
-        query_categorias = """
-            SELECT categoria, SUM(valor) as total
-            FROM gastos_domesticos 
-            WHERE data_gasto >= ?
-            GROUP BY categoria
-        """
-        categorias_db = DatabaseManager.execute_query(query_categorias, (inicio_mes,), fetch_all=True)
-        
-        # Mapear ícones por categoria
-        icones_categoria = {
-            'Alimentação': 'shopping-cart',
-            'Moradia': 'home',
-            'Transporte': 'car',
-            'Saúde': 'heartbeat',
-            'Lazer': 'gamepad',
-            'Outros': 'ellipsis-h'
-        }
-        
-        # Preparar categorias para exibição
-        categorias_todas = ['Alimentação', 'Moradia', 'Transporte', 'Saúde', 'Lazer', 'Outros']
-        categorias_resumo = []
-        
-        for categoria in categorias_todas:
-            total = 0
-            for cat_db in categorias_db:
-                if cat_db['categoria'] == categoria:
-                    total = cat_db['total']
-                    break
-            
-            categorias_resumo.append({
-                'nome': categoria,
-                'total': total,
-                'icon': icones_categoria.get(categoria, 'circle')
-            })
-        
-        resumo = {
-            'gastos_mes': gastos_mes,
-            'orcamento_restante': orcamento_restante,
-            'num_transacoes': num_transacoes,
-            'categorias': categorias_resumo
-        }
+        resumo = obter_relatorio(
+            ('controle_financeiro', inicio_mes), lambda: calcular_resumo_financeiro(inicio_mes))
         
         return render_template('controle_financeiro.html', resumo=resumo)
         
@@ -776,6 +2025,68 @@ def controle_financeiro():
         }
         return render_template('controle_financeiro.html', resumo=resumo)
 
+def calcular_resumo_financeiro(inicio_mes):
+    """Resumo financeiro do mês para o painel e as tags de cache de que ele depende"""
+    # Query para gastos do mês
+    query_resumo = """
+        SELECT SUM(valor) as gastos_mes, COUNT(*) as num_transacoes
+        FROM gastos_domesticos 
+        WHERE data_gasto >= ?
+    """
+    resultado = DatabaseManager.execute_query(query_resumo, (inicio_mes,), fetch_one=True)
+    
+    gastos_mes = resultado['gastos_mes'] if resultado and resultado['gastos_mes'] else 0
+    num_transacoes = resultado['num_transacoes'] if resultado else 0
+    
+    # Orçamento fictício para demonstração (pode ser configurável no futuro)
+    orcamento_mensal = 5000.00
+    orcamento_restante = orcamento_mensal - gastos_mes
+    
+    # Query para categorias do mês
+    query_categorias = """
+        SELECT categoria, SUM(valor) as total
+        FROM gastos_domesticos 
+        WHERE data_gasto >= ?
+        GROUP BY categoria
+    """
+    categorias_db = DatabaseManager.execute_query(query_categorias, (inicio_mes,), fetch_all=True)
+    
+    # Mapear ícones por categoria
+    icones_categoria = {
+        'Alimentação': 'shopping-cart',
+        'Moradia': 'home',
+        'Transporte': 'car',
+        'Saúde': 'heartbeat',
+        'Lazer': 'gamepad',
+        'Outros': 'ellipsis-h'
+    }
+    
+    # Preparar categorias para exibição
+    categorias_todas = ['Alimentação', 'Moradia', 'Transporte', 'Saúde', 'Lazer', 'Outros']
+    categorias_resumo = []
+    
+    for categoria in categorias_todas:
+        total = 0
+        for cat_db in categorias_db:
+            if cat_db['categoria'] == categoria:
+                total = cat_db['total']
+                break
+        
+        categorias_resumo.append({
+            'nome': categoria,
+            'total': total,
+            'icon': icones_categoria.get(categoria, 'circle')
+        })
+    
+    resumo = {
+        'gastos_mes': gastos_mes,
+        'orcamento_restante': orcamento_restante,
+        'num_transacoes': num_transacoes,
+        'categorias': categorias_resumo
+    }
+    
+    return resumo, [TAG_GASTOS]
+
 @app.route('/gastos/adicionar', methods=['GET', 'POST'])
 def adicionar_gasto():
     """Adicionar novo gasto doméstico"""
@@ -799,6 +2110,7 @@ def adicionar_gasto():
                 query, 
                 (descricao, categoria, valor, data_gasto, forma_pagamento, observacoes)
             )
+            cache_relatorios.invalidar(TAG_GASTOS)
             
             flash(f'Gasto "{descricao}" de R$ {valor:.2f} adicionado com sucesso!', 'success')
             return redirect(url_for('controle_financeiro'))
@@ -808,8 +2120,7 @@ def adicionar_gasto():
             return redirect(url_for('adicionar_gasto'))
     
     # Retorna formulário para adicionar gasto
-    categorias = ['Alimentação', 'Moradia', 'Transporte', 'Saúde', 'Lazer', 'Outros']
-    return render_template('adicionar_gasto.html', categorias=categorias)
+    return render_template('adicionar_gasto.html', categorias=CATEGORIAS_GASTOS)
 
 @app.route('/gastos/excluir/<int:gasto_id>', methods=['POST'])
 def excluir_gasto(gasto_id):
@@ -826,6 +2137,7 @@ def excluir_gasto(gasto_id):
         # Excluir o gasto
         query_excluir = "DELETE FROM gastos_domesticos WHERE id = ?"
         DatabaseManager.execute_query(query_excluir, (gasto_id,))
+        cache_relatorios.invalidar(TAG_GASTOS)
         
         flash(f'Gasto "{gasto_info["descricao"]}" de R$ {gasto_info["valor"]:.2f} excluído com sucesso!', 'success')
         return redirect(url_for('listar_gastos'))
@@ -834,44 +2146,90 @@ def excluir_gasto(gasto_id):
         flash(f'Erro ao excluir gasto: {str(e)}', 'error')
         return redirect(url_for('listar_gastos'))
 
+def filtros_gastos(args):
+    """Lê os filtros da listagem de gastos e monta a cláusula WHERE correspondente"""
+    filtros = {
+        'data_inicio': args.get('data_inicio', '').strip(),
+        'data_fim': args.get('data_fim', '').strip(),
+        'categoria': args.get('categoria', '').strip(),
+        'forma_pagamento': args.get('forma_pagamento', '').strip()
+    }
+    
+    condicoes = ['1 = 1']
+    params = []
+    if filtros['categoria']:
+        condicoes.append('categoria = ?')
+        params.append(filtros['categoria'])
+    if filtros['forma_pagamento']:
+        condicoes.append('forma_pagamento = ?')
+        params.append(filtros['forma_pagamento'])
+    if filtros['data_inicio']:
+        condicoes.append('data_gasto >= ?')
+        params.append(filtros['data_inicio'])
+    if filtros['data_fim']:
+        condicoes.append('data_gasto <= ?')
+        params.append(filtros['data_fim'])
+    
+    return filtros, ' AND '.join(condicoes), params
+
 @app.route('/gastos/listar')
+@resposta_condicional('gastos_domesticos')
 def listar_gastos():
-    """Listar todos os gastos"""
+    """Listar gastos com filtros e paginação (?completo=1 transmite o histórico inteiro)"""
+    filtros, where, params = filtros_gastos(request.args)
+    filtros_url = {chave: valor for chave, valor in filtros.items() if valor}
+    completo = request.args.get('completo') == '1'
+    
+    colunas = """
+        SELECT id, descricao, categoria, valor, forma_pagamento, observacoes,
+               data_gasto, strftime('%d/%m/%Y', data_gasto) AS data_formatada
+        FROM gastos_domesticos
+    """
+    contexto = {
+        'filtros': filtros,
+        'filtros_url': filtros_url,
+        'categorias': CATEGORIAS_GASTOS,
+        'formas_pagamento': FORMAS_PAGAMENTO,
+        'completo': completo
+    }
+    
     try:
-        # Buscar gastos no banco ordenados por data (mais recentes primeiro)
-        query = """
-            SELECT id, descricao, categoria, valor, data_gasto, forma_pagamento, observacoes, data_criacao
-            FROM gastos_domesticos 
-            ORDER BY data_gasto DESC, data_criacao DESC
+        # Total e quantidade calculados no SQLite
+        query_total = f"""
+            SELECT COUNT(*) as quantidade, COALESCE(SUM(valor), 0) as total
+            FROM gastos_domesticos WHERE {where}
         """
-        gastos_db = DatabaseManager.execute_query(query, fetch_all=True)
+        totais = DatabaseManager.execute_query(query_total, params, fetch_one=True)
         
-        # Formatar dados para o template
-        gastos = []
-        total_gastos = 0
+        if completo:
+            # Exportação do histórico inteiro: as linhas são lidas em lotes enquanto o HTML é
+            # enviado, no mesmo snapshot dos totais (a sessão só fecha no fim da transmissão)
+            query = f"{colunas} WHERE {where} ORDER BY data_gasto DESC, id DESC"
+            return stream_template('listar_gastos.html',
+                                   gastos=DatabaseManager.iter_query(query, params),
+                                   quantidade=totais['quantidade'],
+                                   total_gastos=totais['total'],
+                                   pagination=None,
+                                   **contexto)
         
-        for gasto in gastos_db:
-            # Formatar data para exibição
-            data_obj = datetime.strptime(gasto['data_gasto'], '%Y-%m-%d')
-            data_formatada = data_obj.strftime('%d/%m/%Y')
-            
-            gasto_formatado = {
-                'id': gasto['id'],
-                'descricao': gasto['descricao'],
-                'categoria': gasto['categoria'],
-                'valor': gasto['valor'],
-                'data_formatada': data_formatada,
-                'forma_pagamento': gasto['forma_pagamento'],
-                'observacoes': gasto['observacoes']
-            }
-            gastos.append(gasto_formatado)
-            total_gastos += gasto['valor']
+        per_page = 20
+        paginator = KeysetPaginator(['data_gasto', 'id'], per_page, totais['quantidade'],
+                                    cursor=request.args.get('cursor'), descendente=True)
+        query, query_params = paginator.sql(f"{colunas} WHERE {where}", params)
+        gastos, pagination_info = paginator.paginar(
+            DatabaseManager.execute_query(query, query_params, fetch_all=True))
         
-        return render_template('listar_gastos.html', gastos=gastos, total_gastos=total_gastos)
+        return render_template('listar_gastos.html',
+                               gastos=gastos,
+                               quantidade=totais['quantidade'],
+                               total_gastos=totais['total'],
+                               pagination=pagination_info,
+                               **contexto)
         
     except Exception as e:
         flash(f'Erro ao carregar gastos: {str(e)}', 'error')
-        return render_template('listar_gastos.html', gastos=[], total_gastos=0)
+        return render_template('listar_gastos.html', gastos=[], quantidade=0, total_gastos=0,
+                               pagination=None, **contexto)
 
 @app.route('/gastos/relatorio')
 def relatorio_gastos():
@@ -881,58 +2239,8 @@ def relatorio_gastos():
         data_atual = datetime.now()
         inicio_mes = data_atual.replace(day=1).strftime('%Y-%m-%d')
         
-        # Query para gastos por categoria do mês atual
-        query = """
-            SELECT categoria, SUM(valor) as total, COUNT(*) as quantidade
-            FROM gastos_domesticos 
-            WHERE data_gasto >= ?
-            GROUP BY categoria
-            ORDER BY total DESC
-        """
-        gastos_categoria = DatabaseManager.execute_query(query, (inicio_mes,), fetch_all=True)
-        
-        # Query para total geral do mês
-        query_total = """
-            SELECT SUM(valor) as total_geral, COUNT(*) as total_transacoes
-            FROM gastos_domesticos 
-            WHERE data_gasto >= ?
-        """
-        total_resultado = DatabaseManager.execute_query(query_total, (inicio_mes,), fetch_one=True)
-        
-        total_geral = total_resultado['total_geral'] if total_resultado and total_resultado['total_geral'] else 0
-        total_transacoes = total_resultado['total_transacoes'] if total_resultado else 0
-        
-        # Mapear ícones e cores por categoria
-        icones_categoria = {
-            'Alimentação': {'icon': 'shopping-cart', 'cor': 'primary'},
-            'Moradia': {'icon': 'home', 'cor': 'success'},
-            'Transporte': {'icon': 'car', 'cor': 'info'},
-            'Saúde': {'icon': 'heartbeat', 'cor': 'danger'},
-            'Lazer': {'icon': 'gamepad', 'cor': 'warning'},
-            'Outros': {'icon': 'ellipsis-h', 'cor': 'secondary'}
-        }
-        
-        # Formatar dados para o template
-        gastos_formatados = []
-        for categoria in gastos_categoria:
-            percentual = (categoria['total'] / total_geral * 100) if total_geral > 0 else 0
-            categoria_info = icones_categoria.get(categoria['categoria'], {'icon': 'circle', 'cor': 'secondary'})
-            
-            gastos_formatados.append({
-                'nome': categoria['categoria'],
-                'total': categoria['total'],
-                'quantidade': categoria['quantidade'],
-                'percentual': percentual,
-                'icon': categoria_info['icon'],
-                'cor': categoria_info['cor']
-            })
-        
-        dados_relatorio = {
-            'gastos_por_categoria': gastos_formatados,
-            'total_geral': total_geral,
-            'total_transacoes': total_transacoes,
-            'mes_referencia': data_atual.strftime('%B de %Y')
-        }
+        dados_relatorio = obter_relatorio(
+            ('relatorio_gastos', inicio_mes), lambda: calcular_relatorio_gastos(data_atual, inicio_mes))
         
         return render_template('relatorio_gastos.html', dados=dados_relatorio)
         
@@ -946,6 +2254,63 @@ def relatorio_gastos():
         }
         return render_template('relatorio_gastos.html', dados=dados_relatorio)
 
+def calcular_relatorio_gastos(data_atual, inicio_mes):
+    """Gastos do mês por categoria para o relatório e as tags de cache de que ele depende"""
+    # Query para gastos por categoria do mês atual
+    query = """
+        SELECT categoria, SUM(valor) as total, COUNT(*) as quantidade
+        FROM gastos_domesticos 
+        WHERE data_gasto >= ?
+        GROUP BY categoria
+        ORDER BY total DESC
+    """
+    gastos_categoria = DatabaseManager.execute_query(query, (inicio_mes,), fetch_all=True)
+    
+    # Query para total geral do mês
+    query_total = """
+        SELECT SUM(valor) as total_geral, COUNT(*) as total_transacoes
+        FROM gastos_domesticos 
+        WHERE data_gasto >= ?
+    """
+    total_resultado = DatabaseManager.execute_query(query_total, (inicio_mes,), fetch_one=True)
+    
+    total_geral = total_resultado['total_geral'] if total_resultado and total_resultado['total_geral'] else 0
+    total_transacoes = total_resultado['total_transacoes'] if total_resultado else 0
+    
+    # Mapear ícones e cores por categoria
+    icones_categoria = {
+        'Alimentação': {'icon': 'shopping-cart', 'cor': 'primary'},
+        'Moradia': {'icon': 'home', 'cor': 'success'},
+        'Transporte': {'icon': 'car', 'cor': 'info'},
+        'Saúde': {'icon': 'heartbeat', 'cor': 'danger'},
+        'Lazer': {'icon': 'gamepad', 'cor': 'warning'},
+        'Outros': {'icon': 'ellipsis-h', 'cor': 'secondary'}
+    }
+    
+    # Formatar dados para o template
+    gastos_formatados = []
+    for categoria in gastos_categoria:
+        percentual = (categoria['total'] / total_geral * 100) if total_geral > 0 else 0
+        categoria_info = icones_categoria.get(categoria['categoria'], {'icon': 'circle', 'cor': 'secondary'})
+        
+        gastos_formatados.append({
+            'nome': categoria['categoria'],
+            'total': categoria['total'],
+            'quantidade': categoria['quantidade'],
+            'percentual': percentual,
+            'icon': categoria_info['icon'],
+            'cor': categoria_info['cor']
+        })
+    
+    dados_relatorio = {
+        'gastos_por_categoria': gastos_formatados,
+        'total_geral': total_geral,
+        'total_transacoes': total_transacoes,
+        'mes_referencia': data_atual.strftime('%B de %Y')
+    }
+    
+    return dados_relatorio, [TAG_GASTOS]
+
 @app.route('/calculo_avulso', methods=['GET', 'POST'])
 def calculo_avulso():
     """Página para cálculo avulso de horas trabalhadas"""
@@ -994,11 +2359,85 @@ def calculo_avulso():
     
     return render_template('calculo_avulso.html', funcionarios=funcionarios, resultado=resultado)
 
-@app.route('/api/verificar_lancamento', methods=['POST'])
+@app.route('/api/estatisticas/pool')
+def estatisticas_pool():
+    """API com as estatísticas do pool de conexões SQLite, da pista de leitura e do escritor único"""
+    return jsonify(dict(DatabaseManager.pool_stats(),
+                        leitura=DatabaseManager.pool_stats(leitura=True),
+                        escritor=DatabaseManager.writer_stats()))
+
+@app.route('/api/estatisticas/bloqueios')
+def estatisticas_bloqueios():
+    """API com as esperas por lock do SQLite por rota (contadores e histograma)"""
+    return jsonify({
+        'busy_timeout_ms': DB_BUSY_TIMEOUT_MS,
+        'retentativas': DB_RETENTATIVAS,
+        'rotas': metricas_bloqueio.estatisticas()
+    })
+
+@app.route('/api/estatisticas/cache')
+def estatisticas_cache():
+    """API com os acertos, faltas e remoções do cache de relatórios"""
+    return jsonify(cache_relatorios.estatisticas())
+
+@app.route('/api/relatorios_fechados')
+def estado_relatorios_fechados():
+    """API com quantos relatórios de períodos encerrados estão prontos e sujos"""
+    return jsonify(situacao_relatorios_fechados())
+
+@app.route('/api/relatorios_fechados/gerar', methods=['POST'])
+def gerar_relatorios_fechados_api():
+    """Gera no portal os relatórios fechados pendentes (replicado na réplica em memória)"""
+    return jsonify(gerar_relatorios_fechados())
+
+@app.route('/api/replica')
+def estado_replica():
+    """API com o estado da réplica em memória"""
+    replica = DatabaseManager.get_replica()
+    return jsonify(dict(replica.estatisticas(), ativa=True) if replica else {'ativa': False})
+
+@app.route('/api/replica/verificar')
+def verificar_replica():
+    """Compara o arquivo com a réplica em memória (linhas e soma por tabela)"""
+    if DatabaseManager.get_replica() is None:
+        return jsonify({'ativa': False})
+    consistente, tabelas = DatabaseManager.verificar_replica()
+    return jsonify({'ativa': True, 'consistente': consistente, 'tabelas': tabelas})
+
+@app.route('/api/replica/ressincronizar', methods=['POST'])
+def ressincronizar_replica():
+    """Recarrega a réplica em memória a partir do arquivo"""
+    replica = DatabaseManager.ressincronizar_replica()
+    return jsonify(dict(replica.estatisticas(), ativa=True) if replica else {'ativa': False})
+
+@app.route('/debug/queries')
+def debug_queries():
+    """Perfil de queries das últimas requisições (use ?n_mais_um=1 para só as suspeitas)"""
+    with _perfis_lock:
+        perfis = list(reversed(_perfis_requisicoes))
+    if request.args.get('n_mais_um'):
+        perfis = [p for p in perfis if p['suspeitas_n_mais_um']]
+    return jsonify({
+        'slow_query_ms': SLOW_QUERY_MS,
+        'n_mais_um_limite': N_MAIS_UM_LIMITE,
+        'requisicoes': perfis
+    })
+
+@app.route('/debug/indices')
+def debug_indices():
+    """Planos das queries executadas, com varreduras completas e B-trees temporárias (?problemas=1)"""
+    return jsonify(consultor_indices.relatorio(apenas_problemas=bool(request.args.get('problemas'))))
+
+@app.route('/api/verificar_lancamento', methods=['GET', 'POST'])
+@resposta_condicional('funcionarios', 'registros_ponto')
 def verificar_lancamento():
-    """API para verificar se já existe lançamento para funcionário e data"""
+    """API para verificar se já existe lançamento para funcionário e data
+    
+    GET (?funcionario=...&data=...) responde com ETag e 304 enquanto os
+    registros não mudarem; POST com JSON continua aceito.
+    """
     try:
-        data = request.get_json()
+        data = request.get_json() if request.method == 'POST' else request.args
         funcionario_nome = data.get('funcionario')
         data_registro = data.get('data')
         
@@ -1014,7 +2453,7 @@ def verificar_lancamento():
             
         # Verificar se já existe lançamento
         query_verificacao = """
-            SELECT id, hora_entrada, hora_saida, horas_trabalhadas, data_registro
+            SELECT id, entrada_min, saida_min, minutos_trabalhados, data_registro
             FROM registros_ponto 
             WHERE funcionario_id = ? AND data = ?
         """
@@ -1024,9 +2463,9 @@ def verificar_lancamento():
             return jsonify({
                 'existe': True,
                 'registro': {
-                    'hora_entrada': registro_existente['hora_entrada'],
-                    'hora_saida': registro_existente['hora_saida'],
-                    'horas_trabalhadas': registro_existente['horas_trabalhadas'],
+                    'hora_entrada': minutos_para_hora(registro_existente['entrada_min']),
+                    'hora_saida': minutos_para_hora(registro_existente['saida_min']),
+                    'horas_trabalhadas': round(registro_existente['minutos_trabalhados'] / 60, 2),
                     'data_registro': registro_existente['data_registro']
                 }
             })
@@ -1043,5 +2482,6 @@ if __name__ == '__main__':
         print("   Execute: python migrar_para_sqlite.py")
         exit(1)
     
+    inicializar_banco()
     print("🗄️  Usando banco SQLite: " + DB_FILE)
     app.run(debug=True, host='0.0.0.0', port=5001)
@@ -0,0 +1,432 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Migrações versionadas do esquema do banco SQLite
+
+Cada migração tem um número, um nome e uma função idempotente. As versões
+aplicadas ficam registradas na tabela schema_version; ao iniciar o portal
+(ou pela linha de comando) apenas as pendentes são executadas, cada uma em
+sua própria transação. Depois de qualquer mudança estrutural o banco passa
+por ANALYZE para o planejador de queries conhecer os novos índices.
+
+Uso:
+    python migracoes.py            # aplica as migrações pendentes
+    python migracoes.py --status   # mostra a versão atual e as pendentes
+"""
+
+import sqlite3
+import sys
+import time
+from contextlib import contextmanager
+
+DB_FILE = 'horas_trabalho.db'
+
+# Tempo máximo aguardando outro processo liberar o banco (o portal pode estar no ar)
+BUSY_TIMEOUT = 30  # segundos
+
+def sql_periodo_fechamento(coluna='data'):
+    """Expressão SQL com a chave 'YYYY-MM' do período de fechamento de uma coluna de data"""
+    return f"""
+    CASE WHEN CAST(strftime('%d', {coluna}) AS INTEGER) <= 25
+         THEN strftime('%Y-%m', {coluna})
+         ELSE strftime('%Y-%m', {coluna}, 'start of month', '+1 month')
+    END
+"""
+
+# Chave 'YYYY-MM' do período de fechamento da coluna data, calculada no SQLite
+SQL_PERIODO_FECHAMENTO = sql_periodo_fechamento()
+
+def _colunas(conn, tabela):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({tabela})")}
+
+def _adicionar_coluna(conn, tabela, coluna, definicao):
+    if coluna not in _colunas(conn, tabela):
+        conn.execute(f"ALTER TABLE {tabela} ADD COLUMN {coluna} {definicao}")
+
+def _criar_indice(conn, nome, definicao):
+    """Cria o índice apenas se ele ainda não existir
+
+    Em modo WAL a construção bloqueia só os escritores; leituras continuam
+    sendo atendidas. Índices já existentes não pegam lock nenhum.
+    """
+    existe = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?",
+                          (nome,)).fetchone()
+    if not existe:
+        conn.execute(f"CREATE INDEX {nome} ON {definicao}")
+
+def _remover_indice(conn, nome):
+    conn.execute(f"DROP INDEX IF EXISTS {nome}")
+
+@contextmanager
+def _preservando_updated_at(conn):
+    """UPDATEs de manutenção em registros_ponto (não são edições): updated_at não muda
+
+    Remove o trigger update_registros_updated_at durante o bloco e o recria
+    no fim, na mesma transação.
+    """
+    gatilho = conn.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = 'update_registros_updated_at'"
+    ).fetchone()
+    conn.execute("DROP TRIGGER IF EXISTS update_registros_updated_at")
+    try:
+        yield
+    finally:
+        if gatilho:
+            conn.execute(gatilho[0])
+
+def m001_esquema_inicial(conn):
+    """Tabelas de funcionários e registros de ponto"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS funcionarios (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nome TEXT NOT NULL UNIQUE,
+            cargo TEXT NOT NULL,
+            salario_mensal REAL NOT NULL,
+            salario_hora REAL NOT NULL,
+            horas_mensais INTEGER NOT NULL DEFAULT 220,
+            data_cadastro DATE NOT NULL,
+            ativo BOOLEAN NOT NULL DEFAULT 1,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS registros_ponto (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            funcionario_id INTEGER NOT NULL,
+            data DATE NOT NULL,
+            dia INTEGER NOT NULL,
+            mes INTEGER NOT NULL,
+            ano INTEGER NOT NULL,
+            hora_entrada TIME NOT NULL,
+            hora_saida_almoco TIME NOT NULL,
+            hora_volta_almoco TIME NOT NULL,
+            hora_saida TIME NOT NULL,
+            tempo_almoco REAL NOT NULL,
+            horas_trabalhadas REAL NOT NULL,
+            horas_extras REAL NOT NULL,
+            data_registro TIMESTAMP NOT NULL,
+            data_edicao TIMESTAMP NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (funcionario_id) REFERENCES funcionarios (id),
+            UNIQUE(funcionario_id, data)
+        )
+    ''')
+    _criar_indice(conn, 'idx_funcionarios_nome', 'funcionarios(nome)')
+    _criar_indice(conn, 'idx_registros_funcionario', 'registros_ponto(funcionario_id)')
+    _criar_indice(conn, 'idx_registros_data', 'registros_ponto(data)')
+    _criar_indice(conn, 'idx_registros_mes_ano', 'registros_ponto(mes, ano)')
+
+    # Triggers para atualizar updated_at automaticamente
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS update_funcionarios_updated_at
+        AFTER UPDATE ON funcionarios
+        BEGIN
+            UPDATE funcionarios SET updated_at = CURRENT_TIMESTAMP WHERE id = NEW.id;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS update_registros_updated_at
+        AFTER UPDATE ON registros_ponto
+        BEGIN
+            UPDATE registros_ponto SET updated_at = CURRENT_TIMESTAMP WHERE id = NEW.id;
+        END
+    ''')
+
+def m002_desconto_funcionarios(conn):
+    """Coluna desconto usada no cadastro e na edição de funcionários"""
+    _adicionar_coluna(conn, 'funcionarios', 'desconto', 'REAL DEFAULT 0.00')
+
+def m003_gastos_domesticos(conn):
+    """Tabela de gastos domésticos"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS gastos_domesticos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            descricao TEXT NOT NULL,
+            categoria TEXT NOT NULL,
+            valor REAL NOT NULL,
+            data_gasto DATE NOT NULL,
+            forma_pagamento TEXT NOT NULL,
+            observacoes TEXT,
+            data_criacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+def m004_indices_gastos(conn):
+    """Índices dos filtros da listagem de gastos (período, categoria, forma de pagamento)"""
+    _criar_indice(conn, 'idx_gastos_data', 'gastos_domesticos(data_gasto)')
+    _criar_indice(conn, 'idx_gastos_categoria_data', 'gastos_domesticos(categoria, data_gasto)')
+    _criar_indice(conn, 'idx_gastos_pagamento_data', 'gastos_domesticos(forma_pagamento, data_gasto)')
+
+def preencher_periodos(conn):
+    """Preenche periodo_ano/periodo_mes dos registros que ainda não têm; retorna quantos
+
+    O preenchimento não é uma edição: preserva updated_at de cada registro.
+    """
+    with _preservando_updated_at(conn):
+        cursor = conn.execute(f"""
+            UPDATE registros_ponto
+            SET periodo_ano = CAST(substr({SQL_PERIODO_FECHAMENTO}, 1, 4) AS INTEGER),
+                periodo_mes = CAST(substr({SQL_PERIODO_FECHAMENTO}, 6, 2) AS INTEGER)
+            WHERE periodo_ano IS NULL OR periodo_mes IS NULL
+        """)
+    return cursor.rowcount
+
+def m005_periodo_fechamento(conn):
+    """Colunas do período de fechamento (26 a 25) em registros_ponto, já preenchidas"""
+    _adicionar_coluna(conn, 'registros_ponto', 'periodo_mes', 'INTEGER')
+    _adicionar_coluna(conn, 'registros_ponto', 'periodo_ano', 'INTEGER')
+    preencher_periodos(conn)
+
+def m006_indice_periodo_fechamento(conn):
+    """Índice composto para buscar registros por funcionário e período"""
+    _criar_indice(conn, 'idx_registros_funcionario_periodo',
+                  'registros_ponto(funcionario_id, periodo_ano, periodo_mes)')
+
+def _registros_em_minutos(conn):
+    """True se registros_ponto já guarda as durações em minutos inteiros (migração 11)"""
+    return 'minutos_trabalhados' in _colunas(conn, 'registros_ponto')
+
+def m007_resumo_fechamento(conn):
+    """Resumo materializado por funcionário e período, mantido por triggers
+
+    Os triggers leem as colunas em minutos; num banco ainda em horas
+    decimais o resumo é criado pela migração 11, depois da conversão.
+    """
+    if not _registros_em_minutos(conn):
+        return
+    from resumo_fechamento import criar_resumo_fechamento
+    criar_resumo_fechamento(conn)
+
+def m008_indices_cobertura(conn):
+    """Índices apontados pelo consultor de índices (consultor_indices.py)
+
+    - gastos por período: (data_gasto, categoria, valor) responde os totais e o
+      agrupamento por categoria do mês sem ler a tabela;
+    - funcionários ativos: índice parcial por nome, só com as linhas ativo = 1;
+    - registros do período já ordenados por data (relatório mensal);
+    - remove índices que repetem o prefixo de uma restrição UNIQUE.
+    """
+    _criar_indice(conn, 'idx_gastos_data_categoria_valor',
+                  'gastos_domesticos(data_gasto, categoria, valor)')
+    _criar_indice(conn, 'idx_funcionarios_ativos_nome', 'funcionarios(nome) WHERE ativo = 1')
+    _criar_indice(conn, 'idx_registros_funcionario_periodo_data',
+                  'registros_ponto(funcionario_id, periodo_ano, periodo_mes, data)')
+    _remover_indice(conn, 'idx_registros_funcionario_periodo')
+    _remover_indice(conn, 'idx_registros_funcionario')   # UNIQUE(funcionario_id, data)
+    _remover_indice(conn, 'idx_funcionarios_nome')       # nome UNIQUE
+
+# Tabelas cujas alterações mudam as páginas do portal (ETag/Last-Modified)
+TABELAS_VERSIONADAS = ('funcionarios', 'registros_ponto', 'gastos_domesticos')
+
+def m009_versoes_dados(conn):
+    """Contador de alterações por tabela, mantido por triggers
+
+    O portal monta o ETag das páginas a partir destes contadores. Diferente
+    de MAX(updated_at), o contador também muda em exclusões e em duas
+    alterações no mesmo segundo (gastos_domesticos nem tem updated_at).
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS versoes_dados (
+            tabela TEXT PRIMARY KEY,
+            versao INTEGER NOT NULL DEFAULT 0,
+            alterado_em TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    for tabela in TABELAS_VERSIONADAS:
+        conn.execute("INSERT OR IGNORE INTO versoes_dados (tabela) VALUES (?)", (tabela,))
+        for evento in ('INSERT', 'UPDATE', 'DELETE'):
+            conn.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS versao_{tabela}_{evento.lower()}
+                AFTER {evento} ON {tabela}
+                BEGIN
+                    UPDATE versoes_dados SET versao = versao + 1, alterado_em = CURRENT_TIMESTAMP
+                    WHERE tabela = '{tabela}';
+                END
+            """)
+
+def m010_relatorios_fechados(conn):
+    """Relatórios pré-gerados dos períodos encerrados, sujados por triggers
+
+    Assim como o resumo (migração 7), fica para a migração 11 num banco
+    ainda em horas decimais.
+    """
+    if not _registros_em_minutos(conn):
+        return
+    from relatorios_fechados import criar_relatorios_fechados
+    criar_relatorios_fechados(conn)
+
+def sql_minutos_do_dia(coluna):
+    """Expressão SQL com os minutos desde a meia-noite de um texto 'HH:MM'"""
+    separador = f"instr({coluna}, ':')"
+    return (f"(CAST(substr({coluna}, 1, {separador} - 1) AS INTEGER) * 60 "
+            f"+ CAST(substr({coluna}, {separador} + 1, 2) AS INTEGER))")
+
+def sql_horas_em_minutos(coluna):
+    """Expressão SQL com os minutos inteiros de uma duração em horas decimais"""
+    return f"CAST(ROUND({coluna} * 60) AS INTEGER)"
+
+# Colunas de horário (texto 'HH:MM') e duração (horas decimais) convertidas
+# pela migração 11 para minutos inteiros: nova coluna -> (antiga, conversão)
+COLUNAS_MINUTOS = {
+    'entrada_min': ('hora_entrada', sql_minutos_do_dia),
+    'saida_almoco_min': ('hora_saida_almoco', sql_minutos_do_dia),
+    'volta_almoco_min': ('hora_volta_almoco', sql_minutos_do_dia),
+    'saida_min': ('hora_saida', sql_minutos_do_dia),
+    'minutos_almoco': ('tempo_almoco', sql_horas_em_minutos),
+    'minutos_trabalhados': ('horas_trabalhadas', sql_horas_em_minutos),
+    'minutos_extras': ('horas_extras', sql_horas_em_minutos),
+}
+
+def m011_minutos_inteiros(conn):
+    """Horários e durações dos registros de ponto em minutos inteiros
+
+    Horários passam a minutos desde a meia-noite e durações a minutos
+    trabalhados; as somas do resumo ficam exatas e a formatação não precisa
+    mais arredondar horas decimais. As durações antigas (arredondadas com 2
+    ou 4 casas) voltam a minutos com ROUND(horas * 60), que recupera o
+    minuto original. Os triggers que leem as colunas antigas são removidos
+    antes do DROP COLUMN e o resumo é reconstruído em minutos.
+    """
+    if not _registros_em_minutos(conn):
+        for gatilho in ('resumo_fechamento_insert', 'resumo_fechamento_delete',
+                        'resumo_fechamento_update', 'resumo_fechamento_salario',
+                        'relatorios_fechados_update'):
+            conn.execute(f"DROP TRIGGER IF EXISTS {gatilho}")
+
+        # A conversão não é uma edição: preserva updated_at de cada registro
+        with _preservando_updated_at(conn):
+            for coluna in COLUNAS_MINUTOS:
+                _adicionar_coluna(conn, 'registros_ponto', coluna, 'INTEGER NOT NULL DEFAULT 0')
+            atribuicoes = ', '.join(f"{nova} = {converter(antiga)}"
+                                    for nova, (antiga, converter) in COLUNAS_MINUTOS.items())
+            conn.execute(f"UPDATE registros_ponto SET {atribuicoes}")
+            for antiga, _ in COLUNAS_MINUTOS.values():
+                conn.execute(f"ALTER TABLE registros_ponto DROP COLUMN {antiga}")
+
+        conn.execute("DROP TABLE IF EXISTS resumo_fechamento")
+
+    from resumo_fechamento import criar_resumo_fechamento
+    from relatorios_fechados import criar_relatorios_fechados
+    criar_resumo_fechamento(conn)
+    criar_relatorios_fechados(conn)
+    # O JSON guardado no fechamento ainda tem as chaves em horas
+    conn.execute("UPDATE relatorios_fechados SET sujo = 1, versao = versao + 1")
+
+def m012_banco_horas(conn):
+    """Banco de horas: saldo acumulado de extras por funcionário e dia, mantido por triggers"""
+    from banco_horas import criar_banco_horas
+    criar_banco_horas(conn)
+
+def m013_versao_paginas_relatorios(conn):
+    """Versão do código/templates que gerou cada relatório fechado
+
+    Relatórios de uma versão anterior (ou sem versão) são tratados como sujos
+    e gerados de novo no próximo fechamento.
+    """
+    _adicionar_coluna(conn, 'relatorios_fechados', 'versao_paginas', 'TEXT')
+
+MIGRACOES = [
+    (1, 'esquema_inicial', m001_esquema_inicial),
+    (2, 'desconto_funcionarios', m002_desconto_funcionarios),
+    (3, 'gastos_domesticos', m003_gastos_domesticos),
+    (4, 'indices_gastos', m004_indices_gastos),
+    (5, 'periodo_fechamento', m005_periodo_fechamento),
+    (6, 'indice_periodo_fechamento', m006_indice_periodo_fechamento),
+    (7, 'resumo_fechamento', m007_resumo_fechamento),
+    (8, 'indices_cobertura', m008_indices_cobertura),
+    (9, 'versoes_dados', m009_versoes_dados),
+    (10, 'relatorios_fechados', m010_relatorios_fechados),
+    (11, 'minutos_inteiros', m011_minutos_inteiros),
+    (12, 'banco_horas', m012_banco_horas),
+    (13, 'versao_paginas_relatorios', m013_versao_paginas_relatorios),
+]
+
+def _garantir_schema_version(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            versao INTEGER PRIMARY KEY,
+            nome TEXT NOT NULL,
+            aplicada_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            duracao_ms REAL
+        )
+    ''')
+
+def versoes_aplicadas(conn):
+    """Conjunto das versões já registradas em schema_version"""
+    _garantir_schema_version(conn)
+    return {row[0] for row in conn.execute("SELECT versao FROM schema_version")}
+
+def migracoes_pendentes(conn):
+    """Migrações ainda não aplicadas, em ordem"""
+    aplicadas = versoes_aplicadas(conn)
+    return [m for m in MIGRACOES if m[0] not in aplicadas]
+
+def conectar(db_file=DB_FILE):
+    """Conexão com transações explícitas, usada pelo motor de migrações"""
+    conn = sqlite3.connect(db_file, timeout=BUSY_TIMEOUT, isolation_level=None)
+    conn.execute("PRAGMA journal_mode = WAL")
+    return conn
+
+def aplicar_migracoes(db_file=DB_FILE, verbose=False):
+    """Aplica as migrações pendentes e retorna a lista de versões aplicadas"""
+    conn = conectar(db_file)
+    aplicadas = []
+    try:
+        for versao, nome, funcao in migracoes_pendentes(conn):
+            inicio = time.perf_counter()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Outra instância pode ter aplicado enquanto aguardávamos o lock
+                if versao in versoes_aplicadas(conn):
+                    conn.execute("ROLLBACK")
+                    continue
+                funcao(conn)
+                conn.execute(
+                    "INSERT INTO schema_version (versao, nome, duracao_ms) VALUES (?, ?, ?)",
+                    (versao, nome, (time.perf_counter() - inicio) * 1000))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            aplicadas.append(versao)
+            if verbose:
+                print(f"   ✅ {versao:03d} {nome}")
+
+        if aplicadas:
+            # Atualizar estatísticas do planejador depois de mudanças estruturais
+            conn.execute("ANALYZE")
+    finally:
+        conn.close()
+    return aplicadas
+
+def main():
+    """Função principal"""
+    print("🧱 MIGRAÇÕES DO BANCO SQLITE")
+    print("=" * 50)
+
+    if '--status' in sys.argv:
+        conn = conectar()
+        try:
+            aplicadas = versoes_aplicadas(conn)
+            pendentes = migracoes_pendentes(conn)
+        finally:
+            conn.close()
+        print(f"📌 Versão atual: {max(aplicadas) if aplicadas else 0}")
+        if pendentes:
+            print("⏳ Pendentes:")
+            for versao, nome, _ in pendentes:
+                print(f"   • {versao:03d} {nome}")
+        else:
+            print("✅ Nenhuma migração pendente")
+        return
+
+    aplicadas = aplicar_migracoes(verbose=True)
+    if aplicadas:
+        print(f"✅ {len(aplicadas)} migração(ões) aplicada(s); estatísticas atualizadas (ANALYZE)")
+    else:
+        print("✅ Banco já está na versão mais recente")
+
+if __name__ == '__main__':
+    main()
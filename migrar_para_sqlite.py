@@ -9,86 +9,22 @@ import json
 import os
 from datetime import datetime
 
+from calculo_ponto import COLUNAS_PONTO, calcular_pontos, minutos_para_hm
+from migracoes import aplicar_migracoes, preencher_periodos
+from resumo_fechamento import reconstruir_resumo
+
 # Arquivos
 JSON_FILE = 'horas_trabalho.json'
 DB_FILE = 'horas_trabalho.db'
 
 def criar_banco():
-    """Cria o banco SQLite com as tabelas necessárias"""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    
-    # Criar tabela de funcionários
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS funcionarios (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            nome TEXT NOT NULL UNIQUE,
-            cargo TEXT NOT NULL,
-            salario_mensal REAL NOT NULL,
-            salario_hora REAL NOT NULL,
-            horas_mensais INTEGER NOT NULL DEFAULT 220,
-            data_cadastro DATE NOT NULL,
-            ativo BOOLEAN NOT NULL DEFAULT 1,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # Criar tabela de registros de ponto
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS registros_ponto (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            funcionario_id INTEGER NOT NULL,
-            data DATE NOT NULL,
-            dia INTEGER NOT NULL,
-            mes INTEGER NOT NULL,
-            ano INTEGER NOT NULL,
-            hora_entrada TIME NOT NULL,
-            hora_saida_almoco TIME NOT NULL,
-            hora_volta_almoco TIME NOT NULL,
-            hora_saida TIME NOT NULL,
-            tempo_almoco REAL NOT NULL,
-            horas_trabalhadas REAL NOT NULL,
-            horas_extras REAL NOT NULL,
-            data_registro TIMESTAMP NOT NULL,
-            data_edicao TIMESTAMP NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (funcionario_id) REFERENCES funcionarios (id),
-            UNIQUE(funcionario_id, data)
-        )
-    ''')
-    
-    # Criar índices para melhor performance
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_funcionarios_nome ON funcionarios(nome)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_registros_funcionario ON registros_ponto(funcionario_id)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_registros_data ON registros_ponto(data)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_registros_mes_ano ON registros_ponto(mes, ano)')
-    
-    # Criar trigger para atualizar updated_at automaticamente
-    cursor.execute('''
-        CREATE TRIGGER IF NOT EXISTS update_funcionarios_updated_at 
-        AFTER UPDATE ON funcionarios
-        BEGIN
-            UPDATE funcionarios SET updated_at = CURRENT_TIMESTAMP WHERE id = NEW.id;
-        END
-    ''')
-    
-    cursor.execute('''
-        CREATE TRIGGER IF NOT EXISTS update_registros_updated_at 
-        AFTER UPDATE ON registros_ponto
-        BEGIN
-            UPDATE registros_ponto SET updated_at = CURRENT_TIMESTAMP WHERE id = NEW.id;
-        END
-    ''')
-    
-    conn.commit()
-    conn.close()
+    """Cria o banco SQLite aplicando as migrações versionadas (migracoes.py)"""
+    aplicadas = aplicar_migracoes(DB_FILE)
     
     print("✅ Banco SQLite criado com sucesso!")
     print(f"   Arquivo: {DB_FILE}")
-    print("   Tabelas: funcionarios, registros_ponto")
-    print("   Índices e triggers configurados")
+    print(f"   Migrações aplicadas: {len(aplicadas)}")
+    print("   Tabelas, índices e triggers configurados")
 
 def migrar_dados():
     """Migra dados do JSON para o SQLite"""
@@ -141,19 +77,29 @@ def migrar_dados():
         
         registros_migrados = 0
         
+        registros = []
         for registro in dados.get('registros', []):
             funcionario_nome = registro.get('funcionario')
-            funcionario_id = funcionario_ids.get(funcionario_nome)
-            
-            if not funcionario_id:
+            if funcionario_nome in funcionario_ids:
+                registros.append(registro)
+            else:
                 print(f"   ⚠️  Funcionário não encontrado: {funcionario_nome}")
-                continue
+        
+        # Todos os registros calculados de uma vez (calculo_ponto.py), a partir das batidas
+        pontos = calcular_pontos([
+            (r.get('hora_entrada'), r.get('hora_saida_almoco'), r.get('hora_volta_almoco'), r.get('hora_saida'))
+            for r in registros
+        ])
+        
+        for i, registro in enumerate(registros):
+            funcionario_nome = registro.get('funcionario')
+            funcionario_id = funcionario_ids[funcionario_nome]
             
             cursor.execute('''
                 INSERT OR REPLACE INTO registros_ponto 
-                (funcionario_id, data, dia, mes, ano, hora_entrada, hora_saida_almoco, 
-                 hora_volta_almoco, hora_saida, tempo_almoco, horas_trabalhadas, 
-                 horas_extras, data_registro, data_edicao)
+                (funcionario_id, data, dia, mes, ano, entrada_min, saida_almoco_min, 
+                 volta_almoco_min, saida_min, minutos_almoco, minutos_trabalhados, 
+                 minutos_extras, data_registro, data_edicao)
                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             ''', (
                 funcionario_id,
@@ -161,21 +107,14 @@ def migrar_dados():
                 registro.get('dia'),
                 registro.get('mes'),
                 registro.get('ano'),
-                registro.get('hora_entrada'),
-                registro.get('hora_saida_almoco'),
-                registro.get('hora_volta_almoco'),
-                registro.get('hora_saida'),
-                registro.get('tempo_almoco', 0.0),
-                registro.get('horas_trabalhadas', 0.0),
-                registro.get('horas_extras', 0.0),
+                *(pontos[coluna][i] for coluna in COLUNAS_PONTO),
                 registro.get('data_registro'),
                 registro.get('data_edicao')
             ))
             
             registros_migrados += 1
             data_reg = registro.get('data', 'N/A')
-            horas_trab = registro.get('horas_trabalhadas', 0)
-            print(f"   ✅ {funcionario_nome} - {data_reg} ({horas_trab:.2f}h)")
+            print(f"   ✅ {funcionario_nome} - {data_reg} ({minutos_para_hm(pontos['minutos_trabalhados'][i])})")
         
         print(f"   📊 Total: {registros_migrados} registros")
         
@@ -220,7 +159,7 @@ def verificar_migracao():
     
     # Listar registros recentes
     cursor.execute('''
-        SELECT r.data, f.nome, r.horas_trabalhadas, r.horas_extras
+        SELECT r.data, f.nome, r.minutos_trabalhados / 60.0, r.minutos_extras / 60.0
         FROM registros_ponto r
         JOIN funcionarios f ON r.funcionario_id = f.id
         ORDER BY r.data DESC
@@ -233,7 +172,7 @@ def verificar_migracao():
     
     # Estatísticas
     cursor.execute('''
-        SELECT SUM(r.horas_trabalhadas), SUM(r.horas_extras)
+        SELECT TOTAL(r.minutos_trabalhados) / 60, TOTAL(r.minutos_extras) / 60
         FROM registros_ponto r
     ''')
     total_horas, total_extras = cursor.fetchone()
@@ -265,7 +204,8 @@ def main():
     print("   1. Criar backup do JSON atual")
     print("   2. Criar banco SQLite")
     print("   3. Migrar todos os dados")
-    print("   4. Verificar integridade")
+    print("   4. Preencher período de fechamento e resumo")
+    print("   5. Verificar integridade")
     print()
     
     # Criar backup
@@ -277,6 +217,15 @@ def main():
     # Migrar dados
     migrar_dados()
     
+    # Preencher período de fechamento (26 a 25) e o resumo dos registros migrados
+    conn = sqlite3.connect(DB_FILE)
+    try:
+        preencher_periodos(conn)
+        reconstruir_resumo(conn)
+        conn.commit()
+    finally:
+        conn.close()
+    
     # Verificar migração
     verificar_migracao()
     
@@ -9,6 +9,8 @@ import json
 import os
 from datetime import datetime
 
+from calculo_ponto import calcular_ponto
+
 # Arquivo de dados
 DATA_FILE = 'horas_trabalho.json'
 
@@ -99,26 +101,13 @@ def validar_registros(dados):
                 hora_volta_almoco = registro['hora_volta_almoco']
                 hora_saida = registro['hora_saida']
                 
-                # Converter para datetime para calcular horas
-                entrada = datetime.strptime(f"{data} {hora_entrada}", "%Y-%m-%d %H:%M")
-                saida_almoco = datetime.strptime(f"{data} {hora_saida_almoco}", "%Y-%m-%d %H:%M")
-                volta_almoco = datetime.strptime(f"{data} {hora_volta_almoco}", "%Y-%m-%d %H:%M")
-                saida = datetime.strptime(f"{data} {hora_saida}", "%Y-%m-%d %H:%M")
-                
-                # Calcular horas trabalhadas (descontando o almoço)
-                periodo_manha = saida_almoco - entrada
-                periodo_tarde = saida - volta_almoco
-                
-                horas_manha = periodo_manha.total_seconds() / 3600
-                horas_tarde = periodo_tarde.total_seconds() / 3600
-                horas_trabalhadas_calculadas = horas_manha + horas_tarde
-                
-                # Calcular tempo de almoço
-                tempo_almoco = volta_almoco - saida_almoco
-                tempo_almoco_horas = tempo_almoco.total_seconds() / 3600
+                # Mesmo cálculo do portal (calculo_ponto.py), em minutos inteiros
+                ponto = calcular_ponto(hora_entrada, hora_saida_almoco, hora_volta_almoco, hora_saida)
                 
-                # Calcular horas extras
-                horas_extras_calculadas = max(0, horas_trabalhadas_calculadas - 8)
+                # O JSON guarda as durações em horas decimais
+                horas_trabalhadas_calculadas = ponto['minutos_trabalhados'] / 60
+                tempo_almoco_horas = ponto['minutos_almoco'] / 60
+                horas_extras_calculadas = ponto['minutos_extras'] / 60
                 
                 # Verificar se os valores estão corretos
                 horas_trabalhadas_registro = registro.get('horas_trabalhadas', 0)
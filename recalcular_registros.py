@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Recálculo em massa dos registros de ponto no banco SQLite
+
+Depois de uma mudança na regra de cálculo (calculo_ponto.py), as colunas
+derivadas das batidas (minutos_almoco, minutos_trabalhados, minutos_extras)
+precisam ser refeitas em todos os registros. O script divide registros_ponto
+em faixas de id, calcula cada faixa em um processo do pool (leitura
+somente, com calcular_pontos) e grava apenas as linhas que mudaram, numa
+transação curta por faixa. O portal continua no ar: em WAL as leituras não
+esperam, e um escritor espera no máximo a gravação de uma faixa. Os
+triggers de registros_ponto mantêm resumo_fechamento, relatorios_fechados,
+banco_horas e versoes_dados em dia.
+
+Cada faixa gravada atualiza o checkpoint (próximo id a processar); com
+--retomar o recálculo continua de onde parou. --simular não grava nada e
+mostra as diferenças encontradas (--diff grava todas num CSV).
+
+Uso:
+    python recalcular_registros.py                       # recalcula e grava
+    python recalcular_registros.py --simular             # só mostra as diferenças
+    python recalcular_registros.py --simular --diff diferencas.csv
+    python recalcular_registros.py --retomar             # continua do checkpoint
+    python recalcular_registros.py --processos 4 --lote 10000
+"""
+
+import csv
+import json
+import multiprocessing
+import os
+import pathlib
+import sqlite3
+import sys
+import time
+
+from calculo_ponto import JORNADA_DIARIA_MINUTOS, calcular_pontos
+from migracoes import aplicar_migracoes, conectar
+
+DB_FILE = 'horas_trabalho.db'
+ARQUIVO_CHECKPOINT = 'recalculo_checkpoint.json'
+TAMANHO_LOTE = 5000              # ids por faixa (uma transação por faixa com correções)
+LIMITE_DIFERENCAS_EXIBIDAS = 20
+
+COLUNAS_BATIDAS = ('entrada_min', 'saida_almoco_min', 'volta_almoco_min', 'saida_min')
+COLUNAS_DERIVADAS = ('minutos_almoco', 'minutos_trabalhados', 'minutos_extras')
+
+# Só grava se as batidas não mudaram desde a leitura (o portal recalcula o que ele edita)
+SQL_CORRIGIR = f"""
+    UPDATE registros_ponto
+    SET {', '.join(f'{coluna} = ?' for coluna in COLUNAS_DERIVADAS)}
+    WHERE id = ? AND {' AND '.join(f'{coluna} = ?' for coluna in COLUNAS_BATIDAS)}
+"""
+
+_conexao = None  # conexão somente leitura de cada processo do pool
+
+def _iniciar_processo(db_file):
+    global _conexao
+    _conexao = sqlite3.connect(pathlib.Path(db_file).resolve().as_uri() + '?mode=ro', uri=True)
+
+def recalcular_faixa(faixa):
+    """Recalcula os registros com id em [inicio, fim)
+
+    Returns:
+        tuple: (inicio, fim, registros lidos, lista de diferenças)
+    """
+    inicio, fim = faixa
+    linhas = _conexao.execute(f"""
+        SELECT id, funcionario_id, data, {', '.join(COLUNAS_BATIDAS)}, {', '.join(COLUNAS_DERIVADAS)}
+        FROM registros_ponto
+        WHERE id >= ? AND id < ?
+    """, (inicio, fim)).fetchall()
+    if not linhas:
+        return inicio, fim, 0, []
+
+    novos = calcular_pontos([linha[3:7] for linha in linhas])
+    diferencas = []
+    for i, linha in enumerate(linhas):
+        recalculados = tuple(novos[coluna][i] for coluna in COLUNAS_DERIVADAS)
+        if recalculados != linha[7:10]:
+            diferencas.append({
+                'id': linha[0],
+                'funcionario_id': linha[1],
+                'data': linha[2],
+                'batidas': linha[3:7],
+                'antigos': linha[7:10],
+                'novos': recalculados
+            })
+    return inicio, fim, len(linhas), diferencas
+
+def faixas_de_ids(inicio, ultimo_id, tamanho):
+    """Faixas [inicio, fim) cobrindo os ids até ultimo_id"""
+    for faixa_inicio in range(inicio, ultimo_id + 1, tamanho):
+        yield faixa_inicio, faixa_inicio + tamanho
+
+def ler_checkpoint(arquivo=ARQUIVO_CHECKPOINT):
+    """Checkpoint salvo (dict) ou None"""
+    if not os.path.exists(arquivo):
+        return None
+    with open(arquivo, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def salvar_checkpoint(estado, arquivo=ARQUIVO_CHECKPOINT):
+    """Grava o checkpoint de forma atômica (arquivo temporário + rename)"""
+    temporario = f"{arquivo}.tmp"
+    with open(temporario, 'w', encoding='utf-8') as f:
+        json.dump(estado, f, indent=2)
+    os.replace(temporario, arquivo)
+
+def gravar_correcoes(conn, diferencas):
+    """Grava as correções de uma faixa numa transação; retorna quantas linhas mudaram"""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        alteradas = 0
+        for diferenca in diferencas:
+            cursor = conn.execute(SQL_CORRIGIR, (*diferenca['novos'], diferenca['id'], *diferenca['batidas']))
+            alteradas += cursor.rowcount
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return alteradas
+
+def recalcular(db_file=DB_FILE, simular=False, retomar=False, processos=None, tamanho_lote=TAMANHO_LOTE,
+               arquivo_checkpoint=ARQUIVO_CHECKPOINT, ao_encontrar=None):
+    """Recalcula registros_ponto em paralelo
+
+    Args:
+        simular: só compara, sem gravar nem mexer no checkpoint
+        retomar: começa do próximo id salvo no checkpoint
+        ao_encontrar: função chamada com cada diferença encontrada (relatório)
+
+    Returns:
+        dict: lidos, diferentes, gravados, funcionarios (ids alterados),
+              faixas, inicio, ultimo_id, retomado e duracao_s
+    """
+    conn = conectar(db_file)
+    try:
+        inicio = conn.execute("SELECT COALESCE(MIN(id), 1) FROM registros_ponto").fetchone()[0]
+        ultimo_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM registros_ponto").fetchone()[0]
+
+        checkpoint = ler_checkpoint(arquivo_checkpoint) if retomar else None
+        if checkpoint and checkpoint.get('jornada') == JORNADA_DIARIA_MINUTOS:
+            inicio = checkpoint['proximo_id']
+        elif checkpoint:
+            print("⚠️  Checkpoint de outra regra de cálculo; recomeçando do início")
+            checkpoint = None
+
+        resultado = {'lidos': 0, 'diferentes': 0, 'gravados': 0, 'funcionarios': set(), 'faixas': 0,
+                     'inicio': inicio, 'ultimo_id': ultimo_id, 'retomado': bool(checkpoint)}
+
+        comeco = time.perf_counter()
+        with multiprocessing.Pool(processos, initializer=_iniciar_processo, initargs=(db_file,)) as pool:
+            # imap devolve as faixas em ordem: o checkpoint só avança sobre faixas já gravadas
+            for _, fim, lidos, diferencas in pool.imap(recalcular_faixa,
+                                                       faixas_de_ids(inicio, ultimo_id, tamanho_lote)):
+                resultado['lidos'] += lidos
+                resultado['diferentes'] += len(diferencas)
+                resultado['faixas'] += 1
+                for diferenca in diferencas:
+                    resultado['funcionarios'].add(diferenca['funcionario_id'])
+                    if ao_encontrar:
+                        ao_encontrar(diferenca)
+
+                if simular:
+                    continue
+                if diferencas:
+                    resultado['gravados'] += gravar_correcoes(conn, diferencas)
+                salvar_checkpoint({
+                    'proximo_id': fim,
+                    'ultimo_id': ultimo_id,
+                    'jornada': JORNADA_DIARIA_MINUTOS,
+                    'atualizado_em': time.strftime('%Y-%m-%d %H:%M:%S')
+                }, arquivo_checkpoint)
+
+        if not simular and os.path.exists(arquivo_checkpoint):
+            os.remove(arquivo_checkpoint)  # recálculo completo
+        resultado['duracao_s'] = time.perf_counter() - comeco
+        return resultado
+    finally:
+        conn.close()
+
+def _opcao(nome, padrao=None):
+    """Valor de uma opção '--nome valor' da linha de comando"""
+    if nome in sys.argv:
+        return sys.argv[sys.argv.index(nome) + 1]
+    return padrao
+
+def _formatar(valores):
+    return ' / '.join(str(v) for v in valores)
+
+def main():
+    """Função principal"""
+    simular = '--simular' in sys.argv
+    retomar = '--retomar' in sys.argv
+    processos = int(_opcao('--processos', os.cpu_count() or 1))
+    tamanho_lote = int(_opcao('--lote', TAMANHO_LOTE))
+    arquivo_diff = _opcao('--diff')
+
+    print("🔄 RECÁLCULO DOS REGISTROS DE PONTO (SQLite)")
+    print("=" * 50)
+    print(f"📌 {'Simulação (nada será gravado)' if simular else 'Gravando correções'} | "
+          f"{processos} processo(s) | faixas de {tamanho_lote} ids")
+    print(f"   Colunas: {_formatar(COLUNAS_DERIVADAS)} (jornada de {JORNADA_DIARIA_MINUTOS} min)")
+
+    aplicar_migracoes(DB_FILE)
+
+    exibidas = []
+    escritor_csv = None
+    arquivo_csv = open(arquivo_diff, 'w', newline='', encoding='utf-8') if arquivo_diff else None
+    if arquivo_csv:
+        escritor_csv = csv.writer(arquivo_csv)
+        escritor_csv.writerow(['id', 'funcionario_id', 'data',
+                               *(f'{c}_antigo' for c in COLUNAS_DERIVADAS),
+                               *(f'{c}_novo' for c in COLUNAS_DERIVADAS)])
+
+    def registrar(diferenca):
+        if len(exibidas) < LIMITE_DIFERENCAS_EXIBIDAS:
+            exibidas.append(diferenca)
+        if escritor_csv:
+            escritor_csv.writerow([diferenca['id'], diferenca['funcionario_id'], diferenca['data'],
+                                   *diferenca['antigos'], *diferenca['novos']])
+
+    try:
+        resultado = recalcular(DB_FILE, simular=simular, retomar=retomar, processos=processos,
+                               tamanho_lote=tamanho_lote, ao_encontrar=registrar)
+    finally:
+        if arquivo_csv:
+            arquivo_csv.close()
+
+    if resultado['retomado']:
+        print(f"⏩ Retomado a partir do id {resultado['inicio']}")
+    for diferenca in exibidas:
+        print(f"   • Registro {diferenca['id']} (funcionário {diferenca['funcionario_id']}, {diferenca['data']}): "
+              f"{_formatar(diferenca['antigos'])} → {_formatar(diferenca['novos'])}")
+    if resultado['diferentes'] > len(exibidas):
+        print(f"   … e mais {resultado['diferentes'] - len(exibidas)} diferença(s)")
+    if arquivo_diff:
+        print(f"📝 Diferenças gravadas em {arquivo_diff}")
+
+    print("-" * 50)
+    print(f"📊 {resultado['lidos']} registro(s) lido(s) em {resultado['faixas']} faixa(s) "
+          f"({resultado['duracao_s']:.2f}s) | {resultado['diferentes']} diferente(s)")
+    if simular:
+        print("ℹ️  Simulação: execute sem --simular para gravar as correções")
+        return
+    print(f"✅ {resultado['gravados']} registro(s) corrigido(s)")
+    if resultado['gravados'] < resultado['diferentes']:
+        print(f"ℹ️  {resultado['diferentes'] - resultado['gravados']} editado(s) no portal durante o "
+              f"recálculo; já gravados com o cálculo atual")
+
+    if resultado['gravados']:
+        # Cache de relatórios do portal (compartilhado quando PORTAL_CACHE_BACKEND=sqlite)
+        import index
+        index.cache_relatorios.invalidar(*(index.tag_funcionario(f) for f in resultado['funcionarios']))
+        if index.CACHE_RELATORIOS_BACKEND == 'memoria':
+            print(f"ℹ️  Cache em memória do portal expira em até {index.CACHE_RELATORIOS_TTL:.0f}s")
+        # A réplica do portal não vê as escritas deste processo
+        print("ℹ️  Se o portal usa PORTAL_REPLICA_MEMORIA=1: execute python replica_memoria.py --ressincronizar")
+        if index.situacao_relatorios_fechados()['sujos']:
+            print("ℹ️  Relatórios de períodos fechados alterados: execute python relatorios_fechados.py")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Relatórios mensais pré-gerados dos períodos de fechamento encerrados
+
+Depois do dia 25 o relatório de um período (26 a 25) só muda se alguém
+mexer num registro antigo ou no cadastro do funcionário. O fechamento gera
+o HTML e o JSON do relatório de cada funcionário e período encerrado e os
+guarda em relatorios_fechados; o portal serve o que está guardado sem
+consultar os registros. Triggers marcam o período como sujo quando um
+registro dele é incluído, editado ou excluído (ou quando o cadastro do
+funcionário muda), e o próximo fechamento gera de novo apenas os sujos.
+Cada relatório guarda a versão do código e dos templates que o gerou
+(versao_paginas); depois de um deploy os de versão antiga também contam
+como sujos. A estrutura é criada pelas migrações 10, 11 e 13 (migracoes.py).
+
+Uso:
+    python relatorios_fechados.py            # gera os pendentes e os sujos
+    python relatorios_fechados.py --status   # só mostra quantos estão prontos/sujos
+"""
+
+import sys
+
+from migracoes import sql_periodo_fechamento
+
+def _periodo(coluna):
+    """Condição SQL que seleciona o período de fechamento de uma coluna de data"""
+    chave = sql_periodo_fechamento(coluna)
+    return (f"periodo_ano = CAST(substr({chave}, 1, 4) AS INTEGER) "
+            f"AND periodo_mes = CAST(substr({chave}, 6, 2) AS INTEGER)")
+
+def _sql_sujar(linha):
+    """Marca como sujo o relatório do período do registro NEW/OLD"""
+    return f"""
+        UPDATE relatorios_fechados SET sujo = 1, versao = versao + 1
+        WHERE funcionario_id = {linha}.funcionario_id AND {_periodo(f'{linha}.data')};
+    """
+
+ESTRUTURA = [
+    """
+    CREATE TABLE IF NOT EXISTS relatorios_fechados (
+        funcionario_id INTEGER NOT NULL,
+        periodo_ano INTEGER NOT NULL,
+        periodo_mes INTEGER NOT NULL,
+        html TEXT,
+        dados TEXT,
+        sujo INTEGER NOT NULL DEFAULT 1,
+        versao INTEGER NOT NULL DEFAULT 0,
+        gerado_em TIMESTAMP,
+        versao_paginas TEXT,
+        PRIMARY KEY (funcionario_id, periodo_ano, periodo_mes),
+        FOREIGN KEY (funcionario_id) REFERENCES funcionarios (id)
+    ) WITHOUT ROWID
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS relatorios_fechados_insert
+    AFTER INSERT ON registros_ponto
+    BEGIN
+        {_sql_sujar('NEW')}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS relatorios_fechados_delete
+    AFTER DELETE ON registros_ponto
+    BEGIN
+        {_sql_sujar('OLD')}
+    END
+    """,
+    # Horários e totais aparecem no relatório: qualquer coluna editada suja o período
+    f"""
+    CREATE TRIGGER IF NOT EXISTS relatorios_fechados_update
+    AFTER UPDATE OF funcionario_id, data, entrada_min, saida_almoco_min, volta_almoco_min,
+                    saida_min, minutos_almoco, minutos_trabalhados, minutos_extras ON registros_ponto
+    BEGIN
+        {_sql_sujar('OLD')}
+        {_sql_sujar('NEW')}
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS relatorios_fechados_funcionario
+    AFTER UPDATE OF nome, cargo, salario_mensal, salario_hora, horas_mensais, desconto ON funcionarios
+    BEGIN
+        UPDATE relatorios_fechados SET sujo = 1, versao = versao + 1
+        WHERE funcionario_id = NEW.id;
+    END
+    """,
+]
+
+def criar_relatorios_fechados(conn):
+    """Cria a tabela e os triggers (idempotente e sem commit)"""
+    for comando in ESTRUTURA:
+        conn.execute(comando)
+
+def main():
+    """Função principal"""
+    print("🗂️  RELATÓRIOS DOS PERÍODOS FECHADOS")
+    print("=" * 50)
+
+    import index
+    index.inicializar_banco()
+
+    if '--status' not in sys.argv:
+        resultado = index.gerar_relatorios_fechados()
+        print(f"✅ {resultado['gerados']} relatório(s) gerado(s) até o período "
+              f"{resultado['ultimo_periodo']}")
+        if resultado['ainda_sujos']:
+            print(f"⚠️  {resultado['ainda_sujos']} alterado(s) durante a geração; "
+                  f"serão gerados na próxima execução")
+        if resultado['gerados']:
+            # A réplica do portal não vê as escritas deste processo
+            print("ℹ️  Se o portal usa PORTAL_REPLICA_MEMORIA=1: execute python replica_memoria.py --ressincronizar")
+
+    situacao = index.situacao_relatorios_fechados()
+    print(f"📌 Prontos: {situacao['prontos']} | Sujos/pendentes: {situacao['sujos']}")
+
+if __name__ == '__main__':
+    main()
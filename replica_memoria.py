@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Réplica em memória do banco SQLite para as leituras do portal
+
+Com PORTAL_REPLICA_MEMORIA=1 o portal copia horas_trabalho.db para um banco
+em memória compartilhado (VFS memdb) e atende a pista de leitura a partir
+dele. O escritor único confirma cada lote no arquivo e repete as mesmas
+escritas na réplica (as de transaction() também, com o escritor pausado);
+se a réplica falhar ela é recarregada do arquivo.
+
+A réplica só enxerga as escritas do próprio processo. Use-a apenas com um
+único processo do portal (o portal recusa PORTAL_CACHE_BACKEND=sqlite, que
+indica vários processos) e, depois de scripts que gravam direto no arquivo
+(recalcular_registros.py, relatorios_fechados.py, banco_horas.py
+--reconstruir), execute --ressincronizar: até lá as páginas mostram os
+dados anteriores.
+
+A verificação compara, tabela por tabela, a contagem de linhas e uma soma
+SHA-256 do conteúdo (colunas de auditoria ficam de fora: CURRENT_TIMESTAMP
+pode virar o segundo entre o arquivo e a réplica).
+
+Uso (com o portal no ar):
+    python replica_memoria.py                      # verifica a consistência
+    python replica_memoria.py --ressincronizar     # recarrega a réplica do arquivo
+    python replica_memoria.py --url http://127.0.0.1:5001
+"""
+
+import hashlib
+import itertools
+import json
+import sqlite3
+import sys
+import threading
+import urllib.request
+
+URL_PADRAO = 'http://127.0.0.1:5001'
+
+# Preenchidas por DEFAULT CURRENT_TIMESTAMP / triggers de updated_at e versoes_dados
+COLUNAS_AUDITORIA = {'created_at', 'updated_at', 'data_criacao', 'aplicada_em', 'alterado_em'}
+
+_geracoes = itertools.count(1)
+
+class ReplicaMemoria:
+    """Cópia em memória do arquivo, mantida pelo escritor único"""
+
+    def __init__(self, db_file, busy_timeout=5):
+        self.db_file = db_file
+        self.busy_timeout = busy_timeout
+        self.uri = None
+        self._ancora = None   # mantém o banco em memória vivo
+        self._escrita = None
+        self._lock = threading.Lock()
+        self.recargas = 0
+        self.escritas_replicadas = 0
+        self.falhas = 0
+        self.carregar()
+
+    def _conectar(self, uri):
+        return sqlite3.connect(uri, uri=True, timeout=self.busy_timeout,
+                               check_same_thread=False, isolation_level=None)
+
+    def carregar(self):
+        """Copia o arquivo para um novo banco em memória e passa a usá-lo
+
+        O cabeçalho de um banco em WAL copiado pela API de backup não abre no
+        VFS memdb; VACUUM INTO grava a cópia já em modo de journal compatível.
+        Cada recarga usa um nome novo, então leitores da geração anterior
+        terminam normalmente.
+        """
+        uri = f'file:/portal-replica-{id(self)}-{next(_geracoes)}?vfs=memdb'
+        ancora = self._conectar(uri)
+        origem = sqlite3.connect(self.db_file, timeout=self.busy_timeout)
+        try:
+            origem.execute("VACUUM INTO ?", (uri,))
+        finally:
+            origem.close()
+        escrita = self._conectar(uri)
+        escrita.execute("PRAGMA foreign_keys = ON")
+
+        with self._lock:
+            anteriores = (self._ancora, self._escrita)
+            self.uri, self._ancora, self._escrita = uri, ancora, escrita
+            self.recargas += 1
+        for conn in anteriores:
+            if conn is not None:
+                conn.close()
+
+    def aplicar(self, escritas):
+        """Repete na réplica, numa transação, as escritas já confirmadas no arquivo
+
+        Cada item é uma função que recebe a conexão. Em caso de erro a réplica
+        é recarregada do arquivo (que já contém o lote).
+        """
+        if not escritas:
+            return
+        conn = self._escrita
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            for escrita in escritas:
+                escrita(conn)
+            conn.execute('COMMIT')
+            self.escritas_replicadas += len(escritas)
+        except Exception:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            self.falhas += 1
+            self.carregar()
+            raise
+
+    def conectar(self):
+        """Conexão avulsa com a geração atual da réplica"""
+        return self._conectar(self.uri)
+
+    def estatisticas(self):
+        """Estado da réplica"""
+        return {
+            'db_file': self.db_file,
+            'uri': self.uri,
+            'recargas': self.recargas,
+            'escritas_replicadas': self.escritas_replicadas,
+            'falhas': self.falhas
+        }
+
+def somas_de_verificacao(conn):
+    """Linhas e soma SHA-256 do conteúdo de cada tabela (sem colunas de auditoria)"""
+    tabelas = [row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name")]
+    somas = {}
+    for tabela in tabelas:
+        colunas = [row[1] for row in conn.execute(f"PRAGMA table_info({tabela})")
+                   if row[1] not in COLUNAS_AUDITORIA]
+        lista = ', '.join(colunas)
+        ordem = ', '.join(str(i) for i in range(1, len(colunas) + 1))
+        soma = hashlib.sha256()
+        linhas = 0
+        for row in conn.execute(f"SELECT {lista} FROM {tabela} ORDER BY {ordem}"):
+            soma.update(repr(tuple(row)).encode('utf-8'))
+            linhas += 1
+        somas[tabela] = {'linhas': linhas, 'soma': soma.hexdigest()}
+    return somas
+
+def comparar(conn_arquivo, conn_replica):
+    """Compara arquivo e réplica; retorna (consistente, detalhes por tabela)"""
+    arquivo = somas_de_verificacao(conn_arquivo)
+    replica = somas_de_verificacao(conn_replica)
+    tabelas = []
+    for tabela in sorted(set(arquivo) | set(replica)):
+        tabelas.append({
+            'tabela': tabela,
+            'arquivo': arquivo.get(tabela),
+            'replica': replica.get(tabela),
+            'consistente': arquivo.get(tabela) == replica.get(tabela)
+        })
+    return all(t['consistente'] for t in tabelas), tabelas
+
+def _chamar(url, metodo='GET'):
+    requisicao = urllib.request.Request(url, method=metodo)
+    with urllib.request.urlopen(requisicao, timeout=60) as resposta:
+        return json.loads(resposta.read().decode('utf-8'))
+
+def main():
+    """Função principal"""
+    print("🧠 RÉPLICA EM MEMÓRIA")
+    print("=" * 50)
+
+    url = URL_PADRAO
+    if '--url' in sys.argv:
+        url = sys.argv[sys.argv.index('--url') + 1]
+    url = url.rstrip('/')
+
+    try:
+        if '--ressincronizar' in sys.argv:
+            _chamar(f'{url}/api/replica/ressincronizar', 'POST')
+            print("✅ Réplica recarregada a partir do arquivo")
+        resultado = _chamar(f'{url}/api/replica/verificar')
+    except OSError as e:
+        print(f"❌ Portal não respondeu em {url}: {e}")
+        sys.exit(2)
+
+    if not resultado['ativa']:
+        print("ℹ️  Réplica desativada (inicie o portal com PORTAL_REPLICA_MEMORIA=1)")
+        return
+
+    for tabela in resultado['tabelas']:
+        arquivo = tabela['arquivo'] or {'linhas': '-'}
+        replica = tabela['replica'] or {'linhas': '-'}
+        icone = '✅' if tabela['consistente'] else '❌'
+        print(f"   {icone} {tabela['tabela']}: arquivo {arquivo['linhas']} | réplica {replica['linhas']}")
+
+    if not resultado['consistente']:
+        print("⚠️  Réplica divergente. Execute: python replica_memoria.py --ressincronizar")
+        sys.exit(1)
+    print("✅ Réplica consistente com o arquivo")
+
+if __name__ == '__main__':
+    main()
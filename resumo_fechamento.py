@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Resumo materializado por funcionário e período de fechamento (26 a 25)
+
+A tabela resumo_fechamento é mantida pelos triggers de registros_ponto
+(inserir/editar/excluir ajusta apenas a linha do período afetado) e pelo
+trigger de salário em funcionarios. As durações são somadas em minutos
+inteiros (somas exatas); só os valores em reais são fracionários. A
+estrutura é criada pelas migrações 7 e 11 (migracoes.py); este script
+verifica ou reconstrói o resumo a partir dos registros brutos.
+
+Uso:
+    python resumo_fechamento.py              # verifica
+    python resumo_fechamento.py --reconstruir
+"""
+
+import sqlite3
+import sys
+
+from calculo_ponto import JORNADA_DIARIA_MINUTOS
+from migracoes import aplicar_migracoes, sql_periodo_fechamento
+
+DB_FILE = 'horas_trabalho.db'
+
+ADICIONAL_EXTRAS = 1.5    # 50% sobre a hora normal
+TOLERANCIA = 1e-6         # só para os valores em reais
+
+def _periodo(coluna):
+    """Expressões (ano, mes) do período de fechamento de uma coluna de data"""
+    chave = sql_periodo_fechamento(coluna)
+    return (f"CAST(substr({chave}, 1, 4) AS INTEGER)",
+            f"CAST(substr({chave}, 6, 2) AS INTEGER)")
+
+def _salario_hora(funcionario_id):
+    return f"(SELECT salario_hora FROM funcionarios WHERE id = {funcionario_id})"
+
+def _valor(minutos, salario, fator=1):
+    """Expressão SQL do valor em reais de uma soma de minutos"""
+    multiplicador = f" * {fator}" if fator != 1 else ""
+    return f"({minutos}) * {salario}{multiplicador} / 60.0"
+
+def _sql_somar(linha):
+    """Upsert que soma o registro NEW/OLD ao período correspondente"""
+    ano, mes = _periodo(f"{linha}.data")
+    salario = _salario_hora('excluded.funcionario_id')
+    normais = f"MIN({linha}.minutos_trabalhados, {JORNADA_DIARIA_MINUTOS})"
+    return f"""
+        INSERT INTO resumo_fechamento
+            (funcionario_id, periodo_ano, periodo_mes, total_minutos, minutos_extras,
+             minutos_normais, dias_trabalhados, valor_horas_normais, valor_horas_extras)
+        VALUES ({linha}.funcionario_id, {ano}, {mes}, {linha}.minutos_trabalhados, {linha}.minutos_extras,
+                {normais}, 1,
+                {_valor(normais, _salario_hora(f'{linha}.funcionario_id'))},
+                {_valor(f'{linha}.minutos_extras', _salario_hora(f'{linha}.funcionario_id'), ADICIONAL_EXTRAS)})
+        ON CONFLICT (funcionario_id, periodo_ano, periodo_mes) DO UPDATE SET
+            total_minutos = total_minutos + excluded.total_minutos,
+            minutos_extras = minutos_extras + excluded.minutos_extras,
+            minutos_normais = minutos_normais + excluded.minutos_normais,
+            dias_trabalhados = dias_trabalhados + 1,
+            valor_horas_normais = {_valor('minutos_normais + excluded.minutos_normais', salario)},
+            valor_horas_extras = {_valor('minutos_extras + excluded.minutos_extras', salario, ADICIONAL_EXTRAS)},
+            updated_at = CURRENT_TIMESTAMP;
+    """
+
+def _sql_subtrair(linha):
+    """Remove o registro OLD do período correspondente (e apaga a linha se zerar)"""
+    ano, mes = _periodo(f"{linha}.data")
+    salario = _salario_hora(f'{linha}.funcionario_id')
+    normais = f"MIN({linha}.minutos_trabalhados, {JORNADA_DIARIA_MINUTOS})"
+    chave = f"funcionario_id = {linha}.funcionario_id AND periodo_ano = {ano} AND periodo_mes = {mes}"
+    return f"""
+        UPDATE resumo_fechamento SET
+            total_minutos = total_minutos - {linha}.minutos_trabalhados,
+            minutos_extras = minutos_extras - {linha}.minutos_extras,
+            minutos_normais = minutos_normais - {normais},
+            dias_trabalhados = dias_trabalhados - 1,
+            valor_horas_normais = {_valor(f'minutos_normais - {normais}', salario)},
+            valor_horas_extras = {_valor(f'minutos_extras - {linha}.minutos_extras', salario, ADICIONAL_EXTRAS)},
+            updated_at = CURRENT_TIMESTAMP
+        WHERE {chave};
+        DELETE FROM resumo_fechamento WHERE {chave} AND dias_trabalhados <= 0;
+    """
+
+ESTRUTURA = [
+    """
+    CREATE TABLE IF NOT EXISTS resumo_fechamento (
+        funcionario_id INTEGER NOT NULL,
+        periodo_ano INTEGER NOT NULL,
+        periodo_mes INTEGER NOT NULL,
+        total_minutos INTEGER NOT NULL DEFAULT 0,
+        minutos_extras INTEGER NOT NULL DEFAULT 0,
+        minutos_normais INTEGER NOT NULL DEFAULT 0,
+        dias_trabalhados INTEGER NOT NULL DEFAULT 0,
+        valor_horas_normais REAL NOT NULL DEFAULT 0,
+        valor_horas_extras REAL NOT NULL DEFAULT 0,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (funcionario_id, periodo_ano, periodo_mes),
+        FOREIGN KEY (funcionario_id) REFERENCES funcionarios (id)
+    ) WITHOUT ROWID
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS resumo_fechamento_insert
+    AFTER INSERT ON registros_ponto
+    BEGIN
+        {_sql_somar('NEW')}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS resumo_fechamento_delete
+    AFTER DELETE ON registros_ponto
+    BEGIN
+        {_sql_subtrair('OLD')}
+    END
+    """,
+    # Só dispara quando muda algo que afeta o resumo (não no trigger de updated_at)
+    f"""
+    CREATE TRIGGER IF NOT EXISTS resumo_fechamento_update
+    AFTER UPDATE OF funcionario_id, data, minutos_trabalhados, minutos_extras ON registros_ponto
+    BEGIN
+        {_sql_subtrair('OLD')}
+        {_sql_somar('NEW')}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS resumo_fechamento_salario
+    AFTER UPDATE OF salario_hora ON funcionarios
+    BEGIN
+        UPDATE resumo_fechamento SET
+            valor_horas_normais = {_valor('minutos_normais', 'NEW.salario_hora')},
+            valor_horas_extras = {_valor('minutos_extras', 'NEW.salario_hora', ADICIONAL_EXTRAS)}
+        WHERE funcionario_id = NEW.id;
+    END
+    """,
+]
+
+# Agregação completa a partir dos registros brutos (usada para reconstruir/verificar)
+_ANO, _MES = _periodo('r.data')
+_NORMAIS = f"SUM(MIN(r.minutos_trabalhados, {JORNADA_DIARIA_MINUTOS}))"
+SQL_AGREGAR = f"""
+    SELECT r.funcionario_id,
+           {_ANO} AS periodo_ano,
+           {_MES} AS periodo_mes,
+           SUM(r.minutos_trabalhados) AS total_minutos,
+           SUM(r.minutos_extras) AS minutos_extras,
+           {_NORMAIS} AS minutos_normais,
+           COUNT(*) AS dias_trabalhados,
+           {_valor(_NORMAIS, 'f.salario_hora')} AS valor_horas_normais,
+           {_valor('SUM(r.minutos_extras)', 'f.salario_hora', ADICIONAL_EXTRAS)} AS valor_horas_extras
+    FROM registros_ponto r
+    JOIN funcionarios f ON f.id = r.funcionario_id
+    GROUP BY r.funcionario_id, periodo_ano, periodo_mes
+"""
+
+COLUNAS_VALORES = ('total_minutos', 'minutos_extras', 'minutos_normais', 'dias_trabalhados',
+                   'valor_horas_normais', 'valor_horas_extras')
+
+def criar_resumo_fechamento(conn):
+    """Cria a tabela e os triggers; preenche o resumo se ele estiver vazio
+
+    Idempotente e sem commit (roda dentro da transação de quem chama).
+    Retorna o número de linhas do resumo.
+    """
+    for comando in ESTRUTURA:
+        conn.execute(comando)
+    total = conn.execute("SELECT COUNT(*) FROM resumo_fechamento").fetchone()[0]
+    if total == 0:
+        total = reconstruir_resumo(conn)
+    return total
+
+def reconstruir_resumo(conn):
+    """Recalcula todo o resumo a partir de registros_ponto; retorna as linhas gravadas (sem commit)"""
+    conn.execute("DELETE FROM resumo_fechamento")
+    cursor = conn.execute(f"""
+        INSERT INTO resumo_fechamento
+            (funcionario_id, periodo_ano, periodo_mes, {', '.join(COLUNAS_VALORES)})
+        {SQL_AGREGAR}
+    """)
+    return cursor.rowcount
+
+def verificar_resumo(conn):
+    """Compara o resumo com os registros brutos e retorna a lista de divergências"""
+    conn.row_factory = sqlite3.Row
+    esperado = {
+        (row['funcionario_id'], row['periodo_ano'], row['periodo_mes']): row
+        for row in conn.execute(SQL_AGREGAR)
+    }
+    atual = {
+        (row['funcionario_id'], row['periodo_ano'], row['periodo_mes']): row
+        for row in conn.execute("SELECT * FROM resumo_fechamento")
+    }
+
+    divergencias = []
+    for chave in sorted(set(esperado) | set(atual)):
+        linha_esperada = esperado.get(chave)
+        linha_atual = atual.get(chave)
+        if linha_esperada is None or linha_atual is None:
+            divergencias.append({'chave': chave, 'coluna': '(linha)',
+                                 'esperado': linha_esperada is not None,
+                                 'atual': linha_atual is not None})
+            continue
+        for coluna in COLUNAS_VALORES:
+            valor_esperado = linha_esperada[coluna] or 0
+            valor_atual = linha_atual[coluna] or 0
+            if abs(valor_esperado - valor_atual) > TOLERANCIA:
+                divergencias.append({'chave': chave, 'coluna': coluna,
+                                     'esperado': valor_esperado, 'atual': valor_atual})
+    return divergencias
+
+def main():
+    """Função principal"""
+    print("📊 RESUMO POR PERÍODO DE FECHAMENTO")
+    print("=" * 50)
+
+    aplicar_migracoes(DB_FILE)
+
+    conn = sqlite3.connect(DB_FILE)
+    try:
+        if '--reconstruir' in sys.argv:
+            linhas = reconstruir_resumo(conn)
+            conn.commit()
+            print(f"✅ Resumo reconstruído: {linhas} períodos")
+
+        divergencias = verificar_resumo(conn)
+    finally:
+        conn.close()
+
+    if divergencias:
+        print(f"⚠️  {len(divergencias)} divergências encontradas:")
+        for d in divergencias:
+            funcionario_id, ano, mes = d['chave']
+            print(f"   • Funcionário {funcionario_id} - {mes:02d}/{ano} - {d['coluna']}: "
+                  f"esperado {d['esperado']} | atual {d['atual']}")
+        print("   Execute: python resumo_fechamento.py --reconstruir")
+        sys.exit(1)
+
+    print("✅ Resumo consistente com os registros de ponto")
+
+if __name__ == '__main__':
+    main()
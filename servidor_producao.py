@@ -71,7 +71,10 @@ def iniciar_servidor_producao():
     
     try:
         # Usar Flask nativo (adequado para uso doméstico)
-        from index import app
+        from index import app, inicializar_banco
+        
+        # Aplicar atualizações de esquema pendentes
+        inicializar_banco()
         
         # Configurar aplicação para produção
         app.config['ENV'] = 'production'
@@ -49,7 +49,7 @@ def verificar_banco():
         
         # Registros recentes
         cursor.execute("""
-            SELECT r.data, f.nome, r.horas_trabalhadas, r.horas_extras
+            SELECT r.data, f.nome, r.minutos_trabalhados, r.minutos_extras
             FROM registros_ponto r
             JOIN funcionarios f ON r.funcionario_id = f.id
             ORDER BY r.data DESC
@@ -59,18 +59,16 @@ def verificar_banco():
         
         print("   📋 Registros recentes:")
         for row in registros:
-            horas_extras = row[3]
-            horas = int(horas_extras)
-            minutos = int((horas_extras - horas) * 60)
-            extras_formatado = f"{horas}h {minutos}min" if horas_extras > 0 else "0h"
+            horas, minutos = divmod(row[3], 60)
+            extras_formatado = f"{horas}h {minutos}min" if row[3] > 0 else "0h"
             
-            print(f"   • {row[0]} | {row[1]} | {row[2]:.2f}h (extras: {extras_formatado})")
+            print(f"   • {row[0]} | {row[1]} | {row[2] / 60:.2f}h (extras: {extras_formatado})")
         
         # Estatísticas gerais
         cursor.execute("""
             SELECT 
-                SUM(horas_trabalhadas) as total_horas,
-                SUM(horas_extras) as total_extras,
+                TOTAL(minutos_trabalhados) / 60 as total_horas,
+                TOTAL(minutos_extras) / 60 as total_extras,
                 COUNT(*) as total_dias
             FROM registros_ponto
         """)
@@ -81,8 +79,7 @@ def verificar_banco():
         print(f"   Total horas trabalhadas: {stats[0]:.2f}h")
         
         if stats[1] > 0:
-            horas = int(stats[1])
-            minutos = int((stats[1] - horas) * 60)
+            horas, minutos = divmod(round(stats[1] * 60), 60)
             print(f"   Total horas extras: {horas}h {minutos}min")
         else:
             print(f"   Total horas extras: 0h")